@@ -1,8 +1,9 @@
-from typing import Any, Dict, Iterator, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
 
 from pandas import DataFrame
 
 from src.core.util.behaviors import BehaviorManager
+from src.core.util.predicates import Predicate
 
 
 class DataReader:
@@ -45,6 +46,34 @@ class DataReader:
         """
         raise NotImplementedError()
 
+    def push_columns(self, columns: Set[str]) -> bool:
+        """Limita la lettura alle colonne utilizzate dal transformer.
+        Le colonne che non esistono nella sorgente vengono ignorate.
+        Le classi eredi che possono evitare di leggere le altre colonne
+        lo ridefiniscono
+
+        Args:
+            columns (Set[str]): colonne utilizzate dal transformer
+
+        Returns:
+            bool: True se il reader legge soltanto le colonne indicate
+        """
+        return False
+
+    def push_filters(self, predicates: List[Predicate]) -> List[Predicate]:
+        """Filtra in lettura le righe che non soddisfano i predicati.
+        Il filtro originale resta applicato dal transformer, per cui
+        il reader puo' applicarne anche solo una parte. Le classi eredi
+        che supportano i filtri lo ridefiniscono
+
+        Args:
+            predicates (List[Predicate]): predicati in congiunzione
+
+        Returns:
+            List[Predicate]: predicati che il reader applica in lettura
+        """
+        return []
+
 
 class DataWriter:
     """Base class per tutti gli oggetti deputati alla sola scrittura
@@ -83,6 +112,18 @@ class DataWriter:
         """
         raise NotImplementedError()
 
+    def begin(self) -> None:
+        """Chiamato dal task all'inizio di ogni esecuzione, prima del primo
+        write. Le classi eredi che mantengono uno stato tra i write della
+        stessa esecuzione lo ridefiniscono per azzerarlo
+        """
+
+    def release(self) -> None:
+        """Rilascia i dati che il writer mantiene disponibili oltre la fine
+        del task (ad esempio le viste di un catalogo). Chiamato dal dag al
+        termine della sua esecuzione; di default non fa nulla
+        """
+
 
 class DataReaderDecorator(DataReader):
     def __init__(
@@ -97,6 +138,17 @@ class DataReaderDecorator(DataReader):
         super(DataReaderDecorator, self).__init__(behaviors = behaviors)
         self.wrapped_reader = wrapped_reader
 
+    def push_columns(self, columns: Set[str]) -> bool:
+        if self.bh_manager is not None:
+            columns = self.bh_manager.plan.input_columns(columns)
+        return self.wrapped_reader.push_columns(columns)
+
+    def push_filters(self, predicates: List[Predicate]) -> List[Predicate]:
+        # i behavior del decorator possono unire righe di sorgenti diverse
+        if self.bh_manager is not None:
+            return []
+        return self.wrapped_reader.push_filters(predicates)
+
 
 class DataWriterDecorator(DataWriter):
     def __init__(
@@ -110,4 +162,9 @@ class DataWriterDecorator(DataWriter):
         ):
         super(DataWriterDecorator, self).__init__(behaviors=behaviors)
         self.wrapped_writer = wrapped_writer
-    
\ No newline at end of file
+
+    def begin(self) -> None:
+        self.wrapped_writer.begin()
+
+    def release(self) -> None:
+        self.wrapped_writer.release()
@@ -1,10 +1,30 @@
-from typing import List, Optional, Union
+import logging
+from enum import Enum
+from typing import Iterator, List, Optional, Set, Union
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 from pandas import DataFrame
+from src.core.util.behaviors import (
+    ARROW_JOIN_TYPES,
+    Engine,
+    MergeStep,
+    arrow_supported,
+    as_arrow,
+    as_pandas,
+)
 from src.core.util.factory import Factory
+from src.core.util.frames import arrow_safe, concat_tables
 
 from .base import DataReader, DataWriter
 
+logger = logging.getLogger(__name__)
+
+# posizione delle righe nella join di Arrow, per conservarne l'ordine
+LEFT_ROW = "__left_row__"
+RIGHT_ROW = "__right_row__"
+
 
 class MultipleSourceReader(DataReader):
     """Class per la lettura di dataframe
@@ -15,40 +35,119 @@ class MultipleSourceReader(DataReader):
     Attributes:
         readers (List[DataReader]): Lista di DataReader
         bh_manager (BehaviorManager): BehaviorManager
+        mode (MultipleSourceReader.Mode): modalita di lettura
+        source_column (str, optional): colonna con la posizione del reader
+            da cui proviene ogni batch, in modalita STREAM
 
     """
 
+    class Mode(Enum):
+        """Modalita di lettura"""
+
+        # legge tutte le sorgenti e poi applica i behavior
+        REDUCE = "reduce"
+        # converte ogni dataframe in Arrow man mano che viene letto (con
+        # engine arrow) e li concatena una sola volta al termine,
+        # richiede una concat di tutti i dataframe
+        INCREMENTAL = "incremental"
+        # restituisce i batch delle sorgenti senza produrre un unico dataframe.
+        # Con una merge, la sorgente right viene letta per intero e indicizzata,
+        # quella left viene unita un batch alla volta
+        STREAM = "stream"
+
     def __init__(
-        self, *, readers: List[dict], behaviors: Union[dict, List[dict]]
+        self,
+        *,
+        readers: List[dict],
+        behaviors: Optional[Union[dict, List[dict]]] = None,
+        mode: str = "reduce",
+        source_column: Optional[str] = None,
     ) -> None:
         """Costruttore
 
         Args:
             readers (List[dict]): Lista di dizionari contenente le istruzioni per istanziare i vari DataReader
-            behaviors (Union[dict, List[dict]]): Dizionario, o lista di dizionari contenenti le istruzioni per istanziare i vari Behavior
+            behaviors (Optional[Union[dict, List[dict]]], optional): Dizionario, o lista di dizionari contenenti le istruzioni per istanziare i vari Behavior.
+                In modalita STREAM gli indici di una merge si riferiscono ai reader
+            mode (str, optional): reduce, incremental o stream. Defaults to "reduce".
+            source_column (Optional[str], optional): in modalita STREAM, colonna
+                aggiunta ad ogni batch con la posizione del reader. Defaults to None.
         """
         super(MultipleSourceReader, self).__init__(behaviors=behaviors)
         factory = Factory()
         self.readers: List[DataReader] = []
         for reader in readers:
             self.readers.append(factory.create(reader))
+        self.mode = MultipleSourceReader.Mode(mode)
+        self.source_column = source_column
 
         # Controllo che ci sia almeno un data reader nella lista e che nel caso in cui
         # venga specificato piu di un data reader il behavior manager sia istanziato per restituire un singolo data frame
         assert (
             self.readers is not None and len(self.readers) > 0
         ), "You must provide at least one DataReader"
-        if len(self.readers) > 0:
+        self.merge: Optional[MergeStep] = None
+        if self.mode is MultipleSourceReader.Mode.STREAM:
+            self.merge = self.stream_merge()
+        else:
             assert (
                 self.bh_manager is not None
             ), "You must provide a BehaviorManager"
+        if self.mode is MultipleSourceReader.Mode.INCREMENTAL:
+            assert (
+                self.bh_manager.plan.foldable
+            ), "Incremental mode requires a concat of all the dataframes"
+
+    def stream_merge(self) -> Optional[MergeStep]:
+        """Verifica i behavior della modalita STREAM: nessun behavior,
+        una concat di tutti i batch oppure una merge tra due reader
+
+        Returns:
+            Optional[MergeStep]: merge da eseguire, None per una concat
+        """
+        if self.bh_manager is None or self.bh_manager.plan.foldable:
+            return None
+        steps = self.bh_manager.plan.steps
+        assert len(steps) == 1 and isinstance(
+            steps[0], MergeStep
+        ), "Stream mode supports a concat or a single merge"
+        merge = steps[0]
+        assert len(self.readers) == 2, "Stream merge requires two readers"
+        left, right = merge.inputs(len(self.readers))
+        assert left != right, "Stream merge requires two distinct readers"
+        assert merge.kwargs.get("how", "inner") in (
+            "inner",
+            "left",
+        ), "Stream merge supports inner and left joins"
+        assert "on" in merge.kwargs and set(merge.kwargs) <= {
+            "on",
+            "how",
+            "suffixes",
+        }, "Stream merge supports only the on, how and suffixes arguments"
+        self.merge_readers = (left, right)
+        return merge
 
-    def read(self):
+    def push_columns(self, columns: Set[str]) -> bool:
+        if self.bh_manager is not None:
+            columns = self.bh_manager.plan.input_columns(columns)
+        pushed = [reader.push_columns(columns) for reader in self.readers]
+        return all(pushed)
+
+    def read(self) -> Iterator[DataFrame]:
         """Legge dalle varie sorgenti
 
         Yields:
             DataFrame : dataframe risultato della lettura dei vari data reader
         """
+        if self.mode is MultipleSourceReader.Mode.INCREMENTAL:
+            yield from self.read_incremental()
+            return
+        if self.mode is MultipleSourceReader.Mode.STREAM:
+            if self.merge is None:
+                yield from self.read_stream()
+            else:
+                yield from self.read_stream_merge()
+            return
         dfs = []
         for reader in self.readers:
             for df in reader.read():
@@ -59,6 +158,96 @@ class MultipleSourceReader(DataReader):
         assert len(dfs) == 1, "Reduce must return a single dataframe"
         yield dfs.pop(0)
 
+    def read_incremental(self) -> Iterator[DataFrame]:
+        """Raccoglie i dataframe letti e li concatena una sola volta.
+        Con engine arrow ogni batch viene convertito appena letto e diventa
+        un chunk della tabella finale, per cui i dataframe pandas non restano
+        in memoria. Con engine pandas l'occupazione e' quella di reduce"""
+        step = self.bh_manager.plan.steps[0]
+        chunks = []
+        for reader in self.readers:
+            for df in reader.read():
+                if step.engine is Engine.ARROW and arrow_safe(df):
+                    df = as_arrow(df)
+                chunks.append(df)
+        assert chunks, "No dataframe has been read"
+        result = chunks[0] if len(chunks) == 1 else step.run(chunks)
+        del chunks
+        yield as_pandas(result)
+
+    def read_stream(self) -> Iterator[DataFrame]:
+        """Restituisce i batch di ogni reader, nell'ordine dei reader"""
+        for pos, reader in enumerate(self.readers):
+            for df in reader.read():
+                if self.source_column is not None:
+                    df = df.assign(**{self.source_column: pos})
+                yield df
+
+    def read_stream_merge(self) -> Iterator[DataFrame]:
+        """Hash join tra i due reader: la sorgente right viene letta per
+        intero e indicizzata una sola volta sulle colonne di join, i batch
+        della sorgente left vengono uniti man mano che vengono letti"""
+        merge = self.merge
+        left, right = self.merge_readers
+        on = merge.kwargs["on"]
+        how = merge.kwargs.get("how", "inner")
+        suffixes = merge.kwargs.get("suffixes", ("_x", "_y"))
+        right_dfs = list(self.readers[right].read())
+        # le colonne annidate non sono supportate dalla join di Arrow
+        arrow = merge.engine is Engine.ARROW and arrow_supported(
+            right_dfs, join=True
+        )
+        if not right_dfs:
+            # schema della sorgente right non noto: le sole colonne di join
+            logger.warning("Stream merge: the right reader is empty")
+            right_dfs = [
+                pd.DataFrame(columns=[on] if isinstance(on, str) else on)
+            ]
+            arrow = False
+        if arrow:
+            try:
+                build = concat_tables([as_arrow(df) for df in right_dfs])
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                logger.debug(f"Arrow concat failed ({e}), using pandas")
+                arrow = False
+        if arrow:
+            build = build.append_column(
+                RIGHT_ROW, pa.array(np.arange(build.num_rows))
+            )
+        else:
+            build = pd.concat(
+                [as_pandas(df) for df in right_dfs], ignore_index=True
+            ).set_index(on)
+        del right_dfs
+        for df in self.readers[left].read():
+            if arrow and not arrow_supported([df], join=True):
+                logger.debug("Nested columns in arrow merge, using pandas")
+                arrow = False
+                build = build.drop([RIGHT_ROW]).to_pandas().set_index(on)
+            if arrow:
+                table = as_arrow(df)
+                table = table.append_column(
+                    LEFT_ROW, pa.array(np.arange(table.num_rows))
+                )
+                # la join di Arrow non conserva l'ordine delle righe:
+                # lo ripristino come in pd.merge
+                joined = table.join(
+                    build,
+                    keys=on,
+                    join_type=ARROW_JOIN_TYPES[how],
+                    left_suffix=suffixes[0],
+                    right_suffix=suffixes[1],
+                ).sort_by([(LEFT_ROW, "ascending"), (RIGHT_ROW, "ascending")])
+                yield as_pandas(joined.drop([LEFT_ROW, RIGHT_ROW]))
+            else:
+                yield as_pandas(df).join(
+                    build,
+                    on=on,
+                    how=how,
+                    lsuffix=suffixes[0],
+                    rsuffix=suffixes[1],
+                ).reset_index(drop=True)
+
 
 class MultipleSinksWriter(DataWriter):
     """DataWriter per la scrittura su sink differenti.
@@ -75,7 +264,7 @@ class MultipleSinksWriter(DataWriter):
         self,
         *,
         writers: List[dict],
-        behaviors: Optional[Union[dict, List[dict]]] = None
+        behaviors: Optional[Union[dict, List[dict]]] = None,
     ) -> None:
         """Costruttore
 
@@ -108,3 +297,11 @@ class MultipleSinksWriter(DataWriter):
             _ = [w.write(data=data[i]) for i, w in enumerate(self.writers)]
         else:
             _ = [w.write(data=data) for w in self.writers]
+
+    def begin(self) -> None:
+        for writer in self.writers:
+            writer.begin()
+
+    def release(self) -> None:
+        for writer in self.writers:
+            writer.release()
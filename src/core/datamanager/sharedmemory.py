@@ -1,37 +1,638 @@
+import contextlib
+import fcntl
 import itertools
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 from dataclasses import dataclass, field
-from typing import Dict, Iterator, List, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
+import pyarrow as pa
 from pandas import DataFrame
 from src.core.datamanager.base import DataReader, DataWriter
+from src.core.util.frames import arrow_safe
 from src.core.util.singleton import SingletonType
 
+logger = logging.getLogger(__name__)
+
+# variabili d'ambiente con cui i processi figli ereditano il backend
+BACKEND_ENV = "SHARED_MEMORY_BACKEND"
+DIRECTORY_ENV = "SHARED_MEMORY_DIR"
+BUDGET_ENV = "SHARED_MEMORY_BUDGET"
+SPILL_DIR_ENV = "SHARED_MEMORY_SPILL_DIR"
+ENVIRONMENT = (BACKEND_ENV, DIRECTORY_ENV, BUDGET_ENV, SPILL_DIR_ENV)
+# tmpfs su linux: i file risiedono in memoria
+SHM_DIR = "/dev/shm"
+SIZE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 2**10,
+    "MB": 2**20,
+    "GB": 2**30,
+    "TB": 2**40,
+}
+
+
+def default_directory() -> str:
+    base = SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+    return os.path.join(base, f"trending-github-{os.getuid()}")
+
+
+def default_spill_directory() -> str:
+    return os.path.join(
+        tempfile.gettempdir(), f"trending-github-spill-{os.getuid()}"
+    )
+
+
+def parse_size(size: Optional[Union[int, str]]) -> Optional[int]:
+    """Converte una dimensione (es. 512MB, 2GB) in byte"""
+    if size is None or isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def write_frame(directory: str, key: str, df: DataFrame) -> str:
+    """Scrive un dataframe come file Arrow IPC in un nuovo file di directory.
+    I dataframe con colonne annidate (liste, dizionari) o non rappresentabili
+    in Arrow vengono salvati con pickle, per essere riletti identici
+
+    Args:
+        directory (str): directory del file
+        key (str): variabile a cui appartiene il dataframe
+        df (DataFrame): dataframe da scrivere
+
+    Returns:
+        str: nome del file
+    """
+    name = f"{key}-{uuid.uuid4().hex}"
+    try:
+        # Arrow convertirebbe le liste in ndarray e i dizionari in struct
+        table = pa.Table.from_pandas(df) if arrow_safe(df) else None
+    except (pa.ArrowException, ValueError, TypeError):
+        table = None
+    if table is None:
+        name += ".pickle"
+        with open(os.path.join(directory, name), "wb") as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return name
+    name += ".arrow"
+    with pa.OSFile(os.path.join(directory, name), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return name
+
+
+def open_frame(path: str) -> Union[pa.Table, DataFrame]:
+    """Apre un file scritto da write_frame. I file Arrow vengono mappati
+    in memoria senza copiarli in una tabella, che resta valida anche se il
+    file viene rimosso. La conversione in dataframe (to_pandas) copia
+    le colonne"""
+    if path.endswith(".pickle"):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def to_pandas(frame: Union[pa.Table, DataFrame]) -> DataFrame:
+    return frame.to_pandas() if isinstance(frame, pa.Table) else frame
+
+
+def new_spill_stats() -> Dict[str, int]:
+    return {"spills": 0, "spilled_bytes": 0, "reloads": 0, "reloaded_bytes": 0}
+
+
+@dataclass
+class ArrowStore:
+    """Archivio di dataframe condiviso tra i processi dello stesso host.
+    Ogni variabile e' salvata come file Arrow IPC in directory (di default
+    in /dev/shm): i lettori mappano il file in memoria e ne ricevono una
+    copia come dataframe, senza serializzazione pickle.
+    Il registro dei nomi e' un file json protetto da un lock sul file system.
+    I dataframe con colonne annidate o non rappresentabili in Arrow
+    vengono salvati con pickle.
+    Oltre il budget le variabili usate meno di recente vengono spostate
+    in spill_dir, su disco
+
+    Attributes:
+        directory (str): directory dei file e del registro
+        budget (int, optional): byte massimi in directory, None senza limite
+        spill_dir (str): directory su disco delle variabili in eccesso
+        spill_stats (Dict[str, int]): spill e reload eseguiti da questo processo
+    """
+
+    directory: str = field(default_factory=default_directory)
+    budget: Optional[int] = None
+    spill_dir: str = field(default_factory=default_spill_directory)
+    spill_stats: Dict[str, int] = field(default_factory=new_spill_stats)
+
+    def __post_init__(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.registry_path = os.path.join(self.directory, "registry.json")
+        self.lock_path = os.path.join(self.directory, "registry.lock")
+        self.refs_path = os.path.join(self.directory, "refs.json")
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Lock esclusivo sul registro, valido tra thread e processi"""
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load_registry(self) -> Dict[str, dict]:
+        try:
+            with open(self.registry_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_registry(
+        self, registry: Dict[str, dict], path: Optional[str] = None
+    ) -> None:
+        path = self.registry_path if path is None else path
+        tmp = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp, "w") as f:
+            json.dump(registry, f)
+        os.replace(tmp, path)
+
+    def load_refs(self) -> Dict[str, int]:
+        try:
+            with open(self.refs_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def set_consumers(self, consumers: Dict[str, int]) -> None:
+        with self.lock():
+            refs = self.load_refs()
+            refs.update(consumers)
+            self.save_registry(refs, self.refs_path)
+
+    def clear_consumers(self, keys: Iterable[str]) -> None:
+        with self.lock():
+            refs = self.load_refs()
+            for k in keys:
+                refs.pop(k, None)
+            self.save_registry(refs, self.refs_path)
+
+    def release(self, key: str) -> bool:
+        with self.lock():
+            refs = self.load_refs()
+            if key not in refs:
+                return False
+            refs[key] -= 1
+            entry = None
+            if refs[key] <= 0:
+                del refs[key]
+                registry = self.load_registry()
+                entry = registry.pop(key, None)
+                self.save_registry(registry)
+            self.save_registry(refs, self.refs_path)
+        if entry is not None:
+            self.unlink(entry)
+        return True
+
+    def path(self, entry: dict, name: str) -> str:
+        directory = self.spill_dir if entry.get("spilled") else self.directory
+        return os.path.join(directory, name)
+
+    def __setitem__(
+        self, key: str, data: Union[DataFrame, List[DataFrame]]
+    ) -> None:
+        frames = data if isinstance(data, list) else [data]
+        # i file vengono scritti fuori dal lock, il registro e' aggiornato
+        # atomicamente: i lettori vedono la versione precedente o quella nuova
+        files = [write_frame(self.directory, key, df) for df in frames]
+        entry = {
+            "files": files,
+            "list": isinstance(data, list),
+            "nbytes": sum(
+                os.path.getsize(os.path.join(self.directory, f)) for f in files
+            ),
+            "atime": time.time(),
+        }
+        with self.lock():
+            registry = self.load_registry()
+            old = registry.get(key)
+            registry[key] = entry
+            self.enforce_budget(registry, key)
+            self.save_registry(registry)
+        if old is not None:
+            self.unlink(old)
+
+    def enforce_budget(self, registry: Dict[str, dict], keep: str) -> None:
+        """Sposta su disco le variabili usate meno di recente finche'
+        quelle in memoria non rientrano nel budget. Da chiamare con il lock
+
+        Args:
+            registry (Dict[str, dict]): registro da aggiornare
+            keep (str): variabile appena scritta, mai spostata
+        """
+        if self.budget is None:
+            return
+        in_memory = {k: e for k, e in registry.items() if not e.get("spilled")}
+        used = sum(e["nbytes"] for e in in_memory.values())
+        lru = sorted(
+            (k for k in in_memory if k != keep),
+            key=lambda k: in_memory[k]["atime"],
+        )
+        for k in lru:
+            if used <= self.budget:
+                break
+            entry = in_memory[k]
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for f in entry["files"]:
+                shutil.move(
+                    os.path.join(self.directory, f),
+                    os.path.join(self.spill_dir, f),
+                )
+            entry["spilled"] = True
+            used -= entry["nbytes"]
+            self.spill_stats["spills"] += 1
+            self.spill_stats["spilled_bytes"] += entry["nbytes"]
+            logger.info(
+                f"Spilled {k} ({entry['nbytes']} bytes) to {self.spill_dir}"
+            )
+
+    def __getitem__(self, key: str) -> Union[DataFrame, List[DataFrame]]:
+        with self.lock():
+            registry = self.load_registry()
+            entry = registry[key]
+            # le tabelle mappate restano valide anche se il file viene rimosso
+            frames = [open_frame(self.path(entry, f)) for f in entry["files"]]
+            if self.budget is not None and not entry.get("spilled"):
+                entry["atime"] = time.time()
+                self.save_registry(registry)
+        if entry.get("spilled"):
+            self.spill_stats["reloads"] += 1
+            self.spill_stats["reloaded_bytes"] += entry["nbytes"]
+        frames = [to_pandas(f) for f in frames]
+        return frames if entry["list"] else frames[0]
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock():
+            return key in self.load_registry()
+
+    def keys(self) -> List[str]:
+        with self.lock():
+            return list(self.load_registry())
+
+    def nbytes(self, key: str) -> int:
+        """Byte occupati in memoria dalla variabile, 0 se su disco"""
+        with self.lock():
+            entry = self.load_registry()[key]
+            return 0 if entry.get("spilled") else entry["nbytes"]
+
+    def remove(self, key: str) -> None:
+        with self.lock():
+            registry = self.load_registry()
+            entry = registry.pop(key, None)
+            if entry is None:
+                return
+            self.save_registry(registry)
+        self.unlink(entry)
+
+    def unlink(self, entry: dict) -> None:
+        for f in entry["files"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path(entry, f))
+
+    def clear(self) -> None:
+        """Rimuove tutte le variabili e la directory"""
+        with self.lock():
+            registry = self.load_registry()
+        for entry in registry.values():
+            self.unlink(entry)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
 
 @dataclass
 class SharedMemory(metaclass=SingletonType):
     """Classe rappresentante una memoria condivisa accessibile
     da varie parti del codice per poter scrivere i risultati della elaborazione.
-    TODO: Rendere thread safe l'accesso e la scrittura al dizionario - rimpiazzare con dizionari ad hoc
+    Con il backend local i dataframe restano in un dizionario del processo,
+    con il backend arrow vengono salvati in un ArrowStore e sono visibili
+    a tutti i processi dell'host (worker del pool, nodi del dag eseguiti
+    con l'executor process). Il backend si sceglie con configure oppure
+    con le variabili d'ambiente SHARED_MEMORY_BACKEND e SHARED_MEMORY_DIR.
+    Se e' impostato un budget le variabili usate meno di recente vengono
+    salvate su disco con write_frame (Arrow IPC, pickle per i dataframe con
+    colonne annidate) e rilette alla lettura successiva. Il backend local
+    riporta in memoria, entro il budget, le variabili rilette
     """
 
     # dizionario in cui memorizzare i dataframe
     memory: Dict[str, Union[DataFrame, List[DataFrame]]] = field(
         default_factory=dict
     )
+    # archivio condiviso tra processi, None per il backend local
+    store: Optional[ArrowStore] = None
+    # consumatori che devono ancora leggere ogni variabile
+    consumers: Dict[str, int] = field(default_factory=dict)
+    # dimensione in byte delle variabili del backend local
+    sizes: Dict[str, int] = field(default_factory=dict)
+    # byte massimi delle variabili in memoria, None senza limite
+    budget: Optional[int] = None
+    spill_dir: str = field(default_factory=default_spill_directory)
+    # variabili del backend local salvate su disco: file e dimensione
+    spilled: Dict[str, dict] = field(default_factory=dict)
+    spill_stats: Dict[str, int] = field(default_factory=new_spill_stats)
+
+    def __post_init__(self) -> None:
+        self._lock = threading.RLock()
+        self.budget = parse_size(os.environ.get(BUDGET_ENV))
+        self.spill_dir = os.environ.get(SPILL_DIR_ENV, self.spill_dir)
+        if os.environ.get(BACKEND_ENV, "local") == "arrow":
+            self.store = ArrowStore(
+                os.environ.get(DIRECTORY_ENV, default_directory()),
+                self.budget,
+                self.spill_dir,
+                self.spill_stats,
+            )
+
+    def configure(
+        self,
+        backend: str = "local",
+        directory: Optional[str] = None,
+        budget: Optional[Union[int, str]] = None,
+        spill_dir: Optional[str] = None,
+    ) -> None:
+        """Sceglie il backend della memoria condivisa. La scelta viene
+        propagata ai processi figli tramite variabili d'ambiente
+
+        Args:
+            backend (str, optional): local oppure arrow. Defaults to "local".
+            directory (Optional[str], optional): directory dell'ArrowStore.
+                Defaults to None.
+            budget (Optional[Union[int, str]], optional): memoria massima delle
+                variabili, in byte o con unita (es. 2GB). Defaults to None.
+            spill_dir (Optional[str], optional): directory su disco delle
+                variabili oltre il budget. Defaults to None.
+        """
+        assert backend in ("local", "arrow"), f"Unknown backend {backend}"
+        os.environ[BACKEND_ENV] = backend
+        self.budget = parse_size(budget)
+        if budget is None:
+            os.environ.pop(BUDGET_ENV, None)
+        else:
+            os.environ[BUDGET_ENV] = str(self.budget)
+        if spill_dir is not None:
+            os.environ[SPILL_DIR_ENV] = spill_dir
+            self.spill_dir = spill_dir
+        if backend == "local":
+            self.store = None
+            with self._lock:
+                self.enforce_budget()
+            return
+        directory = default_directory() if directory is None else directory
+        os.environ[DIRECTORY_ENV] = directory
+        self.store = ArrowStore(
+            directory, self.budget, self.spill_dir, self.spill_stats
+        )
+
+    @contextlib.contextmanager
+    def configured(self, **kwargs) -> Iterator["SharedMemory"]:
+        """Configura la memoria condivisa per la durata del blocco.
+        All'uscita l'ArrowStore creato viene svuotato, perche' i suoi file
+        occupano la memoria di tmpfs, e vengono ripristinati la
+        configurazione e le variabili d'ambiente precedenti
+
+        Args:
+            kwargs: argomenti di configure
+
+        Yields:
+            SharedMemory: memoria condivisa configurata
+        """
+        environ = {k: os.environ.get(k) for k in ENVIRONMENT}
+        previous = (self.store, self.budget, self.spill_dir)
+        self.configure(**kwargs)
+        try:
+            yield self
+        finally:
+            store = self.store
+            if store is not None and (
+                previous[0] is None
+                or os.path.abspath(previous[0].directory)
+                != os.path.abspath(store.directory)
+            ):
+                store.clear()
+            for k, v in environ.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+            self.store, self.budget, self.spill_dir = previous
 
     def __getitem__(self, key: str) -> Union[DataFrame, List[DataFrame]]:
         try:
-            return self.memory[key]
+            if self.store is not None:
+                return self.store[key]
+            with self._lock:
+                if key in self.spilled:
+                    return self.promote(key)
+                # la variabile diventa la piu recente
+                self.memory[key] = self.memory.pop(key)
+                return self.memory[key]
         except KeyError:
             raise ValueError(f"Unkown variable {key} in shared memory")
 
     def __setitem__(
         self, key: str, data: Union[DataFrame, List[DataFrame]]
     ) -> None:
+        if self.store is not None:
+            self.store[key] = data
+            return
+        frames = data if isinstance(data, list) else [data]
+        size = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+        with self._lock:
+            self.remove(key)
+            self.memory[key] = data
+            self.sizes[key] = size
+            self.enforce_budget(keep=key)
+
+    def enforce_budget(self, keep: Optional[str] = None) -> None:
+        """Salva su disco le variabili del backend local usate meno di
+        recente finche' quelle in memoria non rientrano nel budget
+
+        Args:
+            keep (Optional[str], optional): variabile da non salvare. Defaults to None.
+        """
+        if self.budget is None:
+            return
+        used = sum(self.sizes.values())
+        # i dizionari mantengono l'ordine: la prima chiave e' la meno recente
+        for k in [k for k in self.memory if k != keep]:
+            if used <= self.budget:
+                break
+            used -= self.spill(k)
+
+    def spill(self, key: str) -> int:
+        """Salva una variabile del backend local su disco
+
+        Args:
+            key (str): variabile da salvare
+
+        Returns:
+            int: byte liberati in memoria
+        """
+        data = self.memory.pop(key)
+        size = self.sizes.pop(key)
+        frames = data if isinstance(data, list) else [data]
+        os.makedirs(self.spill_dir, exist_ok=True)
+        files = [write_frame(self.spill_dir, key, df) for df in frames]
+        nbytes = sum(
+            os.path.getsize(os.path.join(self.spill_dir, f)) for f in files
+        )
+        self.spilled[key] = {
+            "files": files,
+            "list": isinstance(data, list),
+            "nbytes": nbytes,
+        }
+        self.spill_stats["spills"] += 1
+        self.spill_stats["spilled_bytes"] += nbytes
+        logger.info(
+            f"Spilled {key} ({size} bytes in memory) to {self.spill_dir}"
+        )
+        return size
+
+    def reload(self, key: str) -> Union[DataFrame, List[DataFrame]]:
+        """Rilegge una variabile salvata su disco da spill: i file Arrow
+        tramite memory map, i dataframe con colonne annidate da pickle"""
+        entry = self.spilled[key]
+        frames = [
+            to_pandas(open_frame(os.path.join(self.spill_dir, f)))
+            for f in entry["files"]
+        ]
+        self.spill_stats["reloads"] += 1
+        self.spill_stats["reloaded_bytes"] += entry["nbytes"]
+        return frames if entry["list"] else frames[0]
+
+    def promote(self, key: str) -> Union[DataFrame, List[DataFrame]]:
+        """Rilegge una variabile salvata su disco e, se rientra nel budget,
+        la riporta in memoria come la piu recente salvando su disco quelle
+        usate meno di recente. Una variabile piu grande del budget resta
+        su disco e viene riletta ad ogni accesso
+
+        Args:
+            key (str): variabile da rileggere
+
+        Returns:
+            Union[DataFrame, List[DataFrame]]: variabile riletta
+        """
+        data = self.reload(key)
+        frames = data if isinstance(data, list) else [data]
+        size = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+        if self.budget is not None and size > self.budget:
+            return data
+        self.unlink(self.spilled.pop(key))
         self.memory[key] = data
+        self.sizes[key] = size
+        self.enforce_budget(keep=key)
+        return data
+
+    def unlink(self, entry: dict) -> None:
+        """Rimuove i file di una variabile salvata su disco"""
+        for f in entry["files"]:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(os.path.join(self.spill_dir, f))
+
+    def __contains__(self, key: str) -> bool:
+        if self.store is not None:
+            return key in self.store
+        with self._lock:
+            return key in self.memory or key in self.spilled
+
+    def keys(self) -> List[str]:
+        if self.store is not None:
+            return self.store.keys()
+        with self._lock:
+            return list(self.memory) + list(self.spilled)
 
     def remove(self, key: str) -> None:
-        self.memory.pop(key, None)
+        if self.store is not None:
+            self.store.remove(key)
+            return
+        with self._lock:
+            self.memory.pop(key, None)
+            self.sizes.pop(key, None)
+            entry = self.spilled.pop(key, None)
+            if entry is not None:
+                self.unlink(entry)
+
+    def nbytes(self, key: str) -> int:
+        """Memoria occupata da una variabile, in byte (0 se salvata su disco)"""
+        if self.store is not None:
+            return self.store.nbytes(key)
+        with self._lock:
+            if key in self.spilled:
+                return 0
+            return self.sizes[key]
+
+    def usage(self) -> Dict[str, int]:
+        """Memoria occupata da ogni variabile ancora presente, in byte"""
+        usage = {}
+        for k in self.keys():
+            try:
+                usage[k] = self.nbytes(k)
+            except KeyError:
+                # rimossa nel frattempo da un altro thread o processo
+                continue
+        return usage
+
+    def set_consumers(self, consumers: Dict[str, int]) -> None:
+        """Registra il numero di consumatori delle variabili: ogni variabile
+        viene rimossa quando l'ultimo consumatore l'ha letta
+
+        Args:
+            consumers (Dict[str, int]): numero di lettori per variabile
+        """
+        if self.store is not None:
+            self.store.set_consumers(consumers)
+            return
+        with self._lock:
+            self.consumers.update(consumers)
+
+    def clear_consumers(self, keys: Iterable[str]) -> None:
+        """Rimuove il conteggio dei consumatori, senza rimuovere le variabili"""
+        if self.store is not None:
+            self.store.clear_consumers(keys)
+            return
+        with self._lock:
+            for k in keys:
+                self.consumers.pop(k, None)
+
+    def release(self, key: str) -> bool:
+        """Segnala che un consumatore ha letto la variabile
+
+        Args:
+            key (str): variabile letta
+
+        Returns:
+            bool: True se la variabile ha un conteggio dei consumatori,
+                False se la sua rimozione e' lasciata al lettore
+        """
+        if self.store is not None:
+            return self.store.release(key)
+        with self._lock:
+            if key not in self.consumers:
+                return False
+            self.consumers[key] -= 1
+            if self.consumers[key] <= 0:
+                del self.consumers[key]
+                self.remove(key)
+            return True
 
 
 class SharedMemoryReader(DataReader):
@@ -40,7 +641,8 @@ class SharedMemoryReader(DataReader):
     Attributes:
         variables (list of str): nome dei dataframe da leggere dalla memoria condivisa
         bh_manager (BheaviorManager): BehaviorManager
-        remove_after_read (bool):  True se si vuole elimineare la variabile dopo la sua lettura
+        remove_after_read (bool):  True se si vuole elimineare la variabile dopo la sua lettura.
+            Ignorato per le variabili di cui il dag conosce il numero di consumatori
         shared_memory (SharedMemory): memoria condivisa
     """
 
@@ -86,12 +688,14 @@ class SharedMemoryReader(DataReader):
         assert len(data) == 1, "Reduce must produce a single dataframe"
         df = data.pop(0)
 
-        if self.remove_after_read:
-            if not isinstance(self.variables, list):
-                variables = [self.variables]
-            else:
-                variables = self.variables
-            for v in variables:
+        if not isinstance(self.variables, list):
+            variables = [self.variables]
+        else:
+            variables = self.variables
+        for v in variables:
+            # le variabili con un conteggio dei consumatori (registrato dal dag)
+            # vengono rimosse dopo la lettura dell'ultimo consumatore
+            if not self.shared_memory.release(v) and self.remove_after_read:
                 self.shared_memory.remove(v)
         yield df
 
@@ -135,7 +739,7 @@ class SharedMemoryWriter(DataWriter):
     def write(self, data: Union[DataFrame, List[DataFrame]]):
         if isinstance(data, list):
             if self.bh_manager is not None:
-                self.bh_manager.reduce(data)
+                data = self.bh_manager.reduce(data)
         else:
             data = [data]
 
@@ -1,19 +1,37 @@
 import re
 from pandas import DataFrame
-from typing import Any, Dict, Iterator, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
 import fsspec
 from src.core.datamanager.base import DataReader, DataWriter
+from src.core.util.predicates import Predicate
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def select_list(names: List[str], projection: Set[str]) -> Optional[str]:
+    """Select list con le sole colonne della projection, nell'ordine
+    della sorgente. None se la projection non riduce le colonne lette
+    o se i nomi andrebbero quotati (la sintassi dipende dal database)"""
+    columns = [c for c in names if c in projection]
+    if (
+        not columns
+        or len(columns) == len(names)
+        or not all(c.isidentifier() for c in columns)
+    ):
+        return None
+    return ", ".join(columns)
+
+
 class BaseSQLReader(DataReader):
     """Classe per la lettura da big query
 
     Attributes:
         query (List[str]): query per scaricare il dataframe
         bh_manager (BheaviorManager): BehaviorManager
+        projection (Set[str], optional): colonne da leggere, impostate
+            dalla projection pushdown del task. Defaults to None.
+        filters (List[Predicate]): predicati della predicate pushdown del task
     """
 
     def __init__(
@@ -62,11 +80,67 @@ class BaseSQLReader(DataReader):
             )
         else:
             self.query.append(query_or_path)
+        self.projection: Optional[Set[str]] = None
+        self.filters: List[Predicate] = []
+
+    def push_columns(self, columns: Set[str]) -> bool:
+        if self.bh_manager is not None:
+            columns = self.bh_manager.plan.input_columns(columns)
+        self.projection = set(columns)
+        return True
+
+    def push_filters(self, predicates: List[Predicate]) -> List[Predicate]:
+        # con piu' query i behavior possono unire righe di sorgenti diverse
+        if len(self.query) > 1:
+            return []
+        self.filters = [p for p in predicates if p.column.isidentifier()]
+        return self.filters
+
+    def pushed_query(self, query: str) -> str:
+        """Racchiude la query in una select delle sole colonne della
+        projection, filtrata con i predicati della predicate pushdown:
+        l'ottimizzatore del database li propaga fino alla scansione delle
+        tabelle. Lo schema del risultato viene letto con una query limit 0
+
+        Args:
+            query (str): query originale
+
+        Returns:
+            str: query con projection e filtri, o la query originale
+        """
+        if self.projection is None and not self.filters:
+            return query
+        query = query.strip().rstrip(";")
+        names = list(
+            self.execute_read(
+                f"select * from ({query}) as pushed limit 0"
+            ).columns
+        )
+        columns = (
+            None
+            if self.projection is None
+            else select_list(names, self.projection)
+        )
+        conditions = [
+            p.to_sql(f"({query}) as aggregate")
+            for p in self.filters
+            if p.column in names
+        ]
+        if columns is None and not conditions:
+            return query
+        pushed = f"select {columns or '*'} from ({query}) as pushed"
+        if columns is not None:
+            logger.info(f"Projection pushdown: select {columns}")
+        if conditions:
+            where = " and ".join(conditions)
+            logger.info(f"Predicate pushdown: where {where}")
+            pushed = f"{pushed} where {where}"
+        return pushed
 
     def read(self) -> Iterator[DataFrame]:
         dfs = []
         for q in self.query:
-            dfs.append(self.execute_read(q))
+            dfs.append(self.execute_read(self.pushed_query(q)))
 
         if len(dfs) > 1:
             dfs = self.bh_manager.reduce(dfs)
@@ -85,6 +159,10 @@ class BaseSQLBatchReader(DataReader):
         table (str): tabella da cui leggere
         columns (str, optional): campi da inserire nella clausola SELECT della query. Defaults to "*".
         batch_field (str, optional): campo in cui è contenuto l'id progressivo dei batch. Defaults to "batch".
+        projection (Set[str], optional): colonne da leggere, impostate
+            dalla projection pushdown del task. Defaults to None.
+        filters (List[Predicate]): predicati della predicate pushdown del task,
+            aggiunti alla clausola WHERE di ogni batch
     """
 
     def __init__(
@@ -109,14 +187,67 @@ class BaseSQLBatchReader(DataReader):
             self.columns = ",".join(columns)
         else:
             self.columns = columns
+        self.projection: Optional[Set[str]] = None
+        self.filters: List[Predicate] = []
+
+    def push_columns(self, columns: Set[str]) -> bool:
+        self.projection = set(columns)
+        return True
+
+    def push_filters(self, predicates: List[Predicate]) -> List[Predicate]:
+        self.filters = [p for p in predicates if p.column.isidentifier()]
+        return self.filters
+
+    def table_columns(self) -> List[str]:
+        return list(
+            self.execute_read(f"select * from {self.table} limit 0").columns
+        )
+
+    def project_columns(self, table_columns: Optional[List[str]]) -> None:
+        """Riscrive la select list (columns) con le sole colonne della
+        projection. Con select * le colonne vengono lette dallo schema
+        della tabella"""
+        if self.columns.strip() == "*":
+            names = table_columns or self.table_columns()
+        else:
+            names = [c.strip() for c in self.columns.split(",")]
+        # le espressioni della select list (es. alias) restano invariate
+        columns = (
+            select_list(names, self.projection)
+            if all(c.isidentifier() for c in names)
+            else None
+        )
+        if columns is not None:
+            logger.info(f"Projection pushdown: select {columns}")
+            self.columns = columns
+        self.projection = None
+
+    def where(self, batch_id: Any) -> str:
+        """Clausola WHERE del batch. Gli aggregati dei predicati vengono
+        calcolati sul batch, come farebbe il filtro del transformer"""
+        batch = f"{self.batch_field}={batch_id}"
+        return " and ".join(
+            [batch]
+            + [p.to_sql(f"{self.table} where {batch}") for p in self.filters]
+        )
 
     def read(self) -> Iterator[DataFrame]:
+        table_columns = None
+        if self.filters:
+            table_columns = self.table_columns()
+            self.filters = [
+                p for p in self.filters if p.column in table_columns
+            ]
+            for predicate in self.filters:
+                logger.info(f"Predicate pushdown: {predicate}")
+        if self.projection is not None:
+            self.project_columns(table_columns)
         for batch_id in self.get_batches():
             yield self.execute_read(
                 f"""
                 select {self.columns}
                 from {self.table}
-                where {self.batch_field}={batch_id}"""
+                where {self.where(batch_id)}"""
             )
 
     def execute_read(self, query: str) -> DataFrame:
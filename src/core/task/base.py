@@ -1,10 +1,57 @@
+import copy
+import json
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from enum import Enum, auto
 from multiprocessing import Pool
-from typing import Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+import numpy as np
+import pandas as pd
 from pandas import DataFrame
 from tqdm import tqdm
 
-from src.core.transformer.base import BaseTransformer
+from src.core.task.remote import Coordinator, transform_batch
+from src.core.task.transport import Transport, create_transport
+from src.core.transformer.base import (
+    BaseTransformer,
+    Pipeline,
+    is_partitionable,
+    leading_predicates,
+    merge_profiles,
+    pop_profile,
+    required_columns,
+)
+from src.core.transformer.basic import GroupByAccumulator
+from src.core.util import loader
 from src.core.util.factory import Factory
+from src.core.util.predicates import Predicate
+
+logger = logging.getLogger(__name__)
+
+# transformer istanziato una sola volta in ogni processo worker
+_worker_transformer: Optional[BaseTransformer] = None
+# tempo di costruzione del transformer, riportato al primo batch del worker
+_worker_setup_time: Optional[float] = None
+# trasporto dei batch tra il processo principale e il worker
+_worker_transport: Transport = Transport()
 
 
 def process(transformer: BaseTransformer, df: DataFrame) -> DataFrame:
@@ -21,6 +68,102 @@ def process(transformer: BaseTransformer, df: DataFrame) -> DataFrame:
     return tdf
 
 
+def init_worker(
+    plugins: List[str],
+    transformer_args: dict,
+    transport: str = "pickle",
+    transport_dir: Optional[str] = None,
+) -> None:
+    """Initializer dei processi del pool: carica i plugin e costruisce
+    il transformer a partire dal suo dizionario di configurazione.
+    In questo modo verso i worker vengono inviati soltanto i batch
+
+    Args:
+        plugins (List[str]): plugin da caricare nel worker
+        transformer_args (dict): dizionario per istanziare il transformer
+        transport (str, optional): trasporto dei batch. Defaults to "pickle".
+        transport_dir (Optional[str], optional): directory condivisa del
+            trasporto. Defaults to None.
+    """
+    global _worker_transformer, _worker_setup_time, _worker_transport
+    _worker_transport = create_transport(transport, transport_dir)
+    start = time.perf_counter()
+    loader.load_plugins(plugins)
+    _worker_transformer = Factory().create(copy.deepcopy(transformer_args))
+    _worker_setup_time = time.perf_counter() - start
+    logger.debug(
+        f"Worker {os.getpid()}: transformer ready in {_worker_setup_time:.3f}s"
+    )
+
+
+def process_batch(payload: Any) -> Tuple[Any, dict]:
+    """Applica il transformer del worker al batch in input
+
+    Args:
+        payload (Any): batch da trasformare, nella forma prodotta dal trasporto
+
+    Returns:
+        Tuple[Any, dict]: batch trasformato, nella forma prodotta dal trasporto,
+            e informazioni sull'esecuzione nel worker
+    """
+    global _worker_setup_time
+    info = {"pid": os.getpid()}
+    if _worker_setup_time is not None:
+        info["setup_time"] = _worker_setup_time
+        _worker_setup_time = None
+    df = _worker_transport.unpack(payload)
+    result = _worker_transport.pack(_worker_transformer(df))
+    info["profile"] = pop_profile(_worker_transformer)
+    return result, info
+
+
+def bounded(
+    iterable: Iterable[DataFrame], semaphore: threading.Semaphore
+) -> Iterator[DataFrame]:
+    """Limita il numero di batch letti ma non ancora scritti.
+    Il pool consuma l'iteratore in un thread dedicato: senza
+    questo limite leggerebbe l'intera sorgente in memoria.
+
+    Args:
+        iterable (Iterable[DataFrame]): sorgente dei batch
+        semaphore (threading.Semaphore): semaforo rilasciato
+            ad ogni batch scritto
+
+    Yields:
+        DataFrame: batch letto dalla sorgente
+    """
+    for item in iterable:
+        semaphore.acquire()
+        yield item
+
+
+# segnala la fine dello stream tra due stage della pipeline
+_END = object()
+
+
+@dataclass
+class StageStats:
+    """Statistiche di uno stage della modalita pipeline
+
+    Attributes:
+        name (str): nome dello stage
+        busy (float): secondi spesi a lavorare
+        idle (float): secondi spesi in attesa sulle code
+        items (int): numero di batch elaborati
+    """
+
+    name: str
+    busy: float = 0.0
+    idle: float = 0.0
+    items: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: busy={self.busy:.3f}s idle={self.idle:.3f}s "
+            f"batches={self.items}"
+        )
+
+
 class Task:
     """Classe che rappresenta l'esecuzione di un task di trasformazione
 
@@ -30,9 +173,55 @@ class Task:
         transformer (BaseTransformer): oggetto contenente le istruzioni della trasformazione
         num_of_processes (int, optional): numero di processi da utilizzare per il multiprocessing. Default to 1
         ctx_manager (ContextManager, optional): manager di contesto. Default to None
+        ordered (bool, optional): True se i batch trasformati devono essere
+            scritti nello stesso ordine di lettura. Default to True
+        max_pending (int, optional): numero massimo di batch letti e non ancora
+            scritti durante il multiprocessing. Default to 2 * num_of_processes
+        mode (Mode): modalita di esecuzione. Se non specificata viene
+            scelta sulla base di num_of_processes
+        queue_size (int, optional): dimensione delle code tra gli stage
+            della modalita pipeline. Default to 2
+        transport (str, optional): trasporto dei batch verso i worker, pickle
+            oppure arrow (memoria condivisa). Default to pickle
+        stage_stats (Dict[str, StageStats]): statistiche per stage
+            dell'ultima esecuzione in modalita pipeline
+        transformer_args (dict): dizionario di configurazione del transformer,
+            usato per ricostruirlo nei processi worker
+        serialization_stats (dict): costo di costruzione e serializzazione del
+            transformer nell'ultima esecuzione in multiprocessing
+        partitions (int, optional): numero di partizioni in cui dividere ogni
+            batch nella modalita partitioned. Default to num_of_processes
+        partition_key (List[str], optional): colonne su cui calcolare partizioni
+            hash. Se None i batch vengono divisi in blocchi di righe contigue
+        profile (Dict[str, dict]): metriche di ogni step della pipeline
+            nell'ultima esecuzione, sommate su batch e processi worker
+        profile_path (str, optional): file json in cui salvare il profilo
+            al termine di ogni esecuzione
+        accumulator (GroupByAccumulator, optional): aggregati parziali della
+            groupby in streaming con cui termina il transformer
+        projection_pushdown (bool, optional): True per limitare la lettura
+            alle colonne usate dal transformer, se il reader lo supporta.
+            Default to True
+        pushed_columns (Set[str], optional): colonne a cui e' stata limitata
+            la lettura, None se il reader legge tutte le colonne
+        predicate_pushdown (bool, optional): True per applicare in lettura
+            i filtri con cui inizia il transformer, se il reader lo supporta.
+            I filtri restano comunque applicati dal transformer. Default to True
+        pushed_predicates (List[Predicate]): predicati applicati dal reader
 
     """
 
+    class Mode(Enum):
+        """Modalita di esecuzione"""
+
+        SEQUENTIAL = auto()  # 1 - lettura, trasformazione e scrittura in serie
+        MULTIPROCESSING = auto()  # 2 - trasformazioni su un pool di processi
+        PIPELINE = (
+            auto()
+        )  # 3 - lettura, trasformazione e scrittura sovrapposte
+        PARTITIONED = auto()  # 4 - ogni batch diviso in partizioni parallele
+        REMOTE = auto()  # 5 - trasformazioni sui worker di un Coordinator
+
     def __init__(
         self,
         data_reader: dict,
@@ -40,6 +229,17 @@ class Task:
         transformer: dict,
         num_of_processes: int = 1,
         ctx_manager: Optional[dict] = None,
+        ordered: bool = True,
+        max_pending: Optional[int] = None,
+        mode: Optional[Union[int, str]] = None,
+        queue_size: int = 2,
+        transport: str = "pickle",
+        partitions: Optional[int] = None,
+        partition_key: Optional[Union[str, List[str]]] = None,
+        remote: Optional[dict] = None,
+        profile_path: Optional[str] = None,
+        projection_pushdown: bool = True,
+        predicate_pushdown: bool = True,
     ) -> None:
         """Costruttore
 
@@ -54,6 +254,39 @@ class Task:
         self.num_of_processes = (
             num_of_processes  # task_args.pop("num_of_processes", 1)
         )
+        self.ordered = ordered
+        self.max_pending = (
+            2 * num_of_processes if max_pending is None else max_pending
+        )
+        assert self.max_pending >= 1, "max_pending must be at least 1"
+
+        if mode is None:
+            self.mode = (
+                Task.Mode.SEQUENTIAL
+                if num_of_processes == 1
+                else Task.Mode.MULTIPROCESSING
+            )
+        elif isinstance(mode, str):
+            self.mode = Task.Mode[mode.upper()]
+        else:
+            self.mode = Task.Mode(mode)
+        assert queue_size >= 1, "queue_size must be at least 1"
+        self.queue_size = queue_size
+        self.stage_stats: Dict[str, StageStats] = {}
+        assert transport in (
+            "pickle",
+            "arrow",
+        ), f"Unknown transport {transport}"
+        self.transport = transport
+        self.partitions = (
+            num_of_processes if partitions is None else partitions
+        )
+        assert self.partitions >= 1, "partitions must be at least 1"
+        if isinstance(partition_key, str):
+            partition_key = [partition_key]
+        self.partition_key = partition_key
+        # argomenti del Coordinator per la modalita remote
+        self.remote = {} if remote is None else remote
 
         # ctx_args = task_args.pop("ctx_manager", {"type": "core.context.dummy"})
         if ctx_manager is None:
@@ -64,55 +297,510 @@ class Task:
         self.data_reader = factory.create(data_reader)
         self.data_writer = factory.create(data_writer)
 
+        # la Pipeline modifica i dizionari dei transformer figli
+        transformer = copy.deepcopy(transformer)
+        partitionable = transformer.pop("partitionable", None)
+        self.transformer_args = copy.deepcopy(transformer)
         self.transformer = factory.create(transformer)
+        if partitionable is not None:
+            self.transformer.partitionable = partitionable
+        self.serialization_stats: Dict[str, Any] = {}
+        self.remote_stats: Dict[str, Any] = {}
+        self.profile: Dict[str, dict] = {}
+        self.profile_path = profile_path
+        self.accumulator: Optional[GroupByAccumulator] = None
+        self.projection_pushdown = projection_pushdown
+        self.pushed_columns: Optional[Set[str]] = (
+            self.push_projection() if projection_pushdown else None
+        )
+        self.predicate_pushdown = predicate_pushdown
+        self.pushed_predicates: List[Predicate] = (
+            self.push_predicates() if predicate_pushdown else []
+        )
 
-    def run(self, **kwargs) -> None:
-        def run_sequentially():
-            with self.ctx_manager as _:
+    def push_projection(self) -> Optional[Set[str]]:
+        """Calcola le colonne usate dal transformer e limita ad esse la
+        lettura del reader. Le colonne della partition key servono
+        alla modalita partitioned anche se il transformer non le usa
+
+        Returns:
+            Optional[Set[str]]: colonne a cui e' stata limitata la lettura,
+                None se il transformer puo' usare qualsiasi colonna o se
+                il reader non supporta la projection
+        """
+        columns = required_columns(self.transformer)
+        if not columns:
+            return None
+        if self.partition_key is not None:
+            columns = columns | set(self.partition_key)
+        if not self.data_reader.push_columns(columns):
+            logger.debug(
+                f"Projection pushdown not supported by {self.data_reader}"
+            )
+            return None
+        logger.info(f"Projection pushdown: {sorted(columns)}")
+        return columns
+
+    def push_predicates(self) -> List[Predicate]:
+        """Passa al reader i predicati dei filtri con cui inizia il
+        transformer (ad esempio una query di SwissKnife)
+
+        Returns:
+            List[Predicate]: predicati che il reader applica in lettura
+        """
+        predicates = leading_predicates(self.transformer)
+        if not predicates:
+            return []
+        pushed = self.data_reader.push_filters(predicates)
+        for predicate in pushed:
+            logger.info(f"Predicate pushdown: {predicate}")
+        return pushed
+
+    def run_sequentially(self) -> None:
+        """Legge, trasforma e scrive un batch alla volta"""
+        with self.ctx_manager as _:
+            for df in tqdm(self.data_reader.read()):
+                transformed_df = self.transformer(df)
+                self.write(transformed_df)
+
+    def run_multiprocessing(self) -> None:
+        """Esegue le trasformazioni su un unico pool di processi,
+        che resta attivo per tutta la durata del task.
+        I batch vengono inviati al pool man mano che i worker si liberano
+        e scritti non appena la trasformazione termina
+        """
+        semaphore = threading.Semaphore(self.max_pending)
+        stats = self.measure_serialization()
+        setup_times = []
+        processed = 0
+        transport = create_transport(self.transport)
+        try:
+            with self.ctx_manager as _, self.create_pool(
+                self.transformer_args, transport
+            ) as p:
+                batches = map(
+                    transport.pack,
+                    bounded(self.data_reader.read(), semaphore),
+                )
+                imap = p.imap if self.ordered else p.imap_unordered
+                for payload, info in imap(process_batch, batches):
+                    self.write(transport.unpack(payload))
+                    semaphore.release()
+                    processed += 1
+                    if "setup_time" in info:
+                        setup_times.append(info["setup_time"])
+                    merge_profiles(self.profile, info["profile"])
+                    logger.info(f"Processed: {processed} batches so far")
+        finally:
+            transport.close()
+        if hasattr(transport, "stats"):
+            logger.info(f"Transport {self.transport}: {transport.stats}")
+
+        stats["batches"] = processed
+        stats["worker_setup_time"] = setup_times
+        self.serialization_stats = stats
+        logger.info(
+            "Transformer shipped once per worker as a "
+            f"{stats['config_bytes']} bytes config "
+            f"(pickled transformer: {stats['pickle_bytes']} bytes, "
+            f"{stats['pickle_time']:.4f}s per batch); "
+            f"worker setup times: {[round(t, 3) for t in setup_times]}"
+        )
+
+    def create_pool(self, transformer_args: dict, transport: Transport):
+        """Crea il pool di processi, in cui ogni worker costruisce
+        il transformer a partire dal suo dizionario di configurazione
+
+        Args:
+            transformer_args (dict): configurazione del transformer dei worker
+            transport (Transport): trasporto dei batch
+
+        Returns:
+            Pool: pool di processi
+        """
+        return Pool(
+            self.num_of_processes,
+            initializer=init_worker,
+            initargs=(
+                loader.loaded_plugins(),
+                transformer_args,
+                self.transport,
+                getattr(transport, "directory", None),
+            ),
+        )
+
+    def split_transformer(
+        self,
+    ) -> Tuple[Optional[dict], Optional[BaseTransformer]]:
+        """Divide il transformer in una parte eseguibile in parallelo sulle
+        partizioni del batch e in una parte da applicare al risultato
+        ricombinato (ad esempio una groupby globale)
+
+        Returns:
+            Tuple[Optional[dict], Optional[BaseTransformer]]: configurazione
+                della parte partizionabile (None se vuota) e transformer
+                da eseguire dopo la ricombinazione (None se vuoto)
+        """
+        key = self.partition_key
+        if not isinstance(self.transformer, Pipeline):
+            if is_partitionable(self.transformer, key):
+                return self.transformer_args, None
+            return None, self.transformer
+
+        pos = self.transformer.split(key)
+        transformers_args = self.transformer.transformers_args
+        head = (
+            dict(self.transformer_args, transformers=transformers_args[:pos])
+            if pos > 0
+            else None
+        )
+        tail = (
+            Pipeline(
+                transformers=copy.deepcopy(transformers_args[pos:]),
+                behaviors=self.transformer_args.get("behaviors"),
+                mode=self.transformer.mode.value,
+            )
+            if pos < len(transformers_args)
+            else None
+        )
+        return head, tail
+
+    def partition(self, df: DataFrame) -> List[DataFrame]:
+        """Divide il batch in partizioni, per blocchi di righe o
+        per hash delle colonne partition_key
+
+        Args:
+            df (DataFrame): batch da dividere
+
+        Returns:
+            List[DataFrame]: partizioni non vuote del batch
+        """
+        if self.partition_key is None:
+            chunks = np.array_split(np.arange(len(df)), self.partitions)
+            return [df.iloc[c] for c in chunks if len(c) > 0]
+        hashes = pd.util.hash_pandas_object(
+            df[self.partition_key], index=False
+        ).to_numpy()
+        buckets = hashes % self.partitions
+        return [
+            df[buckets == i]
+            for i in range(self.partitions)
+            if (buckets == i).any()
+        ]
+
+    @staticmethod
+    def combine(parts: List[Any]) -> Any:
+        """Ricombina i risultati delle partizioni
+
+        Args:
+            parts (List[Any]): risultati delle partizioni
+
+        Returns:
+            Any: risultato ricombinato
+        """
+        if len(parts) == 1:
+            return parts[0]
+        if isinstance(parts[0], list):
+            # pipeline che restituiscono liste di dataframe
+            return [Task.combine(list(x)) for x in zip(*parts)]
+        combined = pd.concat(parts)
+        if not combined.index.is_unique and all(
+            isinstance(x.index, pd.RangeIndex) for x in parts
+        ):
+            # ogni partizione ha prodotto un nuovo indice posizionale
+            combined = combined.reset_index(drop=True)
+        return combined
+
+    def run_partitioned(self) -> None:
+        """Divide ogni batch in partizioni, applica in parallelo la parte
+        partizionabile del transformer e ricombina i risultati.
+        I transformer non partizionabili vengono eseguiti nel processo
+        principale sul risultato ricombinato
+        """
+        head, tail = self.split_transformer()
+        if head is None:
+            logger.warning(
+                "No partitionable transformer found, running sequentially"
+            )
+            self.run_sequentially()
+            return
+        if tail is not None:
+            steps = tail.transformers if isinstance(tail, Pipeline) else [tail]
+            names = [getattr(t, "func", t.__class__).__name__ for t in steps]
+            logger.info(f"Combine step after the partitions: {names}")
+
+        transport = create_transport(self.transport)
+        try:
+            with self.ctx_manager as _, self.create_pool(head, transport) as p:
                 for df in tqdm(self.data_reader.read()):
-                    transformed_df = self.transformer(df)
-                    self.data_writer.write(data=transformed_df)
-
-        def run_multiprocessing():
-            dataframe_pool = []
-            with self.ctx_manager as _:
-                for i, df in enumerate(self.data_reader.read()):
-                    dataframe_pool.append(df)
-                    if len(dataframe_pool) == self.num_of_processes:
-                        with Pool(self.num_of_processes) as p:
-                            # get slice
-                            slice_args = [
-                                (self.transformer, data)
-                                for data in dataframe_pool
-                            ]
-                            transformed_dfs = p.starmap(process, slice_args)
-                            print("Transformation Done")
-                            _ = [
-                                self.data_writer.write(data=tdf)
-                                for tdf in transformed_dfs
-                            ]
-                        print(f"Processed: {i+1} batches so far")
-                        dataframe_pool = []
-
-                # gestisco i residuo
-                if len(dataframe_pool) > 0:
-                    with Pool(len(dataframe_pool)) as p:
-                        # get slice
-                        slice_args = [
-                            (self.transformer, data) for data in dataframe_pool
-                        ]
-                        transformed_dfs = p.starmap(process, slice_args)
-                        print(
-                            f"Transformed last {len(dataframe_pool)} batches"
-                        )
-                        _ = [
-                            self.data_writer.write(data=tdf)
-                            for tdf in transformed_dfs
-                        ]
-
-        if self.num_of_processes == 1:
-            print("Run Sequentially")
-            run_sequentially()
+                    parts = [transport.pack(x) for x in self.partition(df)]
+                    results = []
+                    for payload, info in p.map(process_batch, parts):
+                        results.append(transport.unpack(payload))
+                        merge_profiles(self.profile, info["profile"])
+                    transformed_df = self.combine(results)
+                    if tail is not None:
+                        transformed_df = tail(transformed_df)
+                        merge_profiles(self.profile, pop_profile(tail))
+                    self.write(transformed_df)
+        finally:
+            transport.close()
+
+    def measure_serialization(self) -> Dict[str, Any]:
+        """Misura il costo di serializzazione del transformer, confrontando
+        l'invio del dizionario di configurazione (una volta per worker)
+        con il pickle dell'oggetto (una volta per batch)
+
+        Returns:
+            Dict[str, Any]: dimensioni in byte e tempo di pickle del transformer.
+                pickle_bytes e' None se il transformer non e' serializzabile
+                (ad esempio per le lambda create con eval da SwissKnife)
+        """
+        stats: Dict[str, Any] = {
+            "config_bytes": len(pickle.dumps(self.transformer_args))
+        }
+        start = time.perf_counter()
+        try:
+            stats["pickle_bytes"] = len(pickle.dumps(self.transformer))
+        except (pickle.PicklingError, AttributeError, TypeError):
+            stats["pickle_bytes"] = None
+        stats["pickle_time"] = time.perf_counter() - start
+        return stats
+
+    def run_pipeline(self) -> None:
+        """Esegue lettura, trasformazione e scrittura in tre stage
+        distinti collegati da code limitate, in modo da sovrapporre
+        le attese di I/O del reader e del writer al calcolo del transformer.
+        Al termine vengono riportati i tempi di lavoro e di attesa di ogni stage
+        """
+        stats = {
+            name: StageStats(name) for name in ("read", "transform", "write")
+        }
+        read_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        write_q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: list = []
+
+        def put(q: queue.Queue, item: Any, stage: StageStats) -> bool:
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    stage.idle += time.perf_counter() - start
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue, stage: StageStats) -> Any:
+            start = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    item = q.get(timeout=0.1)
+                    stage.idle += time.perf_counter() - start
+                    return item
+                except queue.Empty:
+                    continue
+            return _END
+
+        def run_stage(
+            stage: StageStats,
+            source: Callable[[], Any],
+            func: Callable[[Any], Any],
+            target: Optional[queue.Queue],
+        ) -> None:
+            try:
+                while True:
+                    item = source()
+                    if item is _END:
+                        break
+                    start = time.perf_counter()
+                    result = func(item)
+                    stage.busy += time.perf_counter() - start
+                    stage.items += 1
+                    if target is not None and not put(target, result, stage):
+                        return
+                if target is not None:
+                    put(target, _END, stage)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+
+        def read_source() -> Callable[[], Any]:
+            iterator = iter(self.data_reader.read())
+            stage = stats["read"]
+
+            def source():
+                # il tempo speso nel reader e' tempo di lavoro dello stage
+                start = time.perf_counter()
+                item = next(iterator, _END)
+                stage.busy += time.perf_counter() - start
+                return item
+
+            return source
+
+        with self.ctx_manager as _:
+            threads = [
+                threading.Thread(
+                    target=run_stage,
+                    args=(stats["read"], read_source(), lambda x: x, read_q),
+                    name="task-read",
+                ),
+                threading.Thread(
+                    target=run_stage,
+                    args=(
+                        stats["write"],
+                        lambda: get(write_q, stats["write"]),
+                        self.write,
+                        None,
+                    ),
+                    name="task-write",
+                ),
+            ]
+            for t in threads:
+                t.start()
+            run_stage(
+                stats["transform"],
+                lambda: get(read_q, stats["transform"]),
+                self.transformer,
+                write_q,
+            )
+            for t in threads:
+                t.join()
+
+        self.stage_stats = stats
+        for stage in stats.values():
+            logger.info(f"Pipeline stage {stage}")
+        if errors:
+            raise errors[0]
+
+    def run_remote(self) -> None:
+        """Invia i batch ai worker remoti registrati su un Coordinator.
+        Al piu max_pending batch sono in volo contemporaneamente;
+        i batch di un worker perso vengono rimessi in coda
+        """
+        plugins = loader.loaded_plugins()
+        pending = deque()
+        processed = 0
+
+        def write(future) -> None:
+            nonlocal processed
+            data, profile = future.result()
+            merge_profiles(self.profile, profile)
+            self.write(data)
+            processed += 1
+            logger.info(f"Processed: {processed} batches so far")
+
+        with self.ctx_manager as _, Coordinator(**self.remote) as coordinator:
+            for df in self.data_reader.read():
+                pending.append(
+                    coordinator.submit(
+                        transform_batch, plugins, self.transformer_args, df
+                    )
+                )
+                while len(pending) >= self.max_pending:
+                    if self.ordered:
+                        write(pending.popleft())
+                    else:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                            write(future)
+            while pending:
+                write(pending.popleft())
+            self.remote_stats = {
+                "batches": processed,
+                "workers": dict(coordinator.workers),
+                **coordinator.stats,
+            }
+
+    def report_profile(self) -> List[dict]:
+        """Report delle metriche per step, nell'ordine della pipeline,
+        con la quota del tempo totale spesa in ogni step
+
+        Returns:
+            List[dict]: metriche di ogni step
+        """
+        total = sum(p["wall_time"] for p in self.profile.values())
+        report = [
+            dict(p, share=p["wall_time"] / total if total > 0 else 0.0)
+            for p in self.profile.values()
+        ]
+        for p in sorted(report, key=lambda p: -p["wall_time"]):
+            expressions = (
+                f", expressions compile {p['compile_time']:.3f}s "
+                f"eval {p['eval_time']:.3f}s"
+                if p.get("compile_time") or p.get("eval_time")
+                else ""
+            )
+            logger.info(
+                f"Step {p['name']}: {p['wall_time']:.3f}s "
+                f"({100 * p['share']:.1f}%), cpu {p['cpu_time']:.3f}s, "
+                f"rows {p['rows_in']} -> {p['rows_out']}, "
+                f"memory delta {p['memory_delta'] / 2**20:.1f} MiB"
+                f"{expressions}"
+            )
+        if self.profile_path is not None:
+            with open(self.profile_path, "w") as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def create_accumulator(self) -> Optional[GroupByAccumulator]:
+        """Accumulatore della groupby in streaming, se il transformer (o
+        l'ultimo step di una pipeline CASCADE) e' una groupby in streaming"""
+        if isinstance(self.transformer, Pipeline):
+            steps = self.transformer.transformers
+            cascade = self.transformer.mode == Pipeline.Mode.CASCADE
+        else:
+            steps, cascade = [self.transformer], True
+        streaming = [
+            i for i, t in enumerate(steps) if getattr(t, "streaming", False)
+        ]
+        if not streaming:
+            return None
+        assert cascade and streaming == [
+            len(steps) - 1
+        ], "A streaming groupby must be the last transformer"
+        return GroupByAccumulator(steps[-1])
+
+    def write(self, data: Any) -> None:
+        """Scrive un batch trasformato, o ne accumula gli aggregati
+        parziali se il transformer termina con una groupby in streaming"""
+        if self.accumulator is not None:
+            self.accumulator.add(data)
+        else:
+            self.data_writer.write(data=data)
+
+    def run(self, **kwargs) -> None:
+        self.profile = {}
+        # scarta le metriche di esecuzioni precedenti al di fuori del task
+        pop_profile(self.transformer)
+        self.data_writer.begin()
+        self.accumulator = self.create_accumulator()
+        self.run_mode()
+        if self.accumulator is not None:
+            result = self.accumulator.result()
+            logger.info(
+                f"Streaming groupby: {self.accumulator.batches} batches combined"
+            )
+            if result is not None:
+                self.data_writer.write(data=result)
+        merge_profiles(self.profile, pop_profile(self.transformer))
+        self.report_profile()
+
+    def run_mode(self) -> None:
+        if self.mode == Task.Mode.SEQUENTIAL:
+            logger.info("Run Sequentially")
+            self.run_sequentially()
+        elif self.mode == Task.Mode.PIPELINE:
+            logger.info("Run Pipeline")
+            self.run_pipeline()
+        elif self.mode == Task.Mode.PARTITIONED:
+            logger.info("Run Partitioned")
+            self.run_partitioned()
+        elif self.mode == Task.Mode.REMOTE:
+            logger.info("Run Remote")
+            self.run_remote()
         else:
-            print("Run Parallel")
-            run_multiprocessing()
+            logger.info("Run Parallel")
+            self.run_multiprocessing()
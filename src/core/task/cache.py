@@ -0,0 +1,395 @@
+"""
+Cache content-addressed dei nodi del dag: un nodo il cui fingerprint
+(configurazione, output dei predecessori e file letti) coincide con
+quello di una esecuzione precedente non viene rieseguito e i suoi
+output vengono ripristinati dalla cache.
+Soltanto i nodi che leggono file o variabili della memoria condivisa
+vengono messi in cache: il fingerprint di una sorgente di rete (o di un
+reader senza file) non cambierebbe mai. Dei file di output vengono
+salvati soltanto quelli scritti dall'esecuzione del nodo
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from src.core.datamanager.sharedmemory import SharedMemory
+
+logger = logging.getLogger(__name__)
+
+# writer di cui la cache sa salvare e ripristinare gli output
+SHARED_MEMORY_WRITER = "core.sharedmemorywriter"
+SHARED_MEMORY_READER = "core.sharedmemoryreader"
+MULTIPLE_READER = "core.multiplereader"
+FILE_WRITER = "filemanager.filewriter"
+
+
+def iter_strings(conf: Any) -> Iterator[str]:
+    """Restituisce tutte le stringhe contenute in una configurazione
+
+    Args:
+        conf (Any): dizionario, lista o valore della configurazione
+
+    Yields:
+        str: stringhe della configurazione
+    """
+    if isinstance(conf, dict):
+        for v in conf.values():
+            yield from iter_strings(v)
+    elif isinstance(conf, list):
+        for v in conf:
+            yield from iter_strings(v)
+    elif isinstance(conf, str):
+        yield conf
+
+
+def shared_reads(conf: Any) -> List[str]:
+    """Variabili della memoria condivisa lette da un reader,
+    anche se annidato in altri reader (es. core.multiplereader)
+
+    Args:
+        conf (Any): configurazione del reader
+
+    Returns:
+        List[str]: variabili lette
+    """
+    variables = []
+    if isinstance(conf, dict):
+        if conf.get("type") == SHARED_MEMORY_READER:
+            v = conf.get("variables", [])
+            variables += [v] if isinstance(v, str) else list(v)
+        for value in conf.values():
+            variables += shared_reads(value)
+    elif isinstance(conf, list):
+        for value in conf:
+            variables += shared_reads(value)
+    return variables
+
+
+def find_inputs(conf: Any) -> List[str]:
+    """Individua i file letti da un task: path nella configurazione del
+    reader, path tra apici nelle query (es. read_parquet('./db/*.parquet'))
+    e database duckdb (duckdb:///repos.duckdb)
+
+    Args:
+        conf (Any): configurazione del reader
+
+    Returns:
+        List[str]: file esistenti letti dal task
+    """
+    candidates = set()
+    for s in iter_strings(conf):
+        s = re.sub("^path:", "", s)
+        candidates.add(s)
+        candidates.update(re.findall(r"'([^'\n]+)'", s))
+        candidates.update(re.findall(r"duckdb:///([^\s'\"?]+)", s))
+
+    files = set()
+    for c in candidates:
+        paths = glob.glob(c, recursive=True) if glob.has_magic(c) else [c]
+        for path in paths:
+            if os.path.isfile(path):
+                files.add(path)
+            elif os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    files.update(os.path.join(root, n) for n in names)
+    return sorted(files)
+
+
+def source_readers(conf: Any) -> List[dict]:
+    """Reader che leggono effettivamente i dati: i reader di un
+    core.multiplereader, altrimenti il reader stesso
+
+    Args:
+        conf (Any): configurazione del reader
+
+    Returns:
+        List[dict]: configurazioni dei reader sorgente
+    """
+    if not isinstance(conf, dict):
+        return []
+    if conf.get("type") == MULTIPLE_READER:
+        return [r for c in conf.get("readers", []) for r in source_readers(c)]
+    return [conf]
+
+
+def has_known_inputs(conf: Any) -> bool:
+    """True se ogni reader sorgente legge file esistenti o variabili della
+    memoria condivisa, cioe' input di cui la cache conosce lo stato
+
+    Args:
+        conf (Any): configurazione del reader
+
+    Returns:
+        bool: False per i reader di rete o senza file in input
+    """
+    readers = source_readers(conf)
+    return len(readers) > 0 and all(
+        r.get("type") == SHARED_MEMORY_READER or len(find_inputs(r)) > 0
+        for r in readers
+    )
+
+
+def file_stats(paths: List[str]) -> List[list]:
+    """Dimensione e data di modifica dei file
+
+    Args:
+        paths (List[str]): file di cui calcolare le statistiche
+
+    Returns:
+        List[list]: terne [path, dimensione, mtime in ns]
+    """
+    stats = []
+    for p in paths:
+        st = os.stat(p)
+        stats.append([p, st.st_size, st.st_mtime_ns])
+    return stats
+
+
+def digest(obj: Any) -> str:
+    """Hash sha256 della rappresentazione json di un oggetto"""
+    data = json.dumps(obj, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class NodeCache:
+    """Cache degli output dei nodi del dag. Per ogni nodo viene mantenuto
+    un manifest con il fingerprint dell'ultima esecuzione, il fingerprint
+    degli output prodotti e la copia degli output stessi
+
+    Attributes:
+        cache_dir (str): directory della cache
+    """
+
+    cache_dir: str
+
+    def node_dir(self, node: str) -> str:
+        return os.path.join(self.cache_dir, str(node))
+
+    def manifest_path(self, node: str) -> str:
+        return os.path.join(self.node_dir(node), "manifest.json")
+
+    def load_manifest(self, node: str) -> Optional[dict]:
+        try:
+            with open(self.manifest_path(node), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def outputs(config: dict) -> Optional[Dict[str, List[str]]]:
+        """Output del task che la cache e' in grado di salvare
+
+        Args:
+            config (dict): configurazione del task
+
+        Returns:
+            Optional[Dict[str, List[str]]]: variabili della memoria condivisa e
+                file scritti dal task. None se il task ha effetti collaterali
+                non ripristinabili (tabelle, context manager, dag annidati, ...)
+        """
+        if "tasks" in config or config.get("ctx_manager") is not None:
+            return None
+        writers = [config.get("data_writer", {})]
+        if writers[0].get("type") == "core.multiplewriter":
+            writers = writers[0].get("writers", [])
+
+        outputs: Dict[str, List[str]] = {"variables": [], "files": []}
+        for w in writers:
+            if w.get("type") == SHARED_MEMORY_WRITER:
+                variables = w["variables"]
+                outputs["variables"] += (
+                    [variables] if isinstance(variables, str) else variables
+                )
+            elif w.get("type") == FILE_WRITER:
+                paths = w["output_path"]
+                outputs["files"] += (
+                    [paths] if isinstance(paths, str) else paths
+                )
+            else:
+                return None
+        return outputs
+
+    @staticmethod
+    def cacheable(config: dict, flag: Optional[bool] = None) -> bool:
+        """Indica se gli output del nodo possono essere messi in cache
+
+        Args:
+            config (dict): configurazione risolta del task
+            flag (Optional[bool], optional): valore di dag.cache del nodo.
+                True mette in cache il nodo anche se i suoi input non sono
+                noti (es. sorgente deterministica), False lo esclude.
+                Defaults to None (deciso in base al reader).
+
+        Returns:
+            bool: True se il nodo puo' essere messo in cache
+        """
+        if flag is False or NodeCache.outputs(config) is None:
+            return False
+        return flag is True or has_known_inputs(config.get("data_reader"))
+
+    def fingerprint(self, config: dict, upstream: Dict[str, str]) -> str:
+        """Fingerprint di un nodo
+
+        Args:
+            config (dict): configurazione risolta del task
+            upstream (Dict[str, str]): fingerprint degli output dei predecessori
+
+        Returns:
+            str: fingerprint del nodo
+        """
+        inputs = find_inputs(config.get("data_reader", {}))
+        return digest(
+            {
+                "config": config,
+                "upstream": upstream,
+                "inputs": file_stats(inputs),
+            }
+        )
+
+    def snapshot(self, config: dict) -> Dict[str, list]:
+        """Stato dei file di output prima dell'esecuzione del nodo,
+        usato da save per individuare i file scritti dal nodo
+
+        Args:
+            config (dict): configurazione del task
+
+        Returns:
+            Dict[str, list]: dimensione e mtime di ogni file esistente
+        """
+        outputs = self.outputs(config) or {"files": []}
+        return {
+            path: [size, mtime]
+            for path, size, mtime in file_stats(find_inputs(outputs["files"]))
+        }
+
+    def lookup(self, node: str, fingerprint: str) -> Optional[dict]:
+        """Cerca in cache una esecuzione del nodo con lo stesso fingerprint
+
+        Args:
+            node (str): nome del nodo
+            fingerprint (str): fingerprint corrente del nodo
+
+        Returns:
+            Optional[dict]: manifest dell'esecuzione, None in caso di miss
+        """
+        manifest = self.load_manifest(node)
+        if manifest is None or manifest["fingerprint"] != fingerprint:
+            return None
+        artifacts = list(manifest["variables"].values()) + [
+            f["artifact"] for f in manifest["files"].values()
+        ]
+        node_dir = self.node_dir(node)
+        if not all(
+            os.path.exists(os.path.join(node_dir, a)) for a in artifacts
+        ):
+            return None
+        return manifest
+
+    def restore(self, node: str, manifest: dict) -> None:
+        """Ripristina gli output di un nodo dalla cache. Vengono
+        ricopiati soltanto i file scritti dal nodo che sono stati
+        cancellati o modificati: gli altri file delle directory di
+        output (es. partizioni scritte in seguito) non vengono toccati
+
+        Args:
+            node (str): nome del nodo
+            manifest (dict): manifest restituito da lookup
+        """
+        node_dir = self.node_dir(node)
+        shared_memory = SharedMemory()
+        for v, artifact in manifest["variables"].items():
+            shared_memory[v] = pd.read_pickle(os.path.join(node_dir, artifact))
+        for path, info in manifest["files"].items():
+            if file_stats(find_inputs(path)) == [[path, *info["stats"]]]:
+                # il file non e' stato modificato dopo l'esecuzione in cache
+                continue
+            copy_file(os.path.join(node_dir, info["artifact"]), path)
+
+    def save(
+        self,
+        node: str,
+        fingerprint: str,
+        config: dict,
+        before: Dict[str, list],
+    ) -> Optional[str]:
+        """Salva gli output del nodo appena eseguito. Deve essere
+        chiamato nel processo del dag, che possiede la memoria condivisa
+
+        Args:
+            node (str): nome del nodo
+            fingerprint (str): fingerprint del nodo
+            config (dict): configurazione del task
+            before (Dict[str, list]): stato dei file di output prima
+                dell'esecuzione, restituito da snapshot
+
+        Returns:
+            Optional[str]: fingerprint degli output, usato dai nodi
+                successivi. None se gli output non sono disponibili
+        """
+        outputs = self.outputs(config)
+        shared_memory = SharedMemory()
+        missing = [v for v in outputs["variables"] if v not in shared_memory]
+        if missing:
+            # es. variabili scritte da un altro processo senza backend arrow
+            logger.warning(f"Node {node} not cached: missing {missing}")
+            return None
+        node_dir = self.node_dir(node)
+        artifacts_dir = os.path.join(node_dir, "artifacts")
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+        os.makedirs(artifacts_dir)
+
+        manifest = {
+            "fingerprint": fingerprint,
+            "created": time.time(),
+            "variables": {},
+            "files": {},
+        }
+        output_hashes = {}
+        for v in outputs["variables"]:
+            artifact = os.path.join("artifacts", f"variable_{v}.pickle")
+            pd.to_pickle(shared_memory[v], os.path.join(node_dir, artifact))
+            manifest["variables"][v] = artifact
+            output_hashes[v] = file_digest(os.path.join(node_dir, artifact))
+        # soltanto i file creati o modificati dal nodo
+        after = self.snapshot(config)
+        written = sorted(p for p, st in after.items() if before.get(p) != st)
+        for pos, path in enumerate(written):
+            artifact = os.path.join("artifacts", f"file_{pos}")
+            copy_file(path, os.path.join(node_dir, artifact))
+            manifest["files"][path] = {
+                "artifact": artifact,
+                "stats": after[path],
+            }
+            output_hashes[path] = after[path]
+
+        manifest["output_fingerprint"] = digest(output_hashes)
+        with open(self.manifest_path(node), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest["output_fingerprint"]
+
+
+def file_digest(path: str) -> str:
+    """Hash sha256 del contenuto di un file"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_file(src: str, dst: str) -> None:
+    """Copia un file creando le directory della destinazione"""
+    parent = os.path.dirname(dst)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    shutil.copy2(src, dst)
@@ -1,23 +1,146 @@
+import contextlib
+import copy
+import json
 import logging
+import multiprocessing
+import socket
 import subprocess
-from typing import List, Optional, Union
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Set, Tuple, Union
+from src.core.util import loader
 from src.core.util.factory import Factory
 import networkx as nx
 import yaml
 from pipe import select, where
+from src.core.datamanager.sharedmemory import SharedMemory
 from src.core.task.base import Task
+from src.core.task.cache import NodeCache, iter_strings, shared_reads
+from src.core.task.history import PeakMemory, RunHistory
+from src.core.task.remote import Coordinator
 from src.core.util.params_interpeter import ParamsInterpreter
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class NodeRun:
+    """Esecuzione di un nodo del dag
+
+    Attributes:
+        node (str): nome del nodo
+        status (str): done, failed oppure cancelled
+        start (float): secondi dall'inizio del dag in cui il nodo e' partito
+        end (float): secondi dall'inizio del dag in cui il nodo e' terminato
+        worker (str): thread o processo che ha eseguito il nodo
+        error (str, optional): errore sollevato dal nodo
+        cache (str, optional): esito della cache: hit, miss, forced oppure
+            uncacheable. None se la cache non e' attiva
+        peak_memory (int, optional): picco di memoria residente in byte
+            durante l'esecuzione del nodo. None se il nodo e' stato eseguito
+            in un thread insieme ad altri nodi, perche' il picco del processo
+            comprenderebbe anche la loro memoria
+        pinned_memory (int, optional): byte occupati dalle variabili della
+            memoria condivisa ancora in vita al termine del nodo
+    """
+
+    node: str
+    status: str
+    start: Optional[float] = None
+    end: Optional[float] = None
+    worker: Optional[str] = None
+    error: Optional[str] = None
+    cache: Optional[str] = None
+    peak_memory: Optional[int] = None
+    pinned_memory: Optional[int] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+def run_task_config(plugins: List[str], config: dict) -> dict:
+    """Istanzia ed esegue un task in un processo separato
+
+    Args:
+        plugins (List[str]): plugin da caricare nel processo
+        config (dict): configurazione del task o del dag
+
+    Returns:
+        dict: istanti di inizio e fine, nome del processo e picco di memoria
+    """
+    start = time.time()
+    loader.load_plugins(plugins)
+    task_type = "core.dag" if "tasks" in config else "core.task"
+    with PeakMemory() as memory:
+        Factory().create(dict(type=task_type, **copy.deepcopy(config))).run()
+    return dict(
+        start=start,
+        end=time.time(),
+        worker=f"{socket.gethostname()}/{multiprocessing.current_process().name}",
+        peak_memory=memory.peak,
+    )
+
+
 class TaskDag:
+    """Dag di task, eseguiti rispettando le dipendenze.
+    I nodi le cui dipendenze sono state completate vengono eseguiti
+    in parallelo, fino a max_workers nodi contemporaneamente
+
+    Attributes:
+        task_graph (nx.DiGraph): grafo dei task
+        max_workers (int): numero massimo di nodi eseguiti in parallelo
+        executor (str): thread, process oppure remote. Con remote i nodi
+            vengono eseguiti dai worker registrati su un Coordinator
+        remote (dict, optional): argomenti del Coordinator (address,
+            authkey, heartbeat_timeout, max_attempts, worker_timeout)
+        on_failure (str): cancel_downstream per annullare soltanto i nodi
+            che dipendono dal nodo fallito, stop per non avviare altri nodi
+        timeline (List[NodeRun]): cronologia dell'ultima esecuzione
+        timeline_path (str, optional): file json in cui salvare la cronologia
+        cache (NodeCache, optional): cache degli output dei nodi.
+            None se l'esecuzione incrementale non e' attiva
+        force (Union[bool, List[str]]): nodi da rieseguire anche in caso
+            di hit in cache, True per rieseguirli tutti
+        cache_report (Dict[str, str]): esito della cache per ogni nodo
+        history (RunHistory, optional): storico delle esecuzioni, usato per
+            dare priorita ai nodi sul cammino critico
+        heavy_memory (int, optional): picco di memoria in byte oltre il quale
+            un nodo e' considerato pesante. Due nodi pesanti non vengono
+            eseguiti contemporaneamente
+        priorities (Dict[str, float]): durata stimata del cammino piu lungo
+            da ogni nodo fino alla fine del dag nell'ultima esecuzione
+        shared_memory (dict, optional): configurazione della memoria
+            condivisa, valida soltanto durante l'esecuzione del dag
+    """
+
     def __init__(
         self,
         tasks: dict,
         edges: List[List[Union[int, str]]],
         startup: Optional[dict] = None,
         cleanup: Optional[dict] = None,
+        max_workers: int = 1,
+        executor: str = "thread",
+        on_failure: str = "cancel_downstream",
+        timeline_path: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        force: Union[bool, List[str]] = False,
+        history_path: Optional[str] = None,
+        heavy_memory: Optional[int] = None,
+        remote: Optional[dict] = None,
+        shared_memory: Optional[dict] = None,
     ) -> None:
         """Costruttore
 
@@ -25,7 +148,50 @@ class TaskDag:
             tasks (dict): Dizionari di coppie nome_task/definizione del task
             edges (List[List[Union[int, str]]]): relazione del dag
             startup_script (Optional[str], optional): script di startup da eseguire all'inizio dell'esecizione del dag. Defaults to None.
+            max_workers (int, optional): numero massimo di nodi eseguiti in parallelo. Defaults to 1.
+            executor (str, optional): thread, process oppure remote. Defaults to "thread".
+            on_failure (str, optional): cancel_downstream oppure stop. Defaults to "cancel_downstream".
+            timeline_path (Optional[str], optional): file json in cui salvare la cronologia. Defaults to None.
+            cache_dir (Optional[str], optional): directory della cache dei nodi. Se None ogni nodo viene
+                sempre rieseguito. Defaults to None.
+            force (Union[bool, List[str]], optional): nodi da rieseguire ignorando la cache,
+                True per tutti. Defaults to False.
+            history_path (Optional[str], optional): database sqlite dello storico delle esecuzioni.
+                Se None i nodi pronti vengono eseguiti in ordine di arrivo. Defaults to None.
+            heavy_memory (Optional[int], optional): soglia in byte del picco di memoria
+                dei nodi pesanti. Defaults to None.
+            remote (Optional[dict], optional): argomenti del Coordinator per
+                l'executor remote. Defaults to None.
+            shared_memory (Optional[dict], optional): backend (local oppure arrow),
+                directory, budget e spill_dir della memoria condivisa. Con arrow le variabili scritte
+                dai nodi eseguiti in altri processi sono visibili a tutto il dag.
+                Defaults to None.
         """
+        assert max_workers >= 1, "max_workers must be at least 1"
+        assert executor in (
+            "thread",
+            "process",
+            "remote",
+        ), f"Unknown executor {executor}"
+        assert on_failure in (
+            "cancel_downstream",
+            "stop",
+        ), f"Unknown on_failure policy {on_failure}"
+        self.max_workers = max_workers
+        self.executor = executor
+        self.remote = {} if remote is None else remote
+        self.shared_memory = shared_memory
+        self.on_failure = on_failure
+        self.timeline_path = timeline_path
+        self.timeline: List[NodeRun] = []
+        self.cache = None if cache_dir is None else NodeCache(cache_dir)
+        self.force = force
+        self.cache_report: Dict[str, str] = {}
+        self.history = (
+            None if history_path is None else RunHistory(history_path)
+        )
+        self.heavy_memory = heavy_memory
+        self.priorities: Dict[str, float] = {}
         self.task_graph = nx.DiGraph()
         for task_name, task_dict_or_path in tasks.items():
             if isinstance(task_dict_or_path, str):
@@ -38,22 +204,24 @@ class TaskDag:
                         print(e)
             else:
                 task_dict = task_dict_or_path
+            task_dict.pop("plugins", None)
+            task_dict.pop("defaults", None)
+            # dag.cache = False esclude il nodo dall'esecuzione incrementale,
+            # True lo include anche se legge da una sorgente senza file
+            cache_flag = task_dict.pop("dag.cache", None)
+            # configurazione usata per ricostruire il task in un altro processo
+            config = copy.deepcopy(task_dict)
             # dag ricorsivo
             if "tasks" in task_dict:
-                task = TaskDag(
-                    tasks=task_dict["tasks"],
-                    edges=task_dict["edges"],
-                    startup=task_dict.pop("startup", None),
-                    cleanup=task_dict.pop("cleanup", None),
-                )
+                task = TaskDag(**task_dict)
             else:
-                task_dict.pop("plugins", None)
-                task_dict.pop("defaults", None)
                 task = Task(**task_dict)
 
             self.task_graph.add_node(
                 task_name,
                 task=task,
+                config=config,
+                cache_flag=cache_flag,
                 visited=False,
                 in_queue=False,
             )
@@ -72,57 +240,400 @@ class TaskDag:
         else:
             self.cleanup = factory.create(cleanup)
 
+    def reads(self, node_id: Union[int, str]) -> List[str]:
+        """Variabili della memoria condivisa lette da un nodo"""
+        config = self.task_graph.nodes[node_id]["config"]
+        if "tasks" in config:
+            return []
+        return sorted(set(shared_reads(config.get("data_reader"))))
+
+    def consumers(self) -> Dict[str, int]:
+        """Numero di nodi che leggono ogni variabile della memoria condivisa.
+        Le variabili citate da dag annidati sono escluse perche' i loro
+        lettori non sono noti
+
+        Returns:
+            Dict[str, int]: numero di consumatori per variabile
+        """
+        counts: Dict[str, int] = {}
+        opaque = set()
+        for v, data in self.task_graph.nodes(data=True):
+            if "tasks" in data["config"]:
+                opaque.update(iter_strings(data["config"]))
+            for variable in self.reads(v):
+                counts[variable] = counts.get(variable, 0) + 1
+        return {k: n for k, n in counts.items() if k not in opaque}
+
     def run(self, **kwargs) -> None:
-        self.startup()
-        self.run_impl(**kwargs)
-        self.cleanup()
+        with contextlib.ExitStack() as stack:
+            if self.shared_memory is not None:
+                stack.enter_context(
+                    SharedMemory().configured(**self.shared_memory)
+                )
+            self.startup()
+            try:
+                self.run_impl(**kwargs)
+                self.cleanup()
+            finally:
+                self.release()
 
-    def run_impl(self, **kwargs) -> None:
-        def run(node_id: Union[int, str]) -> None:
-            """Run di un singolo nodo del dag
+    def release(self) -> None:
+        """Rilascia i dati che i writer dei nodi mantengono oltre la fine
+        dei task (ad esempio le viste del catalogo duckdb)"""
+        for _, task in self.task_graph.nodes(data="task"):
+            if isinstance(task, Task):
+                task.data_writer.release()
 
-            Args:
-                node_id (Union[int, str]): id del nodo del dag
+    def run_node(self, node_id: Union[int, str]) -> dict:
+        """Run di un singolo nodo del dag nel thread corrente
+
+        Args:
+            node_id (Union[int, str]): id del nodo del dag
 
-            """
-            print(f"Running node:{node_id}")
+        Returns:
+            dict: istanti di inizio e fine, nome del thread e picco di memoria
+        """
+        start = time.time()
+        logger.info(f"Running node:{node_id}")
+        with PeakMemory() as memory:
             self.task_graph.nodes[node_id]["task"].run()
-            self.task_graph.nodes[node_id]["visited"] = True
-            print("=" * 20)
+        return dict(
+            start=start,
+            end=time.time(),
+            worker=threading.current_thread().name,
+            peak_memory=memory.peak,
+        )
+
+    def submit(self, pool, node_id: Union[int, str]) -> Future:
+        """Sottomette l'esecuzione di un nodo all'executor
+
+        Args:
+            pool (Executor): executor del dag
+            node_id (Union[int, str]): id del nodo del dag
+
+        Returns:
+            Future: esecuzione del nodo
+        """
+        if self.executor in ("process", "remote"):
+            return pool.submit(
+                run_task_config,
+                loader.loaded_plugins(),
+                self.task_graph.nodes[node_id]["config"],
+            )
+        return pool.submit(self.run_node, node_id)
+
+    def is_forced(self, node_id: Union[int, str]) -> bool:
+        if isinstance(self.force, bool):
+            return self.force
+        return node_id in self.force
+
+    def check_cache(
+        self, node_id: Union[int, str], output_fingerprints: Dict[str, str]
+    ) -> Tuple[str, Optional[str]]:
+        """Calcola il fingerprint del nodo e, in caso di hit,
+        ripristina i suoi output dalla cache
+
+        Args:
+            node_id (Union[int, str]): id del nodo del dag
+            output_fingerprints (Dict[str, str]): fingerprint degli output
+                dei nodi gia eseguiti
 
+        Returns:
+            Tuple[str, Optional[str]]: esito della cache (hit, miss, forced,
+                uncacheable) e fingerprint del nodo
+        """
+        node = self.task_graph.nodes[node_id]
+        if not NodeCache.cacheable(node["config"], node["cache_flag"]):
+            return "uncacheable", None
+        upstream = {
+            str(p): output_fingerprints[p]
+            for p in self.task_graph.predecessors(node_id)
+        }
+        fingerprint = self.cache.fingerprint(node["config"], upstream)
+        if self.is_forced(node_id):
+            return "forced", fingerprint
+        manifest = self.cache.lookup(node_id, fingerprint)
+        if manifest is None:
+            return "miss", fingerprint
+        self.cache.restore(node_id, manifest)
+        output_fingerprints[node_id] = manifest["output_fingerprint"]
+        return "hit", fingerprint
+
+    def estimate_costs(
+        self,
+    ) -> Dict[Union[int, str], Tuple[float, Optional[int]]]:
+        """Durata e picco di memoria stimati di ogni nodo a partire dallo
+        storico. I nodi mai eseguiti ricevono la durata media degli altri
+
+        Returns:
+            Dict[Union[int, str], Tuple[float, Optional[int]]]: durata in
+                secondi e picco di memoria in byte (None se sconosciuto)
+        """
+        nodes = list(self.task_graph.nodes)
+        if self.history is None:
+            return {v: (1.0, None) for v in nodes}
+        estimates = self.history.estimates(nodes)
+        known = [d for d, _ in estimates.values() if d is not None]
+        default = sum(known) / len(known) if known else 1.0
+        return {
+            v: (default if d is None else d, peak)
+            for v, (d, peak) in estimates.items()
+        }
+
+    def critical_path_priorities(
+        self, durations: Dict[Union[int, str], float]
+    ) -> Dict[Union[int, str], float]:
+        """Priorita dei nodi: durata stimata del cammino piu lungo dal nodo
+        fino alla fine del dag. Avviare prima i nodi con priorita maggiore
+        riduce la durata complessiva del dag
+
+        Args:
+            durations (Dict[Union[int, str], float]): durata stimata dei nodi
+
+        Returns:
+            Dict[Union[int, str], float]: priorita di ogni nodo
+        """
+        priorities = {}
+        for v in reversed(list(nx.topological_sort(self.task_graph))):
+            downstream = [priorities[s] for s in self.task_graph.successors(v)]
+            priorities[v] = durations[v] + max(downstream, default=0.0)
+        return priorities
+
+    def run_impl(self, **kwargs) -> None:
+        """Esegue i nodi del dag non appena tutti i loro predecessori
+        sono terminati, con al piu max_workers nodi in parallelo.
+        Tra i nodi pronti vengono avviati per primi quelli sul cammino
+        critico e non vengono mai eseguiti due nodi pesanti insieme.
+        Se un nodo fallisce vengono annullati i nodi che ne dipendono
+        (oppure tutti i nodi non ancora avviati se on_failure e' stop)
+        e, al termine, viene sollevato il primo errore
+        """
+        graph = self.task_graph
+        dag_start = time.time()
+        # numero di predecessori non ancora terminati
+        waiting = {v: graph.in_degree(v) for v in graph.nodes}
         # get the starting task
-        to_visit = list(
-            list(self.task_graph.in_degree())
+        ready = list(
+            list(graph.in_degree())
             | where(lambda x: x[1] == 0)
             | select(lambda x: x[0])
         )
+        runs: Dict[Union[int, str], NodeRun] = {}
+        errors: List[BaseException] = []
+        running: Dict[Future, Union[int, str]] = {}
+        # nodi eseguiti in thread insieme ad altri: il loro picco di memoria
+        # non e' attendibile e non viene registrato
+        overlapped: Set[Union[int, str]] = set()
+        # esito della cache e fingerprint degli output di ogni nodo
+        cache_status: Dict[Union[int, str], Optional[str]] = {}
+        output_fingerprints: Dict[Union[int, str], str] = {}
+        # fingerprint e stato dei file di output dei nodi da salvare in cache
+        pending_saves: Dict[Union[int, str], Tuple[str, dict]] = {}
+        costs = self.estimate_costs()
+        priority = self.critical_path_priorities(
+            {v: d for v, (d, _) in costs.items()}
+        )
+        self.priorities = {str(v): p for v, p in priority.items()}
+        # ogni variabile viene liberata dopo la lettura dell'ultimo consumatore
+        shared_memory = SharedMemory()
+        consumers = self.consumers()
+        shared_memory.set_consumers(consumers)
+
+        def release_reads(v) -> None:
+            # nodi che non leggeranno le loro variabili (in cache o annullati)
+            for variable in self.reads(v):
+                if variable in consumers:
+                    shared_memory.release(variable)
+
+        def pinned() -> int:
+            usage = shared_memory.usage()
+            logger.debug(f"Live shared memory variables: {usage}")
+            return sum(usage.values())
+
+        def is_heavy(v) -> bool:
+            peak = costs[v][1]
+            return (
+                self.heavy_memory is not None
+                and peak is not None
+                and peak >= self.heavy_memory
+            )
+
+        def next_ready():
+            # sort stabile: a parita di priorita vale l'ordine di arrivo
+            ready.sort(key=lambda v: priority[v], reverse=True)
+            heavy_running = any(is_heavy(u) for u in running.values())
+            for v in ready:
+                if not (heavy_running and is_heavy(v)):
+                    ready.remove(v)
+                    return v
+            return None
+
+        def cancel(nodes) -> None:
+            for v in nodes:
+                if v not in runs:
+                    runs[v] = NodeRun(node=v, status="cancelled")
+                    release_reads(v)
+                    logger.warning(f"Node {v} cancelled")
+
+        def complete(v) -> None:
+            for succ in graph.successors(v):
+                waiting[succ] -= 1
+                if waiting[succ] == 0 and succ not in runs:
+                    ready.append(succ)
+
+        if self.executor == "remote":
+            pool = Coordinator(**self.remote)
+        elif self.executor == "process":
+            pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        with pool:
+            while ready or running:
+                while ready and len(running) < self.max_workers:
+                    v = next_ready()
+                    if v is None:
+                        # restano solo nodi pesanti, attendo quello in corso
+                        break
+                    graph.nodes[v]["in_queue"] = True
+                    fingerprint = None
+                    if self.cache is not None:
+                        status, fingerprint = self.check_cache(
+                            v, output_fingerprints
+                        )
+                        cache_status[v] = status
+                        if status == "hit":
+                            logger.info(f"Node {v} restored from cache")
+                            release_reads(v)
+                            runs[v] = NodeRun(
+                                node=v,
+                                status="cached",
+                                cache=status,
+                                pinned_memory=pinned(),
+                            )
+                            graph.nodes[v]["visited"] = True
+                            complete(v)
+                            continue
+                        if fingerprint is not None:
+                            pending_saves[v] = (
+                                fingerprint,
+                                self.cache.snapshot(graph.nodes[v]["config"]),
+                            )
+                    if self.executor == "thread" and running:
+                        overlapped.update(running.values())
+                        overlapped.add(v)
+                    running[self.submit(pool, v)] = v
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    v = running.pop(future)
+                    try:
+                        result = future.result()
+                        runs[v] = NodeRun(
+                            node=v,
+                            status="done",
+                            start=result["start"] - dag_start,
+                            end=result["end"] - dag_start,
+                            worker=result["worker"],
+                            cache=cache_status.get(v),
+                            peak_memory=(
+                                None
+                                if v in overlapped
+                                else result["peak_memory"]
+                            ),
+                            pinned_memory=pinned(),
+                        )
+                        # gli output vengono salvati dal processo del dag,
+                        # che possiede la memoria condivisa
+                        output_fp = None
+                        if v in pending_saves:
+                            fingerprint, before = pending_saves.pop(v)
+                            output_fp = self.cache.save(
+                                v,
+                                fingerprint,
+                                graph.nodes[v]["config"],
+                                before,
+                            )
+                        # gli output dei nodi non in cache cambiano ad ogni run
+                        output_fingerprints[v] = (
+                            output_fp
+                            if output_fp is not None
+                            else uuid.uuid4().hex
+                        )
+                        graph.nodes[v]["visited"] = True
+                    except Exception as e:
+                        logger.error(f"Node {v} failed: {e!r}")
+                        errors.append(e)
+                        runs[v] = NodeRun(
+                            node=v,
+                            status="failed",
+                            end=time.time() - dag_start,
+                            error=repr(e),
+                            cache=cache_status.get(v),
+                        )
+                        if self.on_failure == "stop":
+                            # annullo tutti i nodi non ancora avviati,
+                            # compresi quelli che non diventeranno pronti
+                            active = set(running.values())
+                            cancel(
+                                u
+                                for u in nx.topological_sort(graph)
+                                if u not in active
+                            )
+                            ready = []
+                        else:
+                            cancel(nx.descendants(graph, v))
+                        continue
+                    complete(v)
+
+        shared_memory.clear_consumers(consumers)
+        self.timeline = sorted(
+            runs.values(),
+            key=lambda r: (r.start is None, r.start or 0, str(r.node)),
+        )
+        self.cache_report = {
+            str(v): status for v, status in cache_status.items()
+        }
+        if self.history is not None:
+            run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            self.history.record(run_id, self.timeline)
+        self.report()
+        if errors:
+            raise errors[0]
 
-        for v in to_visit:
-            self.task_graph.nodes[v]["in_queue"] = True
-        # bfs execution
-        while to_visit:
-            task = to_visit.pop(0)
-            run(task)
-            next_tasks = list(
-                list(self.task_graph.successors(task))
-                | where(
-                    lambda x: not (
-                        self.task_graph.nodes[x]["visited"]
-                        or self.task_graph.nodes[x]["in_queue"]
+    def report(self) -> None:
+        """Riporta la cronologia dell'ultima esecuzione del dag e,
+        se richiesto, la salva in formato json
+        """
+        for r in self.timeline:
+            info = "" if r.cache is None else f" (cache {r.cache})"
+            if r.pinned_memory is not None:
+                info += f", {r.pinned_memory / 2**20:.1f} MiB pinned"
+            if r.start is None:
+                logger.info(f"{r.node}: {r.status}{info}")
+            else:
+                logger.info(
+                    f"{r.node}: {r.status} [{r.start:.2f}s -> {r.end:.2f}s] "
+                    f"on {r.worker}{info}"
+                )
+        if self.history is not None:
+            logger.info(
+                "Critical path priorities: "
+                + ", ".join(
+                    f"{v}={p:.2f}s"
+                    for v, p in sorted(
+                        self.priorities.items(), key=lambda x: -x[1]
                     )
                 )
             )
-            # rimuovo i nodi con dipendenze non ancora eseguite
-            next_tasks = filter(
-                lambda x: all(
-                    [
-                        self.task_graph.nodes[v].get("visited", False)
-                        for v in self.task_graph.predecessors(x)
-                    ]
-                ),
-                next_tasks,
-            )
-
-            for v in next_tasks:
-                self.task_graph.nodes[v]["in_queue"] = True
-                to_visit.append(v)
+        shared_memory = SharedMemory()
+        if shared_memory.budget is not None:
+            logger.info(f"Shared memory spill: {shared_memory.spill_stats}")
+        if self.cache is not None:
+            hits = [v for v, s in self.cache_report.items() if s == "hit"]
+            misses = [v for v, s in self.cache_report.items() if s != "hit"]
+            logger.info(f"Cache hits: {hits}, misses: {misses}")
+        if self.timeline_path is not None:
+            with open(self.timeline_path, "w") as f:
+                json.dump([asdict(r) for r in self.timeline], f, indent=2)
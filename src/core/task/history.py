@@ -0,0 +1,231 @@
+"""
+Storico delle esecuzioni dei nodi del dag (durata e picco di memoria),
+usato per la schedulazione e per individuare le regressioni tra run
+"""
+import contextlib
+import os
+import resource
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+
+def current_rss() -> int:
+    """Resident set size del processo corrente, in byte"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss e' in kilobyte su linux: e' il massimo, non il valore corrente
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemory:
+    """Context manager che campiona la memoria residente del processo
+    e calcola il picco raggiunto rispetto all'ingresso nel blocco.
+    Con piu nodi in esecuzione nello stesso processo il picco
+    comprende anche la memoria allocata dagli altri nodi: il dag non
+    lo registra per i nodi eseguiti in thread insieme ad altri
+
+    Attributes:
+        interval (float): intervallo di campionamento in secondi
+        peak (int): picco di memoria in byte rispetto all'ingresso
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def sample(self) -> None:
+        self.peak = max(self.peak, current_rss() - self.baseline)
+
+    def __enter__(self):
+        self.baseline = current_rss()
+
+        def run():
+            while not self._stop.wait(self.interval):
+                self.sample()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, type, value, trace):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+@dataclass
+class RunHistory:
+    """Storico delle esecuzioni dei nodi in un database sqlite
+
+    Attributes:
+        path (str): path del database sqlite
+        window (int): numero di esecuzioni recenti usate per le stime
+    """
+
+    path: str
+    window: int = 5
+
+    def __post_init__(self) -> None:
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute(
+                """
+                create table if not exists node_runs (
+                    run_id text,
+                    node text,
+                    status text,
+                    start real,
+                    duration real,
+                    peak_memory integer,
+                    recorded_at real
+                )"""
+            )
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, run_id: str, runs: Iterable) -> None:
+        """Salva le esecuzioni dei nodi di un run del dag
+
+        Args:
+            run_id (str): identificativo del run
+            runs (Iterable[NodeRun]): esecuzioni dei nodi
+        """
+        now = time.time()
+        rows = [
+            (
+                run_id,
+                str(r.node),
+                r.status,
+                r.start,
+                r.duration,
+                r.peak_memory,
+                now,
+            )
+            for r in runs
+        ]
+        with self.connect() as conn:
+            conn.executemany(
+                "insert into node_runs values (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def estimates(
+        self, nodes: Iterable[Union[int, str]]
+    ) -> Dict[Union[int, str], Tuple[Optional[float], Optional[int]]]:
+        """Durata e picco di memoria medi delle ultime esecuzioni riuscite
+
+        Args:
+            nodes (Iterable[Union[int, str]]): nodi di cui stimare i costi
+
+        Returns:
+            Dict[Union[int, str], Tuple[Optional[float], Optional[int]]]:
+                per ogni nodo durata media in secondi e picco medio in byte,
+                None se il nodo non ha esecuzioni nello storico
+        """
+        result = {}
+        with self.connect() as conn:
+            for v in nodes:
+                row = conn.execute(
+                    """
+                    select avg(duration), avg(peak_memory), count(*)
+                    from (
+                        select duration, peak_memory
+                        from node_runs
+                        where node = ? and status = 'done'
+                        order by recorded_at desc
+                        limit ?
+                    )""",
+                    (str(v), self.window),
+                ).fetchone()
+                if row[2] == 0:
+                    result[v] = (None, None)
+                else:
+                    peak = None if row[1] is None else int(row[1])
+                    result[v] = (row[0], peak)
+        return result
+
+    def query(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+        """Esegue una query sullo storico (tabella node_runs)
+
+        Args:
+            sql (str): query da eseguire
+            params (tuple, optional): parametri della query. Defaults to ().
+
+        Returns:
+            pd.DataFrame: risultato della query
+        """
+        with self.connect() as conn:
+            return pd.read_sql(sql, conn, params=params)
+
+    def runs(self) -> List[str]:
+        """Identificativi dei run in ordine cronologico"""
+        df = self.query(
+            """
+            select run_id, min(recorded_at) as recorded_at
+            from node_runs
+            group by run_id
+            order by recorded_at"""
+        )
+        return list(df["run_id"])
+
+    def regressions(
+        self,
+        previous: Optional[str] = None,
+        current: Optional[str] = None,
+        ratio: float = 1.2,
+    ) -> pd.DataFrame:
+        """Nodi la cui durata o il cui picco di memoria sono aumentati
+        di almeno ratio volte tra due run
+
+        Args:
+            previous (Optional[str], optional): run di riferimento.
+                Se None viene usato il penultimo run.
+            current (Optional[str], optional): run da confrontare.
+                Se None viene usato l'ultimo run.
+            ratio (float, optional): rapporto minimo per considerare
+                un aumento una regressione. Defaults to 1.2.
+
+        Returns:
+            pd.DataFrame: nodi in regressione con durate e picchi dei due run
+        """
+        runs = self.runs()
+        if current is None:
+            current = runs[-1] if runs else None
+        if previous is None:
+            candidates = [r for r in runs if r != current]
+            previous = candidates[-1] if candidates else None
+        return self.query(
+            """
+            select a.node,
+                a.duration as previous_duration,
+                b.duration as current_duration,
+                b.duration / a.duration as duration_ratio,
+                a.peak_memory as previous_peak_memory,
+                b.peak_memory as current_peak_memory,
+                1.0 * b.peak_memory / a.peak_memory as memory_ratio
+            from node_runs a
+                join node_runs b on a.node = b.node
+            where a.run_id = ? and b.run_id = ?
+                and a.status = 'done' and b.status = 'done'
+                and ((a.duration > 0 and b.duration >= ? * a.duration)
+                    or (a.peak_memory > 0
+                        and b.peak_memory >= ? * a.peak_memory))
+            order by duration_ratio desc""",
+            (previous, current, ratio, ratio),
+        )
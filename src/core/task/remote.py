@@ -0,0 +1,484 @@
+"""
+Esecuzione distribuita: un coordinatore distribuisce i nodi del dag
+(o i batch di un task) ai worker, che possono girare su altri host.
+I worker si registrano sul coordinatore tramite socket, ricevono le
+funzioni da eseguire e restituiscono risultati e metriche.
+Se un worker termina o smette di rispondere il suo lavoro viene rimesso in coda
+
+La chiave condivisa (authkey o variabile d'ambiente TASK_AUTHKEY) e'
+obbligatoria: i lavori viaggiano serializzati con pickle, per cui chiunque
+possa connettersi al coordinatore potrebbe eseguire codice
+
+Per avviare un worker:
+    python -m src.core.task.remote --address host:port --authkey chiave
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import pickle
+import queue
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from src.core.transformer.base import pop_profile
+from src.core.util import loader
+from src.core.util.factory import Factory
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY_ENV = "TASK_AUTHKEY"
+
+
+class WorkerLost(Exception):
+    """Il lavoro e' stato rimesso in coda troppe volte"""
+
+
+class NoWorkers(Exception):
+    """Nessun worker attivo per eseguire i lavori in coda"""
+
+
+def resolve_authkey(authkey: Optional[str] = None) -> bytes:
+    """Chiave condivisa tra coordinatore e worker
+
+    Args:
+        authkey (Optional[str], optional): chiave esplicita. Defaults to
+            None (variabile d'ambiente TASK_AUTHKEY).
+
+    Raises:
+        ValueError: se la chiave non e' stata impostata
+
+    Returns:
+        bytes: chiave da usare per l'autenticazione delle connessioni
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError(
+            f"Remote execution requires an authkey: set {AUTHKEY_ENV} "
+            "or pass authkey"
+        )
+    return authkey.encode()
+
+
+def parse_address(
+    address: Union[str, Tuple[str, int], List]
+) -> Tuple[str, int]:
+    """Converte un indirizzo host:port nella coppia (host, port)"""
+    if isinstance(address, str):
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    host, port = address
+    return host, int(port)
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# transformer costruiti dal worker, indicizzati per configurazione
+_transformers: Dict[str, Any] = {}
+
+
+def transform_batch(
+    plugins: List[str], transformer_args: dict, data: Any
+) -> Tuple[Any, Dict[str, dict]]:
+    """Applica ad un batch il transformer descritto da transformer_args.
+    Il transformer viene costruito una sola volta per worker
+
+    Args:
+        plugins (List[str]): plugin da caricare nel worker
+        transformer_args (dict): configurazione del transformer
+        data (Any): batch da trasformare
+
+    Returns:
+        Tuple[Any, Dict[str, dict]]: batch trasformato e metriche degli step
+            del transformer (vedi Pipeline.pop_profile)
+    """
+    key = json.dumps(transformer_args, sort_keys=True, default=str)
+    if key not in _transformers:
+        loader.load_plugins(plugins)
+        _transformers[key] = Factory().create(copy.deepcopy(transformer_args))
+    transformer = _transformers[key]
+    return transformer(data), pop_profile(transformer)
+
+
+@dataclass
+class Job:
+    """Lavoro da eseguire su un worker
+
+    Attributes:
+        fn (Callable): funzione da eseguire, importabile dal worker
+        args (tuple): argomenti posizionali
+        kwargs (dict): argomenti per nome
+        future (Future): risultato del lavoro
+        attempts (int): numero di worker a cui il lavoro e' stato inviato
+    """
+
+    fn: Callable
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+
+
+class Coordinator(Executor):
+    """Executor che distribuisce i lavori ai worker registrati.
+    Puo' essere usato al posto di un ProcessPoolExecutor: submit
+    restituisce un Future completato quando il worker riporta il risultato
+
+    Attributes:
+        address (Tuple[str, int]): indirizzo su cui i worker si registrano
+        heartbeat_timeout (float): secondi di silenzio dopo cui un worker
+            viene considerato perso
+        worker_timeout (float, optional): secondi senza worker attivi dopo
+            cui i lavori in coda falliscono con NoWorkers
+        max_attempts (int): numero massimo di invii di uno stesso lavoro
+        workers (Dict[str, dict]): worker registrati e lavori completati
+        metrics (List[dict]): worker, durata e tentativi di ogni lavoro
+        stats (Dict[str, int]): lavori completati, rimessi in coda e worker persi
+    """
+
+    def __init__(
+        self,
+        address: Union[str, Tuple[str, int]] = ("127.0.0.1", 0),
+        authkey: Optional[str] = None,
+        heartbeat_timeout: float = 30.0,
+        max_attempts: int = 3,
+        worker_timeout: Optional[float] = 120.0,
+    ) -> None:
+        """Costruttore
+
+        Args:
+            address (Union[str, Tuple[str, int]], optional): indirizzo host:port
+                del coordinatore, porta 0 per sceglierne una libera.
+                Defaults to ("127.0.0.1", 0).
+            authkey (Optional[str], optional): chiave condivisa con i worker.
+                Defaults to la variabile d'ambiente TASK_AUTHKEY.
+            heartbeat_timeout (float, optional): secondi di silenzio dopo cui
+                un worker viene considerato perso. Defaults to 30.0.
+            max_attempts (int, optional): invii massimi di un lavoro. Defaults to 3.
+            worker_timeout (Optional[float], optional): secondi senza worker
+                attivi (mai registrati o tutti persi) dopo cui i lavori in coda
+                falliscono. None per attendere indefinitamente. Defaults to 120.0.
+        """
+        assert max_attempts >= 1, "max_attempts must be at least 1"
+        self.authkey = resolve_authkey(authkey)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.worker_timeout = worker_timeout
+        self.listener = Listener(parse_address(address), authkey=self.authkey)
+        self.address = self.listener.address
+        self.jobs: queue.Queue = queue.Queue()
+        self.workers: Dict[str, dict] = {}
+        self.metrics: List[dict] = []
+        self.stats = {"completed": 0, "requeued": 0, "lost_workers": 0}
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._accept_thread = threading.Thread(
+            target=self._accept, name="coordinator", daemon=True
+        )
+        self._accept_thread.start()
+        self._watch_thread = threading.Thread(
+            target=self._watch, name="coordinator-watch", daemon=True
+        )
+        self._watch_thread.start()
+        logger.info(f"Coordinator listening on {self.address}")
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if self._closed.is_set():
+            raise RuntimeError("cannot submit after shutdown")
+        job = Job(fn, args, kwargs)
+        with self._lock:
+            self._futures.append(job.future)
+        self.jobs.put(job)
+        return job.future
+
+    def wait_for_workers(
+        self, n: int = 1, timeout: Optional[float] = None
+    ) -> bool:
+        """Attende che almeno n worker siano registrati
+
+        Args:
+            n (int, optional): numero di worker. Defaults to 1.
+            timeout (Optional[float], optional): secondi di attesa massima.
+                Defaults to None.
+
+        Returns:
+            bool: True se i worker si sono registrati entro il timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.num_alive() < n:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def num_alive(self) -> int:
+        with self._lock:
+            return sum(w["alive"] for w in self.workers.values())
+
+    def shutdown(
+        self, wait: bool = True, *, cancel_futures: bool = False
+    ) -> None:
+        if cancel_futures:
+            with self._lock:
+                for f in self._futures:
+                    f.cancel()
+        if wait:
+            for f in list(self._futures):
+                if not f.cancelled():
+                    f.exception()
+        self._closed.set()
+        # sblocca accept con una connessione fittizia
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._accept_thread.join()
+        self._watch_thread.join()
+        for t in self._threads:
+            t.join()
+        self.listener.close()
+        # lavori mai eseguiti perche' non ci sono piu worker
+        self._fail_queued(RuntimeError("coordinator shut down"))
+        logger.info(f"Coordinator stats: {self.stats}")
+
+    def _fail(self, job: Job, error: BaseException) -> None:
+        # i lavori mai inviati sono ancora in stato pending
+        if job.attempts == 0 and not job.future.set_running_or_notify_cancel():
+            return
+        if not job.future.done():
+            job.future.set_exception(error)
+
+    def _fail_queued(self, error: BaseException) -> None:
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            self._fail(job, error)
+
+    def _watch(self) -> None:
+        """Fa fallire i lavori in coda se per worker_timeout secondi
+        non ci sono worker attivi, invece di attendere per sempre"""
+        idle_since = None
+        while not self._closed.wait(0.1):
+            if self.worker_timeout is None:
+                return
+            if self.num_alive() > 0 or self.jobs.empty():
+                idle_since = None
+                continue
+            if idle_since is None:
+                idle_since = time.time()
+            elif time.time() - idle_since > self.worker_timeout:
+                logger.error(
+                    f"No workers registered for {self.worker_timeout}s"
+                )
+                self._fail_queued(
+                    NoWorkers(
+                        f"no active workers on {self.address} "
+                        f"for {self.worker_timeout}s"
+                    )
+                )
+                idle_since = None
+
+    def _accept(self) -> None:
+        while not self._closed.is_set():
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                if not self._closed.is_set():
+                    logger.warning(f"Rejected worker connection: {e!r}")
+                continue
+            if self._closed.is_set():
+                conn.close()
+                return
+            t = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _requeue(self, job: Job, worker: str, reason: str) -> None:
+        with self._lock:
+            self.workers[worker]["alive"] = False
+            self.stats["lost_workers"] += 1
+        logger.warning(f"Worker {worker} lost ({reason})")
+        if job.attempts >= self.max_attempts:
+            self._fail(
+                job, WorkerLost(f"job {job.id} lost {job.attempts} workers")
+            )
+            return
+        with self._lock:
+            self.stats["requeued"] += 1
+        self.jobs.put(job)
+
+    def _serve(self, conn: Connection) -> None:
+        """Invia i lavori in coda ad un worker finche' il worker
+        e' attivo e il coordinatore non viene chiuso"""
+        try:
+            hello = conn.recv()
+            name, host = hello["worker"], hello["host"]
+        except Exception as e:
+            # connessione chiusa o registrazione non valida
+            if not self._closed.is_set():
+                logger.warning(f"Invalid worker registration: {e!r}")
+            conn.close()
+            return
+        with self._lock:
+            self.workers[name] = {"host": host, "jobs": 0, "alive": True}
+        logger.info(f"Worker {name} registered")
+
+        while not self._closed.is_set():
+            try:
+                job = self.jobs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if (
+                job.attempts == 0
+                and not job.future.set_running_or_notify_cancel()
+            ):
+                continue
+            try:
+                payload = pickle.dumps((job.fn, job.args, job.kwargs))
+            except Exception as e:
+                job.future.set_exception(e)
+                continue
+            job.attempts += 1
+            try:
+                conn.send(("run", job.id, payload))
+                while True:
+                    if not conn.poll(self.heartbeat_timeout):
+                        raise TimeoutError("heartbeat timeout")
+                    data = conn.recv_bytes()
+                    try:
+                        message = pickle.loads(data)
+                        if message[0] == "heartbeat":
+                            continue
+                        _, _, ok, value, metrics = message
+                        metrics = dict(metrics)
+                    except Exception as e:
+                        # il messaggio e' arrivato per intero: il worker
+                        # resta utilizzabile, fallisce soltanto il lavoro
+                        logger.error(f"Invalid result from {name}: {e!r}")
+                        ok, value = False, RuntimeError(
+                            f"Cannot unpickle the result of job {job.id}: "
+                            f"{e!r}"
+                        )
+                        metrics = {"worker": name}
+                    break
+            except (OSError, EOFError, TimeoutError) as e:
+                conn.close()
+                self._requeue(job, name, repr(e))
+                return
+
+            metrics.update(
+                job=job.id,
+                fn=getattr(job.fn, "__name__", repr(job.fn)),
+                attempts=job.attempts,
+            )
+            with self._lock:
+                self.metrics.append(metrics)
+                self.workers[name]["jobs"] += 1
+                self.stats["completed"] += 1
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+
+        try:
+            conn.send(("stop",))
+        except OSError:
+            pass
+        conn.close()
+
+
+def run_worker(
+    address: Union[str, Tuple[str, int]],
+    authkey: Optional[str] = None,
+    heartbeat_interval: float = 5.0,
+    connect_timeout: float = 60.0,
+) -> None:
+    """Registra il processo corrente come worker del coordinatore
+    ed esegue i lavori ricevuti finche' il coordinatore non lo ferma
+
+    Args:
+        address (Union[str, Tuple[str, int]]): indirizzo del coordinatore
+        authkey (Optional[str], optional): chiave condivisa con il
+            coordinatore. Defaults to la variabile d'ambiente TASK_AUTHKEY.
+        heartbeat_interval (float, optional): secondi tra due heartbeat
+            inviati durante l'esecuzione di un lavoro. Defaults to 5.0.
+        connect_timeout (float, optional): secondi di attesa dell'avvio
+            del coordinatore. Defaults to 60.0.
+    """
+    key = resolve_authkey(authkey)
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            conn = Client(parse_address(address), authkey=key)
+            break
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+    name = worker_name()
+    conn.send({"worker": name, "host": socket.gethostname()})
+    lock = threading.Lock()
+
+    def heartbeat(stop: threading.Event) -> None:
+        while not stop.wait(heartbeat_interval):
+            with lock:
+                conn.send(("heartbeat",))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (OSError, EOFError):
+            break
+        if message[0] == "stop":
+            break
+        _, job_id, payload = message
+        stop = threading.Event()
+        beat = threading.Thread(target=heartbeat, args=(stop,), daemon=True)
+        beat.start()
+        start = time.perf_counter()
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            value, ok = fn(*args, **kwargs), True
+        except Exception as e:
+            value, ok = e, False
+        stop.set()
+        beat.join()
+        metrics = {"worker": name, "duration": time.perf_counter() - start}
+        try:
+            result = pickle.dumps(("result", job_id, ok, value, metrics))
+        except Exception as e:
+            error = RuntimeError(f"Unpicklable result: {e!r}")
+            result = pickle.dumps(("result", job_id, False, error, metrics))
+        with lock:
+            conn.send_bytes(result)
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker del coordinatore")
+    parser.add_argument("--address", required=True, help="host:port")
+    parser.add_argument(
+        "--authkey", default=None, help=f"Defaults to ${AUTHKEY_ENV}"
+    )
+    parser.add_argument("--heartbeat", type=float, default=5.0)
+    parser.add_argument("--connect-timeout", type=float, default=60.0)
+    cli = parser.parse_args()
+    if not (cli.authkey or os.environ.get(AUTHKEY_ENV)):
+        parser.error(f"--authkey or {AUTHKEY_ENV} is required")
+    logging.basicConfig(level=logging.INFO)
+    run_worker(cli.address, cli.authkey, cli.heartbeat, cli.connect_timeout)
@@ -0,0 +1,160 @@
+"""
+Trasporto dei batch tra il processo principale del task
+e i processi worker del pool
+"""
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+import pyarrow as pa
+from pandas import DataFrame
+
+from src.core.util.frames import nested_columns
+
+logger = logging.getLogger(__name__)
+
+# directory di default per i segmenti di memoria condivisa (tmpfs su linux)
+SHM_DIR = "/dev/shm"
+
+
+@dataclass(frozen=True)
+class ArrowHandle:
+    """Riferimento ad un dataframe salvato come file Arrow IPC
+    in memoria condivisa. E' l'unico oggetto che attraversa la pipe del pool
+
+    Attributes:
+        path (str): path del file Arrow IPC
+        nbytes (int): dimensione del file
+    """
+
+    path: str
+    nbytes: int
+
+
+class Transport:
+    """Trasporto di default: i batch vengono serializzati con pickle
+    dal pool di processi"""
+
+    def pack(
+        self, data: Union[DataFrame, List[DataFrame]]
+    ) -> Union[Any, List[Any]]:
+        """Prepara il dato da inviare all'altro processo
+
+        Args:
+            data (Union[DataFrame, List[DataFrame]]): dataframe o lista di dataframe
+
+        Returns:
+            Union[Any, List[Any]]: oggetto da inviare attraverso la pipe
+        """
+        return data
+
+    def unpack(
+        self, data: Union[Any, List[Any]]
+    ) -> Union[DataFrame, List[DataFrame]]:
+        """Ricostruisce il dato ricevuto dall'altro processo
+
+        Args:
+            data (Union[Any, List[Any]]): oggetto ricevuto dalla pipe
+
+        Returns:
+            Union[DataFrame, List[DataFrame]]: dataframe o lista di dataframe
+        """
+        return data
+
+    def close(self) -> None:
+        """Rilascia le risorse del trasporto"""
+
+
+@dataclass
+class ArrowTransport(Transport):
+    """Trasporto che scrive le colonne dei dataframe come buffer Arrow
+    in file di memoria condivisa e invia soltanto un ArrowHandle.
+    Il ricevente mappa il file in memoria, lo converte in dataframe
+    (con una sola copia, al posto della serializzazione e della pipe
+    di pickle) e lo rimuove subito dopo averlo letto.
+    I dataframe con colonne annidate (liste, dizionari) o con tipi non
+    rappresentabili in Arrow vengono inviati con pickle
+
+    Attributes:
+        directory (str, optional): directory in cui creare i segmenti.
+            Se None ne viene creata una nuova, rimossa con close()
+        stats (Dict[str, int]): numero di batch e byte inviati via Arrow
+            e numero di batch inviati con pickle
+    """
+
+    directory: Optional[str] = None
+    stats: Dict[str, int] = field(
+        default_factory=lambda: {"arrow": 0, "arrow_bytes": 0, "pickle": 0}
+    )
+
+    def __post_init__(self) -> None:
+        # solo il proprietario della directory la rimuove in close()
+        self.owner = self.directory is None
+        if self.owner:
+            base_dir = SHM_DIR if os.path.isdir(SHM_DIR) else None
+            self.directory = tempfile.mkdtemp(prefix="task-", dir=base_dir)
+
+    def pack(self, data):
+        if isinstance(data, list):
+            return [self.pack(x) for x in data]
+        if not isinstance(data, DataFrame):
+            return data
+        nested = nested_columns(data)
+        if nested:
+            # Arrow le convertirebbe in ndarray e struct
+            logger.debug(f"Nested columns {nested}, pickling")
+            self.stats["pickle"] += 1
+            return data
+        try:
+            table = pa.Table.from_pandas(data)
+        except (pa.ArrowException, ValueError, TypeError) as e:
+            logger.debug(f"Arrow transport not available ({e}), pickling")
+            self.stats["pickle"] += 1
+            return data
+
+        path = os.path.join(self.directory, f"{uuid.uuid4().hex}.arrow")
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        nbytes = os.path.getsize(path)
+        self.stats["arrow"] += 1
+        self.stats["arrow_bytes"] += nbytes
+        return ArrowHandle(path, nbytes)
+
+    def unpack(self, data):
+        if isinstance(data, list):
+            return [self.unpack(x) for x in data]
+        if not isinstance(data, ArrowHandle):
+            return data
+        source = pa.memory_map(data.path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        # il mapping resta valido finche' esistono riferimenti ai buffer
+        os.unlink(data.path)
+        # to_pandas copia le colonne: il dataframe resta scrivibile
+        return table.to_pandas()
+
+    def close(self) -> None:
+        if self.owner and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def create_transport(name: str, directory: Optional[str] = None) -> Transport:
+    """Istanzia il trasporto a partire dal suo nome
+
+    Args:
+        name (str): pickle oppure arrow
+        directory (Optional[str], optional): directory dei segmenti
+            del trasporto arrow. Defaults to None.
+
+    Returns:
+        Transport: trasporto richiesto
+    """
+    if name == "pickle":
+        return Transport()
+    if name == "arrow":
+        return ArrowTransport(directory=directory)
+    raise ValueError(f"Unknown transport: {name}")
@@ -3,23 +3,331 @@ Definizione dell' interfaccia comune ad ogni transformer
 e definizione della classe pipeline
 """
 
+import copy
+import logging
+import os
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from dataclasses import asdict, dataclass
 from enum import Enum, auto
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import pandas as pd
-from tqdm import tqdm
 
 import src.core.util.behaviors as bh
+from src.core.util import loader
 from src.core.util.factory import Factory
+from src.core.util.predicates import Predicate
+
+logger = logging.getLogger(__name__)
+
+# transformer dei rami di una pipeline PARALLEL, costruiti una sola volta
+# in ogni processo del pool
+_worker_branches: List[Any] = []
+
+
+def init_branches(plugins: List[str], transformers_args: List[dict]) -> None:
+    """Initializer dei processi del pool di una pipeline PARALLEL: carica
+    i plugin e costruisce i transformer dalla loro configurazione
+
+    Args:
+        plugins (List[str]): plugin da caricare nel worker
+        transformers_args (List[dict]): configurazione dei transformer
+    """
+    global _worker_branches
+    loader.load_plugins(plugins)
+    factory = Factory()
+    _worker_branches = []
+    for t_args in transformers_args:
+        t_args = copy.deepcopy(t_args)
+        partitionable = t_args.pop("partitionable", None)
+        transformer = factory.create(t_args)
+        if partitionable is not None:
+            transformer.partitionable = partitionable
+        _worker_branches.append(transformer)
+
+
+def frame_size(data: Any) -> Tuple[int, int, int]:
+    """Righe, colonne e byte (senza contare il contenuto degli oggetti
+    python) di un dataframe, di una serie o di una lista di dataframe"""
+    if isinstance(data, pd.DataFrame):
+        return (
+            len(data),
+            len(data.columns),
+            int(data.memory_usage(index=True, deep=False).sum()),
+        )
+    if isinstance(data, pd.Series):
+        return len(data), 1, int(data.memory_usage(index=True, deep=False))
+    if isinstance(data, list):
+        sizes = [frame_size(x) for x in data]
+        return tuple(sum(x) for x in zip(*sizes)) if sizes else (0, 0, 0)
+    return 0, 0, 0
+
+
+def measure(transformer: Any, data: Any) -> Tuple[Any, dict]:
+    """Esegue un transformer e ne misura tempi e dimensioni di input e output
+
+    Args:
+        transformer (Any): transformer da eseguire
+        data (Any): input del transformer
+
+    Returns:
+        Tuple[Any, dict]: risultato e metriche dell'esecuzione
+    """
+    rows_in, columns_in, bytes_in = frame_size(data)
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    result = transformer(data)
+    cpu_time = time.thread_time() - cpu_start
+    duration = time.perf_counter() - start
+    rows_out, columns_out, bytes_out = frame_size(result)
+    extra = (
+        transformer.pop_metrics()
+        if isinstance(transformer, BaseTransformer)
+        else {}
+    )
+    return result, {
+        "duration": duration,
+        "cpu_time": cpu_time,
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "columns_in": columns_in,
+        "columns_out": columns_out,
+        "memory_delta": bytes_out - bytes_in,
+        "worker": f"{os.getpid()}/{threading.current_thread().name}",
+        **extra,
+    }
+
+
+def run_branch(transformer: Any, data: pd.DataFrame) -> Tuple[Any, dict]:
+    """Esegue un ramo della pipeline e ne misura durata e dimensioni
+
+    Args:
+        transformer (Any): transformer del ramo
+        data (pd.DataFrame): dataframe in input
+
+    Returns:
+        Tuple[Any, dict]: risultato del ramo e informazioni sull'esecuzione
+    """
+    return measure(transformer, data)
+
+
+def run_worker_branch(pos: int, data: pd.DataFrame) -> Tuple[Any, dict]:
+    return run_branch(_worker_branches[pos], data)
+
+
+def transformer_name(transformer: Any) -> str:
+    if hasattr(transformer, "func"):
+        return f"{transformer.func.__module__}.{transformer.func.__name__}"
+    if not isinstance(transformer, BaseTransformer):
+        return str(transformer)
+    return transformer.__class__.__name__
+
+
+@dataclass
+class StepProfile:
+    """Metriche di uno step della pipeline, sommate su tutti i batch
+
+    Attributes:
+        name (str): posizione e nome del transformer
+        calls (int): batch elaborati
+        wall_time (float): tempo trascorso in secondi
+        cpu_time (float): tempo di cpu del thread in secondi
+        rows_in (int): righe in input
+        rows_out (int): righe in output
+        columns_in (int): numero massimo di colonne in input
+        columns_out (int): numero massimo di colonne in output
+        memory_delta (int): differenza in byte tra output e input
+        compile_time (float): tempo di compilazione delle espressioni
+        eval_time (float): tempo di valutazione delle espressioni
+    """
+
+    name: str
+    calls: int = 0
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    columns_in: int = 0
+    columns_out: int = 0
+    memory_delta: int = 0
+    compile_time: float = 0.0
+    eval_time: float = 0.0
+
+    def add(self, metrics: dict) -> None:
+        """Aggiunge le metriche di un batch (prodotte da measure) o di
+        un altro profilo (prodotte da asdict)"""
+        self.calls += metrics.get("calls", 1)
+        self.wall_time += metrics.get(
+            "wall_time", metrics.get("duration", 0.0)
+        )
+        self.cpu_time += metrics["cpu_time"]
+        self.rows_in += metrics["rows_in"]
+        self.rows_out += metrics["rows_out"]
+        self.columns_in = max(self.columns_in, metrics["columns_in"])
+        self.columns_out = max(self.columns_out, metrics["columns_out"])
+        self.memory_delta += metrics["memory_delta"]
+        self.compile_time += metrics.get("compile_time", 0.0)
+        self.eval_time += metrics.get("eval_time", 0.0)
+
+
+def merge_profiles(
+    target: Dict[str, dict], source: Dict[str, dict]
+) -> Dict[str, dict]:
+    """Somma in target i profili in source (ad esempio quelli dei worker)
+
+    Args:
+        target (Dict[str, dict]): profili per step, modificati sul posto
+        source (Dict[str, dict]): profili per step da aggiungere
+
+    Returns:
+        Dict[str, dict]: target
+    """
+    for name, metrics in source.items():
+        profile = StepProfile(**target.get(name, {"name": name}))
+        profile.add(metrics)
+        target[name] = asdict(profile)
+    return target
+
+
+def pop_profile(transformer: Any) -> Dict[str, dict]:
+    """Restituisce e azzera i profili raccolti da una pipeline.
+    Gli altri transformer non raccolgono profili"""
+    if isinstance(transformer, Pipeline):
+        return transformer.pop_profile()
+    return {}
+
+
+def is_partitionable(
+    transformer: Any, key: Optional[List[str]] = None
+) -> bool:
+    """Verifica se un transformer puo essere applicato separatamente
+    a partizioni disgiunte di un dataframe, concatenando poi i risultati.
+    Il valore dichiarato in configurazione (chiave partitionable) ha la
+    precedenza su quello rilevato dal transformer stesso.
+    Le funzioni registrate nella factory non sono considerate partizionabili
+    a meno che non lo dichiarino
+
+    Args:
+        transformer (Any): transformer o funzione da verificare
+        key (Optional[List[str]], optional): colonne su cui sono state
+            calcolate le partizioni hash. None se le partizioni sono
+            blocchi di righe. Defaults to None.
+
+    Returns:
+        bool: True se il transformer e' partizionabile
+    """
+    declared = getattr(transformer, "partitionable", None)
+    if declared is not None:
+        return declared
+    if isinstance(transformer, BaseTransformer):
+        return transformer.check_partitionable(key)
+    return False
+
+
+def required_columns(
+    transformer: Any, output: Optional[Set[str]] = None
+) -> Optional[Set[str]]:
+    """Colonne del dataframe in input da cui dipendono le colonne output
+    del risultato di un transformer. Le funzioni registrate nella factory
+    possono usare qualsiasi colonna
+
+    Args:
+        transformer (Any): transformer o funzione da analizzare
+        output (Optional[Set[str]], optional): colonne del risultato
+            utilizzate a valle. None se servono tutte. Defaults to None.
+
+    Returns:
+        Optional[Set[str]]: colonne necessarie in input, None se servono
+            (o potrebbero servire) tutte
+    """
+    if isinstance(transformer, BaseTransformer):
+        return transformer.required_columns(output)
+    return None
+
+
+def leading_predicates(transformer: Any) -> List[Predicate]:
+    """Predicati dei filtri con cui inizia un transformer, applicabili
+    dal reader prima della trasformazione
+
+    Args:
+        transformer (Any): transformer o funzione da analizzare
+
+    Returns:
+        List[Predicate]: predicati in congiunzione, vuota se il
+            transformer non inizia con un filtro riconosciuto
+    """
+    if isinstance(transformer, BaseTransformer):
+        return transformer.predicates() or []
+    return []
 
 
 class BaseTransformer(ABC):
     """Base class per ogni oggetto transfomer"""
 
+    # valore dichiarato in configurazione, None se deve essere rilevato
+    partitionable: Optional[bool] = None
+
     def __call__(self, data: pd.DataFrame, **kwargs) -> pd.DataFrame:
         return self.transform(data, **kwargs)
 
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        """Rileva se la trasformazione opera riga per riga (o per gruppi
+        interamente contenuti in una partizione hash su key).
+        Le classi eredi lo ridefiniscono; di default la trasformazione
+        viene considerata globale
+
+        Args:
+            key (Optional[List[str]], optional): colonne delle partizioni hash.
+                Defaults to None.
+
+        Returns:
+            bool: True se la trasformazione e' partizionabile
+        """
+        return False
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        """Colonne in input necessarie a produrre le colonne output.
+        Le classi eredi lo ridefiniscono; di default la trasformazione
+        puo' dipendere da tutte le colonne
+
+        Args:
+            output (Optional[Set[str]], optional): colonne del risultato
+                utilizzate a valle, None se servono tutte. Defaults to None.
+
+        Returns:
+            Optional[Set[str]]: colonne necessarie, None se tutte
+        """
+        return None
+
+    def predicates(self) -> Optional[List[Predicate]]:
+        """Predicati semplici con cui la trasformazione filtra le righe.
+        Le classi eredi lo ridefiniscono se la trasformazione si limita
+        a filtrare le righe, senza modificarne i valori
+
+        Returns:
+            Optional[List[Predicate]]: predicati del filtro (vuota se non
+                riconosciuti), None se la trasformazione modifica le righe
+        """
+        return None
+
+    def pop_metrics(self) -> Dict[str, float]:
+        """Metriche specifiche del transformer (ad esempio i tempi delle
+        espressioni compilate), raccolte dopo ogni batch e poi azzerate
+
+        Returns:
+            Dict[str, float]: metriche da aggiungere a quelle di measure
+        """
+        return {}
+
     @abstractmethod
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
         """Metodo astratto in cui definire le trasformazioni di ogni
@@ -39,6 +347,17 @@ class Pipeline(BaseTransformer):
         mode (Mode): modalita di esecuzione. Se 1 le trasformazioni vengono eseguite in parallelo
             (ovvero il dataframe in ingresso al meotodo transform viene dato in input a tutte le trasformazioni successive).
             Se 2 l'applicazione delle trasformazioni avviene in pipeline (l'output dello step n diventa l'input dello step n+1)
+        workers (int): rami eseguiti contemporaneamente in modalita PARALLEL
+        executor (str): thread oppure process. I thread sono adatti alle
+            operazioni pandas che rilasciano il GIL, i processi ai transformer
+            in puro Python; in quel caso i transformer vengono ricostruiti
+            dalla configurazione una sola volta per processo
+        branch_stats (List[dict]): durata e worker di ogni ramo dell'ultima
+            esecuzione in modalita PARALLEL
+        lazy (bool): in modalita CASCADE, esegue le sequenze di transformer
+            supportati come un'unica query duckdb (vedi transformer.lazy)
+        profile (Dict[str, StepProfile]): metriche di ogni step, sommate sui
+            batch elaborati dall'ultima chiamata a pop_profile
 
     """
 
@@ -56,14 +375,31 @@ class Pipeline(BaseTransformer):
         transformers: List[dict],
         behaviors: Optional[Union[dict, List[dict]]] = None,
         mode=2,
+        workers: int = 1,
+        executor: str = "thread",
+        lazy: bool = False,
     ):
+        assert executor in (
+            "thread",
+            "process",
+        ), f"Unknown executor {executor}"
         factory = Factory()
         # rimuovo i transformer con debug.ignore = True
         self.transformers = []
+        # configurazione dei transformer istanziati, allineata a self.transformers
+        self.transformers_args: List[dict] = []
         for t in transformers:
             to_ignore = t.pop("debug.ignore", False)
+            partitionable = t.pop("partitionable", None)
             if not to_ignore:
-                self.transformers.append(factory.create(t))
+                transformer = factory.create(t)
+                if partitionable is not None:
+                    transformer.partitionable = partitionable
+                self.transformers.append(transformer)
+                t_args = copy.deepcopy(t)
+                if partitionable is not None:
+                    t_args["partitionable"] = partitionable
+                self.transformers_args.append(t_args)
 
         self.bh_manager = (
             None
@@ -71,22 +407,147 @@ class Pipeline(BaseTransformer):
             else bh.BehaviorManager(behaviors=behaviors)
         )
         self.mode = Pipeline.Mode(mode)
+        self.workers = workers
+        self.executor = executor
+        self.branch_stats: List[Dict[str, Any]] = []
+        self._pool: Optional[Executor] = None
+        self.profile: Dict[str, StepProfile] = {}
+        self.lazy = lazy
+        # transformer e segmenti lazy eseguiti in modalita CASCADE
+        self.stages: List[Any] = self.transformers
+        if lazy and self.mode == Pipeline.Mode.CASCADE:
+            # import locale: duckdb serve soltanto in modalita lazy
+            from src.core.transformer.lazy import build_stages
 
-    def transform(self, data, **kwargs):
-        def get_name(trans):
-            if hasattr(trans, "func"):
-                return f"{trans.func.__module__}.{trans.func.__name__}"
+            self.stages = build_stages(self.transformers)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # il pool appartiene al processo che lo ha creato
+        state["_pool"] = None
+        return state
+
+    def get_pool(self) -> Executor:
+        """Pool dei rami, creato alla prima esecuzione e riutilizzato
+        per i batch successivi"""
+        if self._pool is None:
+            if self.executor == "process":
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    initializer=init_branches,
+                    initargs=(loader.loaded_plugins(), self.transformers_args),
+                )
             else:
-                return trans.__class__.__name__
+                self._pool = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="pipeline"
+                )
+            weakref.finalize(self, self._pool.shutdown)
+        return self._pool
 
-        pbar = tqdm(
-            self.transformers, desc="Transformer", leave=True, position=0
-        )
+    def run_parallel(self, data: pd.DataFrame) -> List[Any]:
+        """Esegue i rami della pipeline sullo stesso dataframe, sul pool
+        se workers > 1, e restituisce i risultati nell'ordine di dichiarazione
+
+        Args:
+            data (pd.DataFrame): dataframe in input a tutti i rami
+
+        Returns:
+            List[Any]: risultato di ogni ramo
+        """
+        if self.workers > 1:
+            pool = self.get_pool()
+            if self.executor == "process":
+                futures = [
+                    pool.submit(run_worker_branch, pos, data)
+                    for pos in range(len(self.transformers))
+                ]
+            else:
+                futures = [
+                    pool.submit(run_branch, t, data) for t in self.transformers
+                ]
+            results = [f.result() for f in futures]
+        else:
+            results = [run_branch(t, data) for t in self.transformers]
+
+        self.branch_stats = [
+            {"transformer": transformer_name(t), **info}
+            for t, (_, info) in zip(self.transformers, results)
+        ]
+        for pos, (t, (_, info)) in enumerate(zip(self.transformers, results)):
+            self.record(pos, t, info)
+        for stats in self.branch_stats:
+            logger.debug(
+                f"Branch {stats['transformer']}: {stats['duration']:.3f}s "
+                f"on {stats['worker']}"
+            )
+        return [result for result, _ in results]
+
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        if self.mode == Pipeline.Mode.PARALLEL:
+            return False
+        return self.split(key) == len(self.transformers)
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        if self.mode == Pipeline.Mode.CASCADE:
+            # le colonne necessarie a ogni step sono l'output del precedente
+            for t in reversed(self.transformers):
+                output = required_columns(t, output)
+            return output
+        if output is not None and self.bh_manager is not None:
+            # merge e concat dei rami possono usare tutte le colonne
+            output = None
+        columns: Set[str] = set()
+        for t in self.transformers:
+            branch = required_columns(t, output)
+            if branch is None:
+                return None
+            columns |= branch
+        return columns
+
+    def predicates(self) -> Optional[List[Predicate]]:
         if self.mode == Pipeline.Mode.PARALLEL:
-            dfs = []
-            for t in pbar:
-                pbar.set_description(f"Transformer: {get_name(t)}")
-                dfs.append(t(data))
+            return None
+        # i filtri su valori costanti commutano tra loro: valgono tutti
+        # quelli che precedono la prima trasformazione che modifica le righe.
+        # Gli aggregati (col == col.max()) invece pandas li calcola sulle
+        # righe mantenute dai filtri precedenti, il reader sull'intera
+        # sorgente: vengono spinti soltanto dal primo step, insieme ai soli
+        # predicati della stessa query
+        predicates: List[Predicate] = []
+        for pos, t in enumerate(self.transformers):
+            step = t.predicates() if isinstance(t, BaseTransformer) else None
+            if step is None:
+                return predicates
+            if any(p.aggregate for p in step):
+                return step if pos == 0 else predicates
+            predicates.extend(step)
+        return predicates
+
+    def split(self, key: Optional[List[str]] = None) -> int:
+        """Restituisce la posizione del primo transformer non partizionabile
+        della pipeline: i transformer precedenti possono essere eseguiti
+        in parallelo sulle partizioni, i successivi devono essere applicati
+        al risultato ricombinato
+
+        Args:
+            key (Optional[List[str]], optional): colonne delle partizioni hash.
+                Defaults to None.
+
+        Returns:
+            int: indice del primo transformer non partizionabile
+        """
+        if self.mode == Pipeline.Mode.PARALLEL:
+            return 0
+        for i, t in enumerate(self.transformers):
+            if not is_partitionable(t, key):
+                return i
+        return len(self.transformers)
+
+    def transform(self, data, **kwargs):
+        if self.mode == Pipeline.Mode.PARALLEL:
+            dfs = self.run_parallel(data)
 
             # valuto la necessita di eseguire operazioni di
             # merging e d concatenazione
@@ -95,7 +556,29 @@ class Pipeline(BaseTransformer):
             return dfs
 
         else:
-            for t in pbar:
-                pbar.set_description(f"Transformer: {get_name(t)}")
-                data = t(data)
+            for pos, t in enumerate(self.stages):
+                data, metrics = measure(t, data)
+                self.record(pos, t, metrics)
             return data
+
+    def record(self, pos: int, transformer: Any, metrics: dict) -> None:
+        """Aggiunge al profilo dello step le metriche di un batch"""
+        name = f"{pos}:{transformer_name(transformer)}"
+        if name not in self.profile:
+            self.profile[name] = StepProfile(name)
+        self.profile[name].add(metrics)
+        logger.debug(
+            f"Transformer {name}: {metrics['duration']:.3f}s, "
+            f"{metrics['rows_in']} -> {metrics['rows_out']} rows"
+        )
+
+    def pop_profile(self) -> Dict[str, dict]:
+        """Restituisce le metriche raccolte, come dizionari, e le azzera.
+        I worker le inviano al processo principale dopo ogni batch
+
+        Returns:
+            Dict[str, dict]: metriche per step, nell'ordine della pipeline
+        """
+        profile = {name: asdict(p) for name, p in self.profile.items()}
+        self.profile = {}
+        return profile
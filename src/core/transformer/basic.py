@@ -1,8 +1,90 @@
-from typing import List, Optional, Union
+import ast
+import functools
+import re
+import time
+from typing import Callable, Dict, List, Optional, Set, Union
 
+import numpy as np
 import pandas as pd
 
 from src.core.transformer.base import BaseTransformer
+from src.core.transformer.expressions import ExpressionPlan
+from src.core.util.predicates import Predicate, parse_predicates
+
+# chiamata a funzione (f(...)) o accesso ad attributo (col.max) in una espressione
+CALL_OR_ATTRIBUTE = re.compile(r"[\w\])]\s*\(|[A-Za-z_\])]\s*\.\s*[A-Za-z_]")
+
+
+def expression_names(expression: Union[str, ast.AST]) -> Optional[Set[str]]:
+    """Nomi delle colonne citate in una espressione di eval o query.
+    I nomi delle funzioni chiamate non sono considerati colonne
+
+    Args:
+        expression (Union[str, ast.AST]): espressione da analizzare
+
+    Returns:
+        Optional[Set[str]]: colonne citate, None se l'espressione non e'
+            python valido (ad esempio nomi tra backtick o variabili locali con @)
+    """
+    if isinstance(expression, str):
+        try:
+            expression = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError:
+            return None
+    functions = {
+        id(node.func)
+        for node in ast.walk(expression)
+        if isinstance(node, ast.Call)
+    }
+    return {
+        node.id
+        for node in ast.walk(expression)
+        if isinstance(node, ast.Name) and id(node) not in functions
+    }
+
+
+def eval_columns(
+    expression: str, output: Optional[Set[str]]
+) -> Optional[Set[str]]:
+    """Colonne necessarie a DataFrame.eval: le assegnazioni (una per riga)
+    vengono analizzate a ritroso, per cui le colonne create dall'espressione
+    non sono richieste in input
+
+    Args:
+        expression (str): espressione di eval
+        output (Optional[Set[str]]): colonne del risultato utilizzate a valle
+
+    Returns:
+        Optional[Set[str]]: colonne necessarie, None se tutte
+    """
+    lines = [line.strip() for line in expression.splitlines() if line.strip()]
+    required = output
+    for line in reversed(lines):
+        try:
+            node = ast.parse(line).body[0]
+        except SyntaxError:
+            return None
+        if len(lines) == 1 and isinstance(node, ast.Expr):
+            # senza assegnazioni eval restituisce una serie
+            return expression_names(node.value)
+        if not (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            return None
+        if required is not None:
+            required = (required - {node.targets[0].id}) | expression_names(
+                node.value
+            )
+    return required
+
+
+@functools.lru_cache(maxsize=None)
+def compile_lambda(source: str) -> Callable:
+    """Lambda definita come stringa in configurazione, compilata una
+    sola volta per processo"""
+    return eval(source)
 
 
 class DummyTransformer(BaseTransformer):
@@ -39,6 +121,18 @@ class DummyTransformer(BaseTransformer):
             print(eval(self.check_condition))
         return data
 
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        return True
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        # check_condition puo' valutare qualsiasi espressione sul dataframe
+        return None if self.check_condition else output
+
+    def predicates(self) -> Optional[List[Predicate]]:
+        return []
+
 
 class SwissKnife(BaseTransformer):
     """Classe per eseguire operazioni comuni sui dataframe
@@ -53,8 +147,50 @@ class SwissKnife(BaseTransformer):
             salvare il risultato. Defaults to None.
         fargs (dict, optional): argomenti da passare
             alla chiamata al metodo
+        plan (ExpressionPlan, optional): piano compilato delle eval e
+            query sull'intero dataframe
+        compile_time (float): tempo di compilazione di espressioni e lambda
+            non ancora riportato nelle metriche
+        eval_time (float): tempo di valutazione delle espressioni
+            non ancora riportato nelle metriche
     """
 
+    # metodi del dataframe che operano riga per riga
+    ROW_WISE_ATTRS = {
+        "abs",
+        "applymap",
+        "assign",
+        "astype",
+        "clip",
+        "drop",
+        "eval",
+        "explode",
+        "fillna",
+        "filter",
+        "isin",
+        "isna",
+        "notna",
+        "query",
+        "rename",
+        "replace",
+        "round",
+        "where",
+    }
+
+    # metodi del dataframe che calcolano ogni colonna del risultato
+    # a partire dalla sola colonna omonima in input
+    COLUMN_WISE_ATTRS = {
+        "abs",
+        "astype",
+        "clip",
+        "drop",
+        "fillna",
+        "isna",
+        "notna",
+        "replace",
+        "round",
+    }
+
     def __init__(
         self,
         dataframe_attr: str,
@@ -81,13 +217,95 @@ class SwissKnife(BaseTransformer):
         self.fargs = kwargs
         self.col_to_apply = col_to_apply
         self.col_to_store = col_to_store
+        self.eval_time = 0.0
+        start = time.perf_counter()
         # verifico se nel dizionario fargs ci sono delle lambda
         # su cui fare l'eval per trasformare in oggetti python
         for k, v in self.fargs.items():
             if isinstance(v, str) and v.startswith("lambda"):
-                self.fargs[k] = eval(v)
+                self.fargs[k] = compile_lambda(v)
+        self.plan: Optional[ExpressionPlan] = None
+        if (
+            dataframe_attr in ("eval", "query")
+            and col_to_apply is None
+            and not col_to_store
+            and set(self.fargs) == {"expr"}
+        ):
+            self.plan = ExpressionPlan(dataframe_attr, self.fargs["expr"])
+        self.compile_time = time.perf_counter() - start
+
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        if self.dataframe_attr == "apply":
+            row_wise = self.fargs.get("axis", 0) in (1, "columns")
+        else:
+            row_wise = self.dataframe_attr in SwissKnife.ROW_WISE_ATTRS
+        if not row_wise or "method" in self.fargs:
+            return False
+        for v in self.fargs.values():
+            if callable(v) and self.dataframe_attr != "apply":
+                # lambda su colonne intere, ad esempio in assign
+                return False
+            # chiamate a funzione o metodi (es. col.max()) nelle espressioni
+            # di eval e query possono calcolare aggregati sull'intero dataframe
+            if isinstance(v, str) and re.search(CALL_OR_ATTRIBUTE, v):
+                return False
+        return True
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        if self.col_to_apply is not None:
+            columns = (
+                {self.col_to_apply}
+                if isinstance(self.col_to_apply, str)
+                else set(self.col_to_apply)
+            )
+            if not self.col_to_store:
+                return columns
+            if output is None:
+                return None
+            return (output - {self.col_to_store}) | columns
+        if self.col_to_store:
+            return None
+        if self.dataframe_attr == "eval":
+            return eval_columns(self.fargs.get("expr", ""), output)
+        if output is None:
+            return None
+        if self.dataframe_attr == "query":
+            names = expression_names(self.fargs.get("expr", ""))
+            return None if names is None else names | output
+        if self.dataframe_attr == "assign":
+            if any(callable(v) for v in self.fargs.values()):
+                return None
+            return output - set(self.fargs)
+        if self.dataframe_attr in SwissKnife.COLUMN_WISE_ATTRS:
+            return output
+        return None
+
+    def predicates(self) -> Optional[List[Predicate]]:
+        if (
+            self.dataframe_attr != "query"
+            or self.col_to_apply is not None
+            or self.col_to_store
+            or self.fargs.get("inplace", False)
+        ):
+            return None
+        return parse_predicates(self.fargs.get("expr", ""))
+
+    def pop_metrics(self) -> Dict[str, float]:
+        metrics = {
+            "compile_time": self.compile_time,
+            "eval_time": self.eval_time,
+        }
+        self.compile_time = self.eval_time = 0.0
+        return metrics
 
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
+        if self.plan is not None:
+            start = time.perf_counter()
+            data = self.plan(data)
+            self.eval_time += time.perf_counter() - start
+            return data
         if isinstance(self.col_to_apply, str):
             if self.col_to_store is None:
                 data = getattr(data[self.col_to_apply], self.dataframe_attr)(
@@ -114,6 +332,47 @@ class SwissKnife(BaseTransformer):
         return data
 
 
+def collect_lists(
+    data: pd.DataFrame,
+    group_columns: List[str],
+    columns: List[str],
+    dropna: bool = True,
+) -> pd.DataFrame:
+    """Raccoglie in liste i valori di ogni gruppo senza iterare sui gruppi:
+    le righe vengono ordinate (in modo stabile) per gruppo e ogni colonna
+    viene divisa nei punti in cui cambia il gruppo
+
+    Args:
+        data (pd.DataFrame): dataframe da aggregare
+        group_columns (List[str]): colonne dei gruppi
+        columns (List[str]): colonne da raccogliere in liste
+        dropna (bool, optional): True per scartare i gruppi con chiavi
+            mancanti. Defaults to True.
+
+    Returns:
+        pd.DataFrame: una riga per gruppo, indicizzata dalle chiavi ordinate
+    """
+    if dropna:
+        data = data.dropna(subset=group_columns)
+    grouped = data.groupby(group_columns, sort=True, dropna=False)
+    codes = grouped.ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    offsets = np.flatnonzero(np.diff(codes[order])) + 1
+    index = grouped.size().index
+    return pd.DataFrame(
+        {
+            c: [
+                x.tolist()
+                for x in np.split(data[c].to_numpy()[order], offsets)
+            ]
+            if len(data) > 0
+            else []
+            for c in columns
+        },
+        index=index,
+    )
+
+
 class GroupByTransformer(BaseTransformer):
     """Transformer per eseguire operazioni di groupby
 
@@ -124,8 +383,22 @@ class GroupByTransformer(BaseTransformer):
         as_index (bool, optional): True se le colonne nelle groupby
             devono essere rappresentate come indice. Defaults to False.
         dropna (bool, optional): True se si vogliono eliminare le entry completamente a nan. Defaults to True.
+        streaming (bool, optional): True per aggregare su tutti i batch letti dal task:
+            ogni batch produce aggregati parziali, che il task combina e scrive
+            al termine della lettura (vedi GroupByAccumulator). Defaults to False.
     """
 
+    # aggregazioni supportate in modalita streaming e funzione con cui
+    # vengono combinati gli aggregati parziali
+    PARTIAL_AGGREGATES = {
+        "sum": "sum",
+        "count": "sum",
+        "min": "min",
+        "max": "max",
+        "mean": None,
+        "list": None,
+    }
+
     def __init__(
         self,
         group_columns: Union[str, List[str]],
@@ -133,6 +406,7 @@ class GroupByTransformer(BaseTransformer):
         main_columns: Optional[Union[List[str], str]] = None,
         as_index: bool = False,
         dropna: bool = True,
+        streaming: bool = False,
     ):
         """Costruttore
 
@@ -143,21 +417,46 @@ class GroupByTransformer(BaseTransformer):
             as_index (bool, optional): True se le colonne nelle groupby
                 devono essere rappresentate come indice. Defaults to False.
             dropna (bool, optional): True se si vogliono eliminare le entry completamente a nan. Defaults to True.
+            streaming (bool, optional): True per aggregare su tutti i batch. Defaults to False.
         """
         self.group_columns = group_columns
         self.agg_function = agg_function
         self.main_columns = main_columns
         self.as_index = as_index
         self.dropna = dropna
+        self.streaming = streaming
+        if streaming:
+            assert (
+                agg_function in GroupByTransformer.PARTIAL_AGGREGATES
+            ), f"Streaming groupby does not support {agg_function}"
+
+    @property
+    def keys(self) -> List[str]:
+        return (
+            [self.group_columns]
+            if isinstance(self.group_columns, str)
+            else list(self.group_columns)
+        )
+
+    def columns(self, data: pd.DataFrame) -> List[str]:
+        if self.main_columns:
+            return (
+                [self.main_columns]
+                if isinstance(self.main_columns, str)
+                else list(self.main_columns)
+            )
+        return [c for c in data.columns if c not in self.keys]
 
     def transform(self, data: pd.DataFrame) -> pd.DataFrame:
+        if self.streaming:
+            return self.partial(data)
         if self.agg_function == "list":
-            if self.main_columns is not None:
-                return data.groupby(self.group_columns)[
-                    self.main_columns
-                ].apply(list)
-            else:
-                return data.groupby(self.group_columns).apply(list)
+            lists = collect_lists(
+                data, self.keys, self.columns(data), self.dropna
+            )
+            if isinstance(self.main_columns, str):
+                return lists[self.main_columns]
+            return lists
 
         grouped_df = data.groupby(
             self.group_columns, as_index=self.as_index, dropna=self.dropna
@@ -172,6 +471,125 @@ class GroupByTransformer(BaseTransformer):
 
         return grouped_df[columns].agg(self.agg_function)
 
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        # i gruppi sono interamente contenuti in una partizione solo se
+        # la chiave di partizionamento e' un sottoinsieme delle colonne di groupby
+        if key is None:
+            return False
+        return set(key).issubset(self.keys)
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        if self.main_columns:
+            return set(self.keys) | set(self.columns(None))
+        if isinstance(self.agg_function, dict):
+            return set(self.keys) | set(self.agg_function)
+        return None
+
+    def partial(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Aggregati parziali di un batch: una riga per gruppo, con le chiavi
+        come colonne. La media e' rappresentata da somma e conteggio
+
+        Args:
+            data (pd.DataFrame): batch da aggregare
+
+        Returns:
+            pd.DataFrame: aggregati parziali, combinabili con combine
+        """
+        columns = self.columns(data)
+        if self.agg_function == "list":
+            return collect_lists(
+                data, self.keys, columns, self.dropna
+            ).reset_index()
+        grouped = data.groupby(self.keys, sort=False, dropna=self.dropna)
+        if self.agg_function == "mean":
+            sums = grouped[columns].sum().add_suffix("__sum")
+            counts = grouped[columns].count().add_suffix("__count")
+            return pd.concat([sums, counts], axis=1).reset_index()
+        return grouped[columns].agg(self.agg_function).reset_index()
+
+    def combine(self, partials: List[pd.DataFrame]) -> pd.DataFrame:
+        """Combina gli aggregati parziali di piu batch
+
+        Args:
+            partials (List[pd.DataFrame]): aggregati prodotti da partial o combine
+
+        Returns:
+            pd.DataFrame: aggregati parziali complessivi
+        """
+        data = pd.concat(partials, ignore_index=True)
+        columns = [c for c in data.columns if c not in self.keys]
+        if self.agg_function == "list":
+            return collect_lists(
+                data.explode(columns), self.keys, columns, self.dropna
+            ).reset_index()
+        function = GroupByTransformer.PARTIAL_AGGREGATES[self.agg_function]
+        grouped = data.groupby(self.keys, sort=False, dropna=self.dropna)
+        return grouped[columns].agg(function or "sum").reset_index()
+
+    def finalize(
+        self, partial: pd.DataFrame
+    ) -> Union[pd.DataFrame, pd.Series]:
+        """Risultato finale a partire dagli aggregati complessivi, nella
+        stessa forma prodotta da transform sull'intero dataset
+
+        Args:
+            partial (pd.DataFrame): aggregati complessivi
+
+        Returns:
+            Union[pd.DataFrame, pd.Series]: risultato della groupby
+        """
+        result = partial.sort_values(self.keys, ignore_index=True)
+        if self.agg_function == "mean":
+            columns = [
+                c[: -len("__sum")] for c in result if c.endswith("__sum")
+            ]
+            for c in columns:
+                result[c] = result.pop(f"{c}__sum") / result.pop(f"{c}__count")
+        if self.agg_function == "list":
+            result = result.set_index(self.keys)
+            if isinstance(self.main_columns, str):
+                return result[self.main_columns]
+            return result
+        if self.as_index:
+            result = result.set_index(self.keys)
+        return result
+
+
+class GroupByAccumulator:
+    """Raccoglie gli aggregati parziali prodotti da una GroupByTransformer
+    in modalita streaming e restituisce il risultato al termine della lettura.
+    I parziali vengono combinati ogni combine_every batch, per cui la memoria
+    dipende dal numero di gruppi e non dal numero di batch
+
+    Attributes:
+        groupby (GroupByTransformer): groupby che produce i parziali
+        combine_every (int): batch accumulati prima di combinarli
+        partials (List[pd.DataFrame]): parziali non ancora combinati
+    """
+
+    def __init__(
+        self, groupby: GroupByTransformer, combine_every: int = 8
+    ) -> None:
+        self.groupby = groupby
+        self.combine_every = combine_every
+        self.partials: List[pd.DataFrame] = []
+        self.batches = 0
+
+    def add(self, partial: pd.DataFrame) -> None:
+        self.partials.append(partial)
+        self.batches += 1
+        if len(self.partials) >= self.combine_every:
+            self.partials = [self.groupby.combine(self.partials)]
+
+    def result(self) -> Optional[Union[pd.DataFrame, pd.Series]]:
+        """Risultato della groupby su tutti i batch, None se non e' stato
+        letto nessun batch"""
+        if not self.partials:
+            return None
+        return self.groupby.finalize(self.groupby.combine(self.partials))
+
 
 class ProjectionTransformer(BaseTransformer):
     """Transformer per eseguire una proiezione sul datasets
@@ -225,3 +643,18 @@ class ProjectionTransformer(BaseTransformer):
             return data[self.columns]
         columns = list(filter(lambda x: x not in self.columns, data.columns))
         return data[columns]
+
+    def check_partitionable(self, key: Optional[List[str]] = None) -> bool:
+        return True
+
+    def required_columns(
+        self, output: Optional[Set[str]] = None
+    ) -> Optional[Set[str]]:
+        if self.to_include:
+            # le colonne mancanti vengono aggiunte con fill_missing_with
+            return set(self.columns)
+        return output
+
+    def predicates(self) -> Optional[List[Predicate]]:
+        # la proiezione non modifica i valori delle colonne mantenute
+        return []
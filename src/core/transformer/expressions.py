@@ -0,0 +1,372 @@
+"""
+Piano compilato delle espressioni di eval e query di SwissKnife.
+Ogni espressione viene analizzata una sola volta: quelle aritmetiche e di
+confronto su colonne numeriche vengono valutate con numpy sugli array
+delle colonne, senza il parser di DataFrame.eval. Le espressioni (o i
+dataframe) non supportati vengono valutati con pandas
+"""
+import ast
+import functools
+import logging
+from dataclasses import dataclass
+from typing import Any, FrozenSet, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# funzioni matematiche di DataFrame.eval
+FUNCTIONS = {
+    name: getattr(np, name)
+    for name in (
+        "abs",
+        "arccos",
+        "arccosh",
+        "arcsin",
+        "arcsinh",
+        "arctan",
+        "arctan2",
+        "arctanh",
+        "cos",
+        "cosh",
+        "exp",
+        "expm1",
+        "log",
+        "log10",
+        "log1p",
+        "sin",
+        "sinh",
+        "sqrt",
+        "tan",
+        "tanh",
+    )
+}
+
+
+def integer_safe(func: Any) -> Any:
+    """Divisione intera o modulo con la semantica di pandas: tra interi,
+    con un divisore nullo, il risultato e' float64 (inf o NaN) invece di 0
+    """
+
+    def apply(left: Any, right: Any) -> Any:
+        left, right = np.asarray(left), np.asarray(right)
+        if (
+            left.dtype.kind in "iu"
+            and right.dtype.kind in "iu"
+            and (right == 0).any()
+        ):
+            left, right = left.astype("float64"), right.astype("float64")
+        return func(left, right)
+
+    return apply
+
+
+# operatori riscritti come chiamate, per seguire la semantica di pandas
+INTEGER_OPERATORS = {
+    ast.FloorDiv: "floordiv",
+    ast.Mod: "mod",
+}
+# globali della valutazione con numpy: soltanto isin, gli operatori
+# riscritti e le funzioni
+NAMESPACE = {
+    "__builtins__": {},
+    "isin": np.isin,
+    "floordiv": integer_safe(np.floor_divide),
+    "mod": integer_safe(np.mod),
+    **FUNCTIONS,
+}
+
+BINARY_OPERATORS = (
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Mod,
+    ast.Pow,
+    ast.FloorDiv,
+)
+COMPARE_OPERATORS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+# tipi numpy delle colonne supportate: bool, interi e float
+NUMERIC_KINDS = "biuf"
+
+
+class Unsupported(Exception):
+    """L'espressione deve essere valutata con pandas"""
+
+
+class Vectorizer(ast.NodeTransformer):
+    """Riscrive una espressione di DataFrame.eval in una espressione su
+    array: and, or e not diventano &, | e ~, i confronti concatenati
+    una congiunzione, l'operatore in una chiamata a isin, // e %
+    chiamate a floordiv e mod.
+    Solleva Unsupported per i costrutti che richiedono pandas
+
+    Attributes:
+        names (set): colonne citate nell'espressione
+    """
+
+    def __init__(self) -> None:
+        self.names = set()
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        raise Unsupported(type(node).__name__)
+
+    def visit_Expression(self, node: ast.Expression) -> ast.AST:
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        self.names.add(node.id)
+        return node
+
+    def visit_Constant(self, node: ast.Constant) -> ast.AST:
+        if isinstance(node.value, (str, bytes)) or node.value is None:
+            raise Unsupported("only numeric constants are supported")
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        # & e | hanno in DataFrame.eval una precedenza diversa da python
+        if not isinstance(node.op, BINARY_OPERATORS):
+            raise Unsupported(type(node.op).__name__)
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        if type(node.op) in INTEGER_OPERATORS:
+            return ast.Call(
+                ast.Name(INTEGER_OPERATORS[type(node.op)], ast.Load()),
+                [node.left, node.right],
+                [],
+            )
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(ast.Invert(), operand)
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            node.operand = operand
+            return node
+        raise Unsupported(type(node.op).__name__)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(v) for v in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(result, op, value)
+        return result
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        operands = [node.left] + node.comparators
+        comparisons = [
+            self.compare(left, op, right)
+            for left, op, right in zip(operands, node.ops, operands[1:])
+        ]
+        result = comparisons[0]
+        for comparison in comparisons[1:]:
+            result = ast.BinOp(result, ast.BitAnd(), comparison)
+        return result
+
+    def compare(self, left: ast.AST, op: ast.cmpop, right: ast.AST):
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right, (ast.List, ast.Tuple)):
+                raise Unsupported("in requires a list of values")
+            values = [self.visit(v) for v in right.elts]
+            isin = ast.Call(
+                ast.Name("isin", ast.Load()),
+                [self.visit(left), ast.List(values, ast.Load())],
+                [],
+            )
+            if isinstance(op, ast.NotIn):
+                return ast.UnaryOp(ast.Invert(), isin)
+            return isin
+        if not isinstance(op, COMPARE_OPERATORS):
+            raise Unsupported(type(op).__name__)
+        return ast.Compare(self.visit(left), [op], [self.visit(right)])
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        if (
+            not isinstance(node.func, ast.Name)
+            or node.func.id not in FUNCTIONS
+            or node.keywords
+        ):
+            raise Unsupported("unsupported function call")
+        node.args = [self.visit(a) for a in node.args]
+        return node
+
+
+@dataclass(frozen=True)
+class CompiledExpression:
+    """Espressione compilata, valutabile sugli array delle colonne
+
+    Attributes:
+        source (str): espressione originale
+        code (Any): code object per la valutazione con numpy
+        names (FrozenSet[str]): colonne citate nell'espressione
+    """
+
+    source: str
+    code: Any
+    names: FrozenSet[str]
+
+    def evaluate(self, data: pd.DataFrame) -> Optional[Any]:
+        """Valuta l'espressione sulle colonne del dataframe
+
+        Args:
+            data (pd.DataFrame): dataframe in input
+
+        Returns:
+            Optional[Any]: array (o scalare, senza colonne) del risultato,
+                None se le colonne richiedono la valutazione con pandas
+        """
+        arrays = {}
+        for name in self.names:
+            if name not in data.columns:
+                # indice o variabile risolti da pandas
+                return None
+            column = data[name]
+            if (
+                not isinstance(column, pd.Series)
+                or not isinstance(column.dtype, np.dtype)
+                or column.dtype.kind not in NUMERIC_KINDS
+            ):
+                return None
+            arrays[name] = column.to_numpy()
+        try:
+            with np.errstate(all="ignore"):
+                return eval(self.code, NAMESPACE, arrays)
+        except (TypeError, ValueError):
+            return None
+
+
+@functools.lru_cache(maxsize=512)
+def compile_expression(source: str) -> Optional[CompiledExpression]:
+    """Compila una espressione (senza assegnazioni) di DataFrame.eval.
+    Le espressioni compilate sono condivise tra i transformer
+
+    Args:
+        source (str): espressione da compilare
+
+    Returns:
+        Optional[CompiledExpression]: espressione compilata, None se
+            deve essere valutata con pandas
+    """
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+        vectorizer = Vectorizer()
+        # una costante (anche stringa) viene assegnata cosi' com'e'
+        if not isinstance(tree.body, ast.Constant):
+            tree = ast.fix_missing_locations(vectorizer.visit(tree))
+    except (SyntaxError, Unsupported) as e:
+        logger.debug(f"Expression {source!r} evaluated by pandas: {e}")
+        return None
+    code = compile(tree, "<expression>", "eval")
+    return CompiledExpression(
+        source=source,
+        code=code,
+        names=frozenset(vectorizer.names),
+    )
+
+
+@dataclass(frozen=True)
+class Step:
+    """Riga di una espressione di eval
+
+    Attributes:
+        source (str): riga originale, valutata con pandas se necessario
+        target (Optional[str]): colonna assegnata, None senza assegnazione
+        expression (Optional[CompiledExpression]): espressione compilata,
+            None se deve essere valutata con pandas
+    """
+
+    source: str
+    target: Optional[str]
+    expression: Optional[CompiledExpression]
+
+    def evaluate(self, data: pd.DataFrame) -> Optional[Any]:
+        if self.expression is None:
+            return None
+        return self.expression.evaluate(data)
+
+
+def compile_steps(attr: str, expr: str) -> Optional[List[Step]]:
+    """Righe di una espressione di eval o query. None se l'espressione
+    deve essere valutata per intero con pandas"""
+    if attr == "query":
+        return [Step(expr, None, compile_expression(expr))]
+    lines = [line.strip() for line in expr.splitlines() if line.strip()]
+    steps = []
+    for line in lines:
+        try:
+            node = ast.parse(line).body[0]
+        except SyntaxError:
+            return None
+        if len(lines) == 1 and isinstance(node, ast.Expr):
+            return [Step(line, None, compile_expression(line))]
+        if not (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+        ):
+            return None
+        value = ast.get_source_segment(line, node.value)
+        steps.append(Step(line, node.targets[0].id, compile_expression(value)))
+    return steps
+
+
+def is_column(values: Any, data: pd.DataFrame) -> bool:
+    return isinstance(values, np.ndarray) and values.shape == (len(data),)
+
+
+class ExpressionPlan:
+    """Piano compilato di una eval o di una query di SwissKnife.
+    Le righe non supportate (o i batch con colonne non numeriche)
+    vengono valutate con pandas, una riga alla volta
+
+    Attributes:
+        attr (str): eval oppure query
+        expr (str): espressione originale
+        steps (Optional[List[Step]]): righe compilate, None se
+            l'espressione viene valutata per intero con pandas
+    """
+
+    def __init__(self, attr: str, expr: str) -> None:
+        assert attr in ("eval", "query"), f"Unsupported method {attr}"
+        self.attr = attr
+        self.expr = expr
+        self.steps = compile_steps(attr, expr)
+
+    def __reduce__(self):
+        # i code object non sono serializzabili: il piano viene ricompilato
+        return (ExpressionPlan, (self.attr, self.expr))
+
+    @property
+    def vectorized(self) -> bool:
+        """True se tutte le righe sono state compilate"""
+        return self.steps is not None and all(
+            step.expression is not None for step in self.steps
+        )
+
+    def __call__(self, data: pd.DataFrame) -> Union[pd.DataFrame, pd.Series]:
+        if self.steps is None:
+            return getattr(data, self.attr)(self.expr)
+        if self.attr == "query":
+            mask = self.steps[0].evaluate(data)
+            if not is_column(mask, data) or mask.dtype != bool:
+                return data.query(self.expr)
+            return data[mask]
+        if self.steps[0].target is None:
+            values = self.steps[0].evaluate(data)
+            if not is_column(values, data):
+                return data.eval(self.expr)
+            return pd.Series(values, index=data.index)
+        # come DataFrame.eval, il dataframe in input non viene modificato
+        result = data.copy(deep=False)
+        for step in self.steps:
+            values = step.evaluate(result)
+            if values is None:
+                result = result.eval(step.source)
+            else:
+                result[step.target] = values
+        return result
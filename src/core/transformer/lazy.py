@@ -0,0 +1,585 @@
+"""
+Esecuzione lazy delle pipeline CASCADE: le sequenze di transformer supportati
+(SwissKnife con eval, query, assign e astype, ProjectionTransformer e
+GroupByTransformer) vengono tradotte in un unico piano logico, eseguito
+da duckdb sulla vista Arrow del dataframe. I transformer non supportati
+separano i segmenti del piano e vengono eseguiti con pandas.
+
+Differenze rispetto all'esecuzione con pandas: l'indice del risultato
+viene sempre ricreato. I confronti seguono la semantica di pandas anche
+con i valori mancanti: sono falsi, tranne != e not in che sono veri
+"""
+import ast
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from src.core.transformer.basic import (
+    GroupByTransformer,
+    ProjectionTransformer,
+    SwissKnife,
+)
+
+logger = logging.getLogger(__name__)
+
+# nome con cui il dataframe in input viene registrato in duckdb
+INPUT_VIEW = "lazy_input"
+
+SQL_TYPES = {
+    "int64": "BIGINT",
+    "int32": "INTEGER",
+    "int16": "SMALLINT",
+    "int8": "TINYINT",
+    "float64": "DOUBLE",
+    "float32": "FLOAT",
+    "float": "DOUBLE",
+    "int": "BIGINT",
+    "bool": "BOOLEAN",
+    "str": "VARCHAR",
+    "string": "VARCHAR",
+    "object": "VARCHAR",
+}
+
+SQL_AGGREGATES = {
+    "sum": "SUM",
+    "mean": "AVG",
+    "min": "MIN",
+    "max": "MAX",
+    "count": "COUNT",
+}
+
+INTEGER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "BOOLEAN"}
+
+
+class Unsupported(Exception):
+    """L'operazione non puo' essere tradotta in SQL"""
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def literal(value: Any) -> str:
+    """Letterale SQL con lo stesso tipo che avrebbe in pandas"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return f"CAST({value} AS BIGINT)"
+    if isinstance(value, float):
+        return f"CAST({value!r} AS DOUBLE)"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise Unsupported(f"Literal {value!r}")
+
+
+class SQLExpression(ast.NodeVisitor):
+    """Traduce un'espressione di DataFrame.eval/query in SQL
+
+    Attributes:
+        columns (Set[str]): colonne a cui l'espressione fa riferimento
+    """
+
+    BINARY = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*"}
+    COMPARE = {
+        ast.Eq: "=",
+        ast.NotEq: "<>",
+        ast.Lt: "<",
+        ast.LtE: "<=",
+        ast.Gt: ">",
+        ast.GtE: ">=",
+    }
+    # risultato in pandas di un confronto con un valore mancante, che in SQL
+    # sarebbe NULL: una query con x != 1 mantiene le righe con x mancante
+    MISSING = {ast.NotEq: "TRUE", ast.NotIn: "TRUE"}
+    LOGICAL = (ast.Compare, ast.BoolOp)
+
+    def __init__(self) -> None:
+        self.columns: Set[str] = set()
+
+    def translate(self, expression: Union[str, ast.AST]) -> str:
+        if isinstance(expression, str):
+            try:
+                expression = ast.parse(expression.strip(), mode="eval").body
+            except SyntaxError as e:
+                raise Unsupported(str(e)) from e
+        return self.visit(expression)
+
+    def generic_visit(self, node: ast.AST) -> str:
+        raise Unsupported(f"Expression node {node.__class__.__name__}")
+
+    def visit_Name(self, node: ast.Name) -> str:
+        self.columns.add(node.id)
+        return quote(node.id)
+
+    def visit_Constant(self, node: ast.Constant) -> str:
+        return literal(node.value)
+
+    def visit_BinOp(self, node: ast.BinOp) -> str:
+        if isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            # in query & e | sono operatori logici tra condizioni
+            if not (
+                isinstance(node.left, self.LOGICAL)
+                and isinstance(node.right, self.LOGICAL)
+            ):
+                raise Unsupported("Bitwise operator on values")
+            op = "AND" if isinstance(node.op, ast.BitAnd) else "OR"
+        elif isinstance(node.op, ast.Div):
+            # come pandas divisione in virgola mobile anche tra interi,
+            # che duckdb prima della 0.8 tronca
+            left, right = self.visit(node.left), self.visit(node.right)
+            return f"(CAST({left} AS DOUBLE) / {right})"
+        elif type(node.op) in self.BINARY:
+            op = self.BINARY[type(node.op)]
+        else:
+            # //, % e ** hanno una semantica diversa in SQL
+            raise Unsupported(f"Operator {node.op.__class__.__name__}")
+        return f"({self.visit(node.left)} {op} {self.visit(node.right)})"
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> str:
+        op = " AND " if isinstance(node.op, ast.And) else " OR "
+        return "(" + op.join(self.visit(v) for v in node.values) + ")"
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> str:
+        if isinstance(node.op, ast.Not) or (
+            isinstance(node.op, ast.Invert)
+            and isinstance(node.operand, self.LOGICAL)
+        ):
+            return f"(NOT {self.visit(node.operand)})"
+        if isinstance(node.op, ast.USub):
+            return f"(-{self.visit(node.operand)})"
+        raise Unsupported(f"Operator {node.op.__class__.__name__}")
+
+    def visit_Compare(self, node: ast.Compare) -> str:
+        terms = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, (ast.List, ast.Tuple)):
+                    raise Unsupported("in requires a literal list")
+                operands = [left] + right.elts
+                values = ", ".join(self.visit(v) for v in right.elts)
+                negate = "NOT " if isinstance(op, ast.NotIn) else ""
+                term = f"({self.visit(left)} {negate}IN ({values}))"
+            elif type(op) in self.COMPARE:
+                operands = [left, right]
+                term = (
+                    f"({self.visit(left)} {self.COMPARE[type(op)]} "
+                    f"{self.visit(right)})"
+                )
+            else:
+                raise Unsupported(f"Operator {op.__class__.__name__}")
+            if any(
+                isinstance(v, ast.Constant) and v.value is None
+                for v in operands
+            ):
+                # in pandas None e' uguale ai valori mancanti, in SQL no
+                raise Unsupported("Comparison with None")
+            missing = self.MISSING.get(type(op), "FALSE")
+            terms.append(f"COALESCE({term}, {missing})")
+            left = right
+        return terms[0] if len(terms) == 1 else "(" + " AND ".join(terms) + ")"
+
+
+@dataclass(frozen=True)
+class Filter:
+    predicate: str
+    columns: frozenset
+
+
+@dataclass(frozen=True)
+class Assign:
+    column: str
+    expression: str
+    columns: frozenset
+
+
+@dataclass(frozen=True)
+class Cast:
+    dtypes: Tuple[Tuple[str, str], ...]
+
+
+@dataclass(frozen=True)
+class Select:
+    columns: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Exclude:
+    columns: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    group_columns: Tuple[str, ...]
+    function: str
+    columns: Optional[Tuple[str, ...]]
+    dropna: bool
+
+
+Operation = Union[Filter, Assign, Cast, Select, Exclude, Aggregate]
+
+
+def as_tuple(columns: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    return (columns,) if isinstance(columns, str) else tuple(columns)
+
+
+def translate_swissknife(transformer: SwissKnife) -> List[Operation]:
+    if transformer.col_to_apply is not None or transformer.col_to_store:
+        raise Unsupported("col_to_apply and col_to_store are not supported")
+    attr, fargs = transformer.dataframe_attr, transformer.fargs
+    if attr == "query" and set(fargs) == {"expr"}:
+        expression = SQLExpression()
+        predicate = expression.translate(fargs["expr"])
+        return [Filter(predicate, frozenset(expression.columns))]
+    if attr == "eval" and set(fargs) == {"expr"}:
+        operations: List[Operation] = []
+        for line in fargs["expr"].strip().splitlines():
+            try:
+                node = ast.parse(line.strip()).body[0]
+            except SyntaxError as e:
+                raise Unsupported(str(e)) from e
+            if not (
+                isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+            ):
+                raise Unsupported("eval without a column assignment")
+            expression = SQLExpression()
+            sql = expression.translate(node.value)
+            operations.append(
+                Assign(node.targets[0].id, sql, frozenset(expression.columns))
+            )
+        return operations
+    if attr == "assign":
+        # le lambda sono gia state trasformate in funzioni dal costruttore
+        return [Assign(k, literal(v), frozenset()) for k, v in fargs.items()]
+    if attr == "astype" and set(fargs) == {"dtype"}:
+        dtypes = fargs["dtype"]
+        if not isinstance(dtypes, dict):
+            raise Unsupported("astype requires a dictionary of dtypes")
+        try:
+            return [
+                Cast(tuple((c, SQL_TYPES[str(t)]) for c, t in dtypes.items()))
+            ]
+        except KeyError as e:
+            raise Unsupported(f"dtype {e}") from e
+    raise Unsupported(f"SwissKnife.{attr}")
+
+
+def translate(transformer: Any) -> List[Operation]:
+    """Traduce un transformer nelle operazioni del piano logico
+
+    Args:
+        transformer (Any): transformer della pipeline
+
+    Raises:
+        Unsupported: se il transformer non puo' essere eseguito da duckdb
+
+    Returns:
+        List[Operation]: operazioni equivalenti al transformer
+    """
+    if isinstance(transformer, SwissKnife):
+        return translate_swissknife(transformer)
+    if isinstance(transformer, ProjectionTransformer):
+        if transformer.fill_missing_with is not None:
+            raise Unsupported("fill_missing_with is not supported")
+        columns = as_tuple(transformer.columns)
+        return [
+            Select(columns) if transformer.to_include else Exclude(columns)
+        ]
+    if isinstance(transformer, GroupByTransformer):
+        if (
+            transformer.streaming
+            or transformer.as_index
+            or not isinstance(transformer.agg_function, str)
+            or transformer.agg_function not in SQL_AGGREGATES
+        ):
+            raise Unsupported("GroupBy aggregation")
+        return [
+            Aggregate(
+                as_tuple(transformer.group_columns),
+                transformer.agg_function,
+                None
+                if not transformer.main_columns
+                else as_tuple(transformer.main_columns),
+                transformer.dropna,
+            )
+        ]
+    raise Unsupported(transformer.__class__.__name__)
+
+
+def optimize(
+    operations: List[Operation],
+) -> Tuple[List[Operation], Optional[Set[str]]]:
+    """Fonde filtri e proiezioni consecutivi e rimuove le colonne (e le
+    assegnazioni) che nessuna operazione successiva utilizza
+
+    Args:
+        operations (List[Operation]): operazioni in ordine di esecuzione
+
+    Returns:
+        Tuple[List[Operation], Optional[Set[str]]]: operazioni ottimizzate e
+            colonne del dataframe in input da leggere (None per tutte)
+    """
+    fused: List[Operation] = []
+    for op in operations:
+        previous = fused[-1] if fused else None
+        if isinstance(op, Filter) and isinstance(previous, Filter):
+            fused[-1] = Filter(
+                f"({previous.predicate} AND {op.predicate})",
+                previous.columns | op.columns,
+            )
+        elif (
+            isinstance(op, Select)
+            and isinstance(previous, Select)
+            and set(op.columns) <= set(previous.columns)
+        ):
+            fused[-1] = op
+        else:
+            fused.append(op)
+
+    # colonne necessarie, a ritroso dall'ultima operazione
+    required: Optional[Set[str]] = None
+    pruned: List[Operation] = []
+    for op in reversed(fused):
+        if isinstance(op, Assign):
+            if required is not None:
+                if op.column not in required:
+                    continue
+                required = (required - {op.column}) | set(op.columns)
+        elif isinstance(op, Filter):
+            if required is not None:
+                required |= op.columns
+        elif isinstance(op, Cast):
+            if required is not None:
+                dtypes = tuple((c, t) for c, t in op.dtypes if c in required)
+                if not dtypes:
+                    continue
+                op = Cast(dtypes)
+        elif isinstance(op, Select):
+            required = set(op.columns)
+        elif isinstance(op, Aggregate):
+            required = (
+                None
+                if op.columns is None
+                else set(op.group_columns) | set(op.columns)
+            )
+        pruned.append(op)
+    return list(reversed(pruned)), required
+
+
+class LazySegment:
+    """Sequenza di transformer eseguita come un'unica query duckdb.
+    La query viene compilata per ogni schema in input e memorizzata;
+    se non puo' essere compilata il segmento viene eseguito con pandas
+
+    Attributes:
+        transformers (List[Any]): transformer originali del segmento
+        operations (List[Operation]): piano logico ottimizzato
+        required (Optional[Set[str]]): colonne lette dal dataframe in input
+        sql (Optional[str]): ultima query eseguita
+    """
+
+    def __init__(self, transformers: List[Any], operations: List[Operation]):
+        self.transformers = transformers
+        self.operations, self.required = optimize(operations)
+        self.sql: Optional[str] = None
+        self._queries: Dict[Tuple, Optional[str]] = {}
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # le connessioni duckdb appartengono al thread che le ha create
+        state["_local"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        if not hasattr(self._local, "connection"):
+            self._local.connection = duckdb.connect(":memory:")
+        return self._local.connection
+
+    def __str__(self) -> str:
+        return f"LazySegment[{len(self.transformers)} transformers]"
+
+    def compile(
+        self, connection: duckdb.DuckDBPyConnection, columns: List[str]
+    ) -> str:
+        """Genera la query del piano per le colonne in input
+
+        Args:
+            connection (duckdb.DuckDBPyConnection): connessione con l'input registrato
+            columns (List[str]): colonne del dataframe in input
+
+        Raises:
+            Unsupported: se il piano non puo' essere eseguito sull'input
+
+        Returns:
+            str: query duckdb
+        """
+        sql = f"SELECT * FROM {INPUT_VIEW}"
+        columns = list(columns)
+        for op in self.operations:
+            if isinstance(op, Filter):
+                sql = f"SELECT * FROM ({sql}) WHERE {op.predicate}"
+            elif isinstance(op, Assign):
+                if op.column in columns:
+                    sql = (
+                        f"SELECT * REPLACE ({op.expression} AS "
+                        f"{quote(op.column)}) FROM ({sql})"
+                    )
+                else:
+                    sql = f"SELECT *, {op.expression} AS {quote(op.column)} FROM ({sql})"
+                    columns.append(op.column)
+            elif isinstance(op, Cast):
+                missing = [c for c, _ in op.dtypes if c not in columns]
+                if missing:
+                    raise KeyError(f"Columns {missing} not found")
+                casts = ", ".join(
+                    f"CAST({quote(c)} AS {t}) AS {quote(c)}"
+                    for c, t in op.dtypes
+                )
+                sql = f"SELECT * REPLACE ({casts}) FROM ({sql})"
+            elif isinstance(op, (Select, Exclude)):
+                if isinstance(op, Select):
+                    columns = list(op.columns)
+                else:
+                    columns = [c for c in columns if c not in op.columns]
+                sql = f"SELECT {', '.join(quote(c) for c in columns)} FROM ({sql})"
+            elif isinstance(op, Aggregate):
+                sql, columns = self.compile_aggregate(
+                    connection, op, sql, columns
+                )
+        # il binding della query verifica colonne e tipi senza eseguirla
+        connection.execute(f"DESCRIBE {sql}")
+        return sql
+
+    def compile_aggregate(
+        self,
+        connection: duckdb.DuckDBPyConnection,
+        op: Aggregate,
+        sql: str,
+        columns: List[str],
+    ) -> Tuple[str, List[str]]:
+        # i tipi delle colonne servono a riprodurre i tipi di pandas
+        types = {
+            row[0]: row[1]
+            for row in connection.execute(f"DESCRIBE {sql}").fetchall()
+        }
+        aggregated = (
+            list(op.columns)
+            if op.columns is not None
+            else [c for c in columns if c not in op.group_columns]
+        )
+        function = SQL_AGGREGATES[op.function]
+        expressions = []
+        for c in aggregated:
+            if op.function in ("sum", "mean") and not (
+                types[c] in INTEGER_TYPES or types[c] in ("DOUBLE", "FLOAT")
+            ):
+                raise Unsupported(f"{op.function} of {types[c]}")
+            expression = f"{function}({quote(c)})"
+            if op.function == "sum" and types[c] in INTEGER_TYPES:
+                expression = f"CAST(SUM(CAST({quote(c)} AS BIGINT)) AS BIGINT)"
+            expressions.append(f"{expression} AS {quote(c)}")
+        keys = ", ".join(quote(c) for c in op.group_columns)
+        where = ""
+        if op.dropna:
+            where = " WHERE " + " AND ".join(
+                f"{quote(c)} IS NOT NULL" for c in op.group_columns
+            )
+        sql = (
+            f"SELECT {keys}, {', '.join(expressions)} FROM ({sql}){where} "
+            f"GROUP BY {keys} ORDER BY {keys}"
+        )
+        return sql, list(op.group_columns) + aggregated
+
+    def run_eager(self, data: pd.DataFrame) -> pd.DataFrame:
+        for t in self.transformers:
+            data = t(data)
+        return data
+
+    def __call__(self, data: pd.DataFrame) -> pd.DataFrame:
+        columns = list(data.columns)
+        if self.required is not None:
+            # soltanto le colonne utilizzate vengono convertite in Arrow
+            columns = [c for c in columns if c in self.required]
+        if not data.columns.is_unique or not all(
+            isinstance(c, str) for c in data.columns
+        ):
+            # le viste di duckdb richiedono nomi di colonna univoci e stringhe
+            logger.info(f"{self}: running with pandas (column names)")
+            return self.run_eager(data)
+        try:
+            table = pa.Table.from_pandas(data[columns], preserve_index=False)
+        except (pa.ArrowException, ValueError) as e:
+            logger.info(f"{self}: running with pandas ({e})")
+            return self.run_eager(data)
+        key = tuple((f.name, str(f.type)) for f in table.schema)
+        connection = self.connection
+        connection.register(INPUT_VIEW, table)
+        try:
+            if key not in self._queries:
+                try:
+                    self._queries[key] = self.compile(
+                        connection, table.column_names
+                    )
+                    logger.debug(f"Lazy plan: {self._queries[key]}")
+                except (Unsupported, duckdb.Error) as e:
+                    logger.info(f"{self}: running with pandas ({e})")
+                    self._queries[key] = None
+            self.sql = self._queries[key]
+            if self.sql is None:
+                return self.run_eager(data)
+            return connection.execute(self.sql).df()
+        finally:
+            connection.unregister(INPUT_VIEW)
+
+
+def build_stages(transformers: List[Any], min_length: int = 2) -> List[Any]:
+    """Raggruppa i transformer supportati consecutivi in segmenti lazy.
+    I transformer non supportati restano barriere eseguite con pandas
+
+    Args:
+        transformers (List[Any]): transformer della pipeline
+        min_length (int, optional): transformer minimi di un segmento;
+            i segmenti piu' corti vengono eseguiti con pandas. Defaults to 2.
+
+    Returns:
+        List[Any]: transformer e segmenti lazy, in ordine di esecuzione
+    """
+    stages: List[Any] = []
+    pending: List[Tuple[Any, List[Operation]]] = []
+
+    def flush():
+        if len(pending) >= min_length:
+            stages.append(
+                LazySegment(
+                    [t for t, _ in pending],
+                    [op for _, ops in pending for op in ops],
+                )
+            )
+        else:
+            stages.extend(t for t, _ in pending)
+        pending.clear()
+
+    for t in transformers:
+        try:
+            pending.append((t, translate(t)))
+        except Unsupported as e:
+            logger.debug(f"Lazy barrier {t.__class__.__name__}: {e}")
+            flush()
+            stages.append(t)
+    flush()
+    return stages
@@ -1,14 +1,431 @@
 """
 Definizione dei behavior per l'esecuzione
-di operazioni di merging e concatenazione tra dataframe
+di operazioni di merging e concatenazione tra dataframe.
+I behavior vengono compilati una sola volta in un BehaviorPlan immutabile,
+che puo' essere applicato ad ogni batch senza rileggere le istruzioni.
+Ogni behavior puo' essere eseguito con pandas oppure con Arrow: in quel caso
+la concat accoda i chunk delle tabelle senza copiarli e la merge e' una hash
+join vettoriale di Arrow. Gli step Arrow con dataframe in input che hanno
+colonne annidate (liste, dizionari) vengono eseguiti con pandas
 """
-from dataclasses import dataclass
-from typing import List, Union
+import logging
+from dataclasses import dataclass, field
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple, Union
 
 import pandas as pd
+import pyarrow as pa
 from pandas import DataFrame
 
 from src.core.util.factory import Factory
+from src.core.util.frames import arrow_safe, concat_tables, nested_schema
+
+logger = logging.getLogger(__name__)
+
+# argomenti di pd.concat per cui concat(concat(a, b), c) == concat(a, b, c)
+ASSOCIATIVE_CONCAT_ARGS = {
+    "axis",
+    "join",
+    "ignore_index",
+    "sort",
+    "verify_integrity",
+    "copy",
+}
+
+# argomenti supportati dall'engine Arrow
+ARROW_CONCAT_ARGS = {"axis", "ignore_index"}
+ARROW_MERGE_ARGS = {"on", "left_on", "right_on", "how", "suffixes"}
+ARROW_JOIN_TYPES = {
+    "inner": "inner",
+    "left": "left outer",
+    "right": "right outer",
+    "outer": "full outer",
+}
+
+Frame = Union[DataFrame, pa.Table]
+
+
+class Engine(Enum):
+    """Libreria con cui vengono eseguiti gli step"""
+
+    PANDAS = "pandas"  # pd.concat e pd.merge
+    ARROW = "arrow"  # pa.concat_tables e pa.Table.join
+
+
+def as_pandas(frame: Frame) -> DataFrame:
+    return frame.to_pandas() if isinstance(frame, pa.Table) else frame
+
+
+def as_arrow(frame: Frame) -> pa.Table:
+    # l'indice di pandas non viene conservato
+    return (
+        frame
+        if isinstance(frame, pa.Table)
+        else pa.Table.from_pandas(frame, preserve_index=False)
+    )
+
+
+def arrow_supported(frames: List[Frame], join: bool = False) -> bool:
+    """Controlla lo schema dei dataframe in input di uno step Arrow
+
+    Args:
+        frames (List[Frame]): dataframe o tabelle in input
+        join (bool, optional): True per una join, che non supporta
+            colonne annidate nelle tabelle. Defaults to False.
+
+    Returns:
+        bool: False se lo step deve essere eseguito con pandas
+    """
+    for frame in frames:
+        if isinstance(frame, pa.Table):
+            if join and nested_schema(frame.schema):
+                return False
+        elif not arrow_safe(frame):
+            # la conversione in Arrow altererebbe liste e dizionari
+            return False
+    return True
+
+
+def arrow_merge(
+    left: pa.Table,
+    right: pa.Table,
+    on: Optional[Union[str, List[str]]] = None,
+    left_on: Optional[Union[str, List[str]]] = None,
+    right_on: Optional[Union[str, List[str]]] = None,
+    how: str = "inner",
+    suffixes: Tuple[str, str] = ("_x", "_y"),
+) -> pa.Table:
+    """Join tra due tabelle Arrow con la semantica (ridotta) di pd.merge
+
+    Args:
+        left (pa.Table): tabella di sinistra
+        right (pa.Table): tabella di destra
+        on (Optional[Union[str, List[str]]], optional): colonne comuni di join
+        left_on (Optional[Union[str, List[str]]], optional): colonne di left
+        right_on (Optional[Union[str, List[str]]], optional): colonne di right
+        how (str, optional): inner, left, right o outer. Defaults to "inner".
+        suffixes (Tuple[str, str], optional): suffissi delle colonne in comune.
+            Defaults to ("_x", "_y").
+
+    Returns:
+        pa.Table: risultato della join
+    """
+    keys = on if on is not None else left_on
+    right_keys = on if on is not None else right_on
+    assert (
+        keys is not None and right_keys is not None
+    ), "Join keys are required"
+    return left.join(
+        right,
+        keys=keys,
+        right_keys=right_keys,
+        join_type=ARROW_JOIN_TYPES[how],
+        left_suffix=suffixes[0],
+        right_suffix=suffixes[1],
+        # con on le colonne di join compaiono una sola volta, come in pandas
+        coalesce_keys=on is not None,
+    )
+
+
+def check_index(index: Any, name: str) -> None:
+    assert isinstance(index, int) and not isinstance(
+        index, bool
+    ), f"{name} must be an integer, got {index!r}"
+
+
+def resolve_index(index: int, n: int) -> int:
+    """Converte un indice (anche negativo) in una posizione della lista"""
+    assert -n <= index < n, f"Index {index} out of range for {n} dataframes"
+    return index % n
+
+
+@dataclass(frozen=True)
+class MergeStep:
+    """Merge tra due dataframe della lista
+
+    Attributes:
+        left (int): indice del dataframe di sinistra
+        right (int): indice del dataframe di destra
+        kwargs (Mapping[str, Any]): argomenti di pd.merge
+        engine (Engine): libreria con cui eseguire la merge
+    """
+
+    left: int
+    right: int
+    kwargs: Mapping[str, Any]
+    engine: Engine = Engine.PANDAS
+
+    def inputs(self, n: int) -> Tuple[int, ...]:
+        return resolve_index(self.left, n), resolve_index(self.right, n)
+
+    def run(self, data: List[Frame]) -> Frame:
+        if self.engine is Engine.ARROW:
+            if arrow_supported(data, join=True):
+                return arrow_merge(
+                    as_arrow(data[0]), as_arrow(data[1]), **self.kwargs
+                )
+            logger.debug("Nested columns in arrow merge, using pandas")
+        return pd.merge(as_pandas(data[0]), as_pandas(data[1]), **self.kwargs)
+
+    def input_columns(self, columns: Set[str]) -> Set[str]:
+        """Colonne dei due dataframe in input necessarie a produrre le
+        colonne indicate: le colonne di join e, per le colonne con i
+        suffissi delle colonne in comune, le colonne originali
+
+        Args:
+            columns (Set[str]): colonne del risultato
+
+        Returns:
+            Set[str]: colonne da leggere dalle due sorgenti
+        """
+        required = set(columns)
+        for arg in ("on", "left_on", "right_on"):
+            value = self.kwargs.get(arg)
+            if isinstance(value, str):
+                required.add(value)
+            elif value is not None:
+                required.update(value)
+        for suffix in self.kwargs.get("suffixes", ("_x", "_y")):
+            if suffix:
+                required.update(
+                    c[: -len(suffix)] for c in columns if c.endswith(suffix)
+                )
+        return required
+
+    def __str__(self) -> str:
+        return (
+            f"merge[{self.engine.value}](left={self.left}, right={self.right}, "
+            f"{dict(self.kwargs)})"
+        )
+
+
+@dataclass(frozen=True)
+class ConcatStep:
+    """Concatenazione di un intervallo di dataframe della lista
+
+    Attributes:
+        start (int, optional): indice del primo dataframe, None per tutti
+        end (int, optional): indice successivo all'ultimo dataframe
+        kwargs (Mapping[str, Any]): argomenti di pd.concat
+        engine (Engine): libreria con cui eseguire la concat
+    """
+
+    start: Optional[int]
+    end: Optional[int]
+    kwargs: Mapping[str, Any]
+    engine: Engine = Engine.PANDAS
+
+    def inputs(self, n: int) -> Tuple[int, ...]:
+        return tuple(range(n)[self.start : self.end])
+
+    def run(self, data: List[Frame]) -> Frame:
+        if self.engine is Engine.ARROW:
+            if arrow_supported(data):
+                try:
+                    return concat_tables([as_arrow(x) for x in data])
+                except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                    # tipi diversi della stessa colonna: pandas li converte
+                    logger.debug(f"Arrow concat failed ({e}), using pandas")
+            else:
+                logger.debug("Nested columns in arrow concat, using pandas")
+            # come con Arrow, l'indice di pandas non viene conservato
+            return pd.concat(
+                [as_pandas(x) for x in data],
+                **{**self.kwargs, "ignore_index": True},
+            )
+        return pd.concat([as_pandas(x) for x in data], **self.kwargs)
+
+    @property
+    def associative(self) -> bool:
+        return set(self.kwargs) <= ASSOCIATIVE_CONCAT_ARGS
+
+    def __str__(self) -> str:
+        return (
+            f"concat[{self.engine.value}](start={self.start}, end={self.end}, "
+            f"{dict(self.kwargs)})"
+        )
+
+
+Step = Union[MergeStep, ConcatStep]
+
+
+@dataclass(frozen=True)
+class Operation:
+    """Step risolto per un numero noto di dataframe in input
+
+    Attributes:
+        step (Step): step da eseguire
+        inputs (Tuple[int, ...]): identificativi dei dataframe in input
+        output (int): identificativo del dataframe prodotto
+    """
+
+    step: Step
+    inputs: Tuple[int, ...]
+    output: int
+
+
+@dataclass(frozen=True)
+class ResolvedPlan:
+    """Operazioni da eseguire per un dato numero di dataframe in input.
+    I dataframe in input hanno identificativi 0..n-1, ogni operazione
+    produce un nuovo identificativo
+
+    Attributes:
+        operations (Tuple[Operation, ...]): operazioni in ordine di esecuzione
+        outputs (Tuple[int, ...]): identificativi dei dataframe restituiti
+    """
+
+    operations: Tuple[Operation, ...]
+    outputs: Tuple[int, ...]
+
+    def apply(self, dfs: List[Frame], to_pandas: bool = True) -> List[Frame]:
+        data: Dict[int, Frame] = dict(enumerate(dfs))
+        for op in self.operations:
+            data[op.output] = op.step.run([data[i] for i in op.inputs])
+        outputs = [data[i] for i in self.outputs]
+        return [as_pandas(x) for x in outputs] if to_pandas else outputs
+
+    def __str__(self) -> str:
+        lines = [
+            f"#{op.output} = {op.step.__class__.__name__}[{op.step.engine.value}]"
+            f"({', '.join(f'#{i}' for i in op.inputs)})"
+            for op in self.operations
+        ]
+        lines.append(f"return {', '.join(f'#{i}' for i in self.outputs)}")
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class BehaviorPlan:
+    """Piano di riduzione compilato a partire dai behavior.
+    Ogni stage corrisponde ad un behavior: gli indici degli step si
+    riferiscono alla lista prodotta dallo stage precedente, a cui ogni
+    step aggiunge in coda il proprio risultato. Alla fine di ogni stage
+    restano soltanto i dataframe non utilizzati dagli step
+
+    Attributes:
+        stages (Tuple[Tuple[Step, ...], ...]): step di ogni behavior
+    """
+
+    stages: Tuple[Tuple[Step, ...], ...]
+    _resolved: Dict[int, ResolvedPlan] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+    def resolve(self, n: int) -> ResolvedPlan:
+        """Risolve gli indici degli step per n dataframe in input
+        e fonde le concat consecutive. Il risultato viene memorizzato
+
+        Args:
+            n (int): numero di dataframe in input
+
+        Returns:
+            ResolvedPlan: operazioni da eseguire
+        """
+        if n in self._resolved:
+            return self._resolved[n]
+        operations: List[Operation] = []
+        current = list(range(n))
+        next_id = n
+        for stage in self.stages:
+            items = list(current)
+            used = set()
+            for step in stage:
+                positions = step.inputs(len(items))
+                operations.append(
+                    Operation(
+                        step, tuple(items[p] for p in positions), next_id
+                    )
+                )
+                used.update(positions)
+                items.append(next_id)
+                next_id += 1
+            current = [x for p, x in enumerate(items) if p not in used]
+        plan = ResolvedPlan(fuse_concats(operations, current), tuple(current))
+        self._resolved[n] = plan
+        return plan
+
+    def apply(self, dfs: List[Frame], to_pandas: bool = True) -> List[Frame]:
+        return self.resolve(len(dfs)).apply(dfs, to_pandas)
+
+    @property
+    def steps(self) -> Tuple[Step, ...]:
+        return tuple(step for stage in self.stages for step in stage)
+
+    def input_columns(self, columns: Set[str]) -> Set[str]:
+        """Colonne dei dataframe in input necessarie a produrre le colonne
+        indicate: oltre a queste, le colonne usate dalle merge del piano"""
+        required = set(columns)
+        for step in self.steps:
+            if isinstance(step, MergeStep):
+                required |= step.input_columns(required)
+        return required
+
+    @property
+    def foldable(self) -> bool:
+        """True se il piano concatena tutti i dataframe in input, per cui
+        puo' essere applicato accumulando un dataframe alla volta"""
+        steps = self.steps
+        return bool(steps) and all(
+            len(stage) == 1
+            and isinstance(stage[0], ConcatStep)
+            and stage[0].start is None
+            and stage[0].end is None
+            and stage[0].associative
+            and stage[0].engine is steps[0].engine
+            and dict(stage[0].kwargs) == dict(steps[0].kwargs)
+            for stage in self.stages
+        )
+
+    def __str__(self) -> str:
+        return "\n".join(
+            f"stage {i}: " + "; ".join(str(s) for s in stage)
+            for i, stage in enumerate(self.stages)
+        )
+
+
+def fuse_concats(
+    operations: List[Operation], outputs: List[int]
+) -> Tuple[Operation, ...]:
+    """Fonde una concat nella concat successiva che ne utilizza il risultato,
+    se nessun'altra operazione lo utilizza e gli argomenti coincidono:
+    il risultato e' un'unica pd.concat sui dataframe originali
+
+    Args:
+        operations (List[Operation]): operazioni in ordine di esecuzione
+        outputs (List[int]): dataframe restituiti dal piano
+
+    Returns:
+        Tuple[Operation, ...]: operazioni dopo la fusione
+    """
+    uses: Dict[int, int] = {i: 1 for i in outputs}
+    for op in operations:
+        for i in op.inputs:
+            uses[i] = uses.get(i, 0) + 1
+    producers = {op.output: op for op in operations}
+    fused = set()
+    result = []
+    for op in operations:
+        if isinstance(op.step, ConcatStep) and op.step.associative:
+            inputs: List[int] = []
+            for i in op.inputs:
+                producer = producers.get(i)
+                if (
+                    producer is not None
+                    and isinstance(producer.step, ConcatStep)
+                    and producer.step.engine is op.step.engine
+                    and dict(producer.step.kwargs) == dict(op.step.kwargs)
+                    and uses[i] == 1
+                ):
+                    inputs.extend(producer.inputs)
+                    fused.add(i)
+                else:
+                    inputs.append(i)
+            op = Operation(op.step, tuple(inputs), op.output)
+            producers[op.output] = op
+        result.append(op)
+    return tuple(op for op in result if op.output not in fused)
 
 
 @dataclass
@@ -17,131 +434,142 @@ class Behavior:
 
     # dizionario che contiene le istruzioni per istanziare e behavior concreti
     instructions: Union[dict, List[dict]]
+    # libreria con cui eseguire le istruzioni: pandas o arrow
+    engine: Union[str, Engine] = Engine.PANDAS
 
-    @dataclass
-    class DataFrameFlagPair:
-        """Pair DataFrame, flag false se è stato processato"""
+    def __post_init__(self) -> None:
+        self.engine = Engine(self.engine)
+        instructions = (
+            [self.instructions]
+            if isinstance(self.instructions, dict)
+            else self.instructions
+        )
+        # le istruzioni vengono validate e compilate una sola volta
+        self.steps: Tuple[Step, ...] = tuple(
+            self.compile(dict(i)) for i in instructions
+        )
+
+    def compile(self, instructions_dict: dict) -> Step:
+        """Converte un dizionario di istruzioni in uno step immutabile
 
-        data: pd.DataFrame
-        flg: bool
+        Args:
+            instructions_dict (dict): copia del dizionario delle istruzioni
+
+        Returns:
+            Step: step da eseguire
+        """
+        raise NotImplementedError()
 
-    def apply(self, dfs: List[pd.DataFrame]) -> List[pd.DataFrame]:
+    def apply(self, dfs: List[Frame], to_pandas: bool = True) -> List[Frame]:
         """Applica le istruzioni specificate nel campo instructions sulla lista di dataframe input
 
         Args:
-            dfs (List[pd.DataFrame]): lista di dataframe su cui applicare le behavior
+            dfs (List[Frame]): lista di dataframe su cui applicare le behavior
+            to_pandas (bool, optional): False per restituire le tabelle Arrow
+                prodotte dall'engine arrow. Defaults to True.
 
         Returns:
             List[pd.DataFrame]: lista di dataframe a seguito dell'applicazione dei behavior
         """
-        # aggiungo il flag ad ogni data frame in ingresso
-        dfs_pairs = [Behavior.DataFrameFlagPair(x, True) for x in dfs]
-        if isinstance(self.instructions, dict):
-            instructions = [self.instructions]
-        else:
-            instructions = self.instructions
-        # applico il behavior (merge/concat)
-        for instructions_dict in instructions:
-            self.__call__(dfs_pairs, instructions_dict)
-
-        # prendo soltanto i dataframe con flag true, ovvero i dataframe che non
-        # sono stati mergiati con altri dataframe
-        dfs = list(map(lambda x: x.data, filter(lambda x: x.flg, dfs_pairs)))
-        return dfs
-
-    def __call__(
-        self, dfs: List[DataFrameFlagPair], instructions_dict: dict
-    ) -> None:
-        raise NotImplementedError()
+        return BehaviorPlan((self.steps,)).apply(dfs, to_pandas)
 
 
 class MergeBehavior(Behavior):
     """Classe per la definizioni di operazioni di merging tra dataframe"""
 
-    def __call__(
-        self, dfs: List[Behavior.DataFrameFlagPair], instructions_dict: dict
-    ) -> None:
-        """Implementazione dell'operazione di merge. L'operazione è guidata dal dizionario instructions_dict
+    def compile(self, instructions_dict: dict) -> Step:
+        """Compila l'operazione di merge. L'operazione è guidata dal dizionario instructions_dict
 
         Example:
-            Supponiamo di ricevere in input la seguente lista: [[data=df1, flg=True], [data=df2, flg=False]]
+            Supponiamo di ricevere in input la seguente lista: [df1, df2]
             il dizionario con le istruzioni deve contenere le seguente informazioni:
             - left:int, indice del dataframe di sinistra
             - right: int, indice del dataframe di destra
             - kwargs: coppie chiave/valore da passare al metodo pd.merge
             Se abbiamo il dizionario {left:0, right:1, on=col1, how=left}
             verra eseguita una left join sul campo col tra il primo e il secondo dataframe.
-            Il risultato viene inserito in coda alla lista di input, cambiando il flg dei dizionari
-            coinvolti nella merge:
-            - [[data=df1, flg=False], [data=df2, flg=False],[data=df3, flg=True]],
-            dove df3 è il risultato del merge tra df1 e df2
+            Il risultato viene inserito in coda alla lista di input e i dataframe
+            coinvolti nella merge non vengono restituiti.
+            Con engine arrow sono supportati soltanto on, left_on, right_on,
+            how e suffixes
 
         Args:
-            dfs (List[Behavior.DataFrameFlagPair]): lista di dataframe da trasforrmare
             instructions_dict (dict): dizionario che contiene le informazioni per eseguire il merging
+
+        Returns:
+            Step: step di merge
         """
-        # prendo l'indice dei dataframe oggetto del merging dal dizionario
-        left_idx = instructions_dict.pop("left")
-        right_idx = instructions_dict.pop("right")
-        left_df = dfs[left_idx].data
-        right_df = dfs[right_idx].data
-        df = pd.merge(left_df, right_df, **instructions_dict)  # type: ignore
-        # setto il flag dei dataset originali a false, indica che sono stati
-        # mergiati con altri dataframe
-        dfs[left_idx].flg = False
-        dfs[right_idx].flg = False
-        # appendo il dataframe risultante dal merging alla fine della lista
-        dfs.append(MergeBehavior.DataFrameFlagPair(df, True))
+        assert (
+            "left" in instructions_dict and "right" in instructions_dict
+        ), "Merge instructions require left and right"
+        left = instructions_dict.pop("left")
+        right = instructions_dict.pop("right")
+        check_index(left, "left")
+        check_index(right, "right")
+        if self.engine is Engine.ARROW:
+            unsupported = set(instructions_dict) - ARROW_MERGE_ARGS
+            assert (
+                not unsupported
+            ), f"Unsupported arrow merge args: {unsupported}"
+            assert (
+                instructions_dict.get("how", "inner") in ARROW_JOIN_TYPES
+            ), f"Unsupported arrow join: {instructions_dict['how']}"
+        return MergeStep(
+            left, right, MappingProxyType(instructions_dict), self.engine
+        )
 
 
 class ConcatBehavior(Behavior):
     """Classe per la definizione delle operazioni di concat"""
 
-    def __call__(
-        self, dfs: List[Behavior.DataFrameFlagPair], instructions_dict: dict
-    ) -> None:
-        """Implementazione dell'operazione di concat. L'operazione è guidata dal dizionario instructions_dict
+    def compile(self, instructions_dict: dict) -> Step:
+        """Compila l'operazione di concat. L'operazione è guidata dal dizionario instructions_dict
 
         Example:
-            Supponiamo di ricevere in input la seguente lista: [[data=df1, flg=True], [data=df2, flg=False]]
             il dizionario con le istruzioni deve contenere le seguente informazioni:
             - start:int, indice del primo dataframe da concatenare (default 0)
-            - end: int, indice dell'ultimo dataframe da concatenare (defaul l'ultimo datafram della lista)
+            - end: int, indice successivo all'ultimo dataframe da concatenare
+              (default la lunghezza della lista)
             - kwargs: coppie chiave/valore da passare al metodo pd.concat
             Se abbiamo il dizionario {axis=0} verra eseguita una concat lungo l'asse 0 di tutti
-            id dataframe contenuti nella lista
-            verra eseguita una left join sul campo col tra il primo e il secondo dataframe.
-            Il risultato viene inserito in coda alla lista di input, cambiando il flg dei dizionari
-            coinvolti nella merge:
-            - [[data=df1, flg=False], [data=df2, flg=False],[data=df3, flg=True]],
-            dove df3 è il risultato del merge tra df1 e df2
+            id dataframe contenuti nella lista.
+            Il risultato viene inserito in coda alla lista di input e i dataframe
+            concatenati non vengono restituiti.
+            Con engine arrow la concat e' sempre lungo le righe e l'indice
+            di pandas non viene conservato
 
         Args:
-            dfs (List[Behavior.DataFrameFlagPair]): lista di dataframe da trasforrmare
-            instructions_dict (dict): dizionario che contiene le informazioni per eseguire il merging
+            instructions_dict (dict): dizionario che contiene le informazioni per eseguire la concat
+
+        Returns:
+            Step: step di concat
         """
-        start_idx = instructions_dict.pop("start", None)
-        end_idx = instructions_dict.pop("end", None)
-        if start_idx is None and end_idx is None:
-            # vuol dire che la concat deve essere eseguita
-            # sull'intera lista di dataframe
-            start_idx, end_idx = 0, len(dfs)
-
-        # recupero la lista di dataframe
-        data = [x.data for x in dfs[start_idx:end_idx]]
-        dfs.append(
-            MergeBehavior.DataFrameFlagPair(
-                pd.concat(data, **(instructions_dict)), True
-            )
+        start = instructions_dict.pop("start", None)
+        end = instructions_dict.pop("end", None)
+        for name, index in (("start", start), ("end", end)):
+            if index is not None:
+                check_index(index, name)
+        if self.engine is Engine.ARROW:
+            unsupported = set(instructions_dict) - ARROW_CONCAT_ARGS
+            assert (
+                not unsupported
+            ), f"Unsupported arrow concat args: {unsupported}"
+            assert instructions_dict.get("axis", 0) in (
+                0,
+                "index",
+            ), "Arrow concat only supports axis=0"
+        return ConcatStep(
+            start, end, MappingProxyType(instructions_dict), self.engine
         )
-        # setto a false il flag dei dataframe coinvolti
-        for df_pair in dfs[start_idx:end_idx]:
-            df_pair.flg = False
 
 
 class BehaviorManager:
     """Classe che gestisce l'applicazione dei
     behavior (merge, concat) sui dataframe
+
+    Attributes:
+        behaviors (List[Behavior]): behavior istanziati
+        plan (BehaviorPlan): piano di riduzione compilato dai behavior
     """
 
     def __init__(self, *, behaviors: Union[dict, List[dict]]) -> None:
@@ -152,8 +580,9 @@ class BehaviorManager:
             behaviors = [behaviors]
         for bh_dict in behaviors:
             self.behaviors.append(factory.create(bh_dict))
+        self.plan = BehaviorPlan(tuple(b.steps for b in self.behaviors))
 
-    def reduce(self, dfs: List[DataFrame]) -> List[DataFrame]:
+    def reduce(self, dfs: List[Frame], to_pandas: bool = True) -> List[Frame]:
         """Riceve in input una lista di dataframe e applica
         delle operazioni di merging o concatenazione sulla base
         delle specifiche definite all'interno di merge_behavior
@@ -162,11 +591,15 @@ class BehaviorManager:
         Args:
             dfs: lista di dataframe su cui
                 applicare le trasformazioni
+            to_pandas: False per ricevere le tabelle Arrow prodotte
+                dai behavior con engine arrow
 
         Returns:
             il dataframe ottenuto in seguito all'applicazione
             del merge e concat behavior
         """
-        for beh in self.behaviors:
-            dfs = beh.apply(dfs)
-        return dfs
+        return self.plan.apply(dfs, to_pandas)
+
+    def explain(self, n: int) -> str:
+        """Descrizione delle operazioni eseguite su n dataframe in input"""
+        return str(self.plan.resolve(n))
@@ -0,0 +1,77 @@
+"""
+Compatibilita' tra dataframe pandas e tabelle Arrow.
+Le colonne object con valori annidati (liste, dizionari, tuple) non
+sopravvivono al passaggio in Arrow: le liste tornano come numpy.ndarray
+e i dizionari diventano struct con l'unione delle chiavi. I dataframe
+con queste colonne devono quindi restare in pandas (o essere serializzati
+con pickle)
+"""
+from typing import List
+
+import pyarrow as pa
+from pandas import DataFrame
+from pandas.api.types import infer_dtype
+
+# pyarrow 14 sostituisce promote=True di concat_tables con promote_options
+PYARROW_MAJOR = int(pa.__version__.split(".")[0])
+
+# tipi inferiti delle colonne object che Arrow converte senza perdite
+SCALAR_KINDS = {
+    "empty",
+    "string",
+    "bytes",
+    "boolean",
+    "integer",
+    "floating",
+    "mixed-integer-float",
+    "decimal",
+    "date",
+    "time",
+    "datetime",
+    "datetime64",
+    "timedelta",
+    "timedelta64",
+}
+
+
+def nested_columns(df: DataFrame) -> List[str]:
+    """Colonne object del dataframe che contengono valori non scalari
+
+    Args:
+        df (DataFrame): dataframe da controllare
+
+    Returns:
+        List[str]: colonne non convertibili in Arrow senza perdite
+    """
+    return [
+        name
+        for name, column in df.items()
+        if column.dtype == object
+        and infer_dtype(column, skipna=True) not in SCALAR_KINDS
+    ]
+
+
+def arrow_safe(df: DataFrame) -> bool:
+    """True se il dataframe puo' passare da Arrow e tornare identico"""
+    return not nested_columns(df)
+
+
+def nested_schema(schema: pa.Schema) -> bool:
+    """True se lo schema contiene liste, struct o map"""
+    return any(pa.types.is_nested(f.type) for f in schema)
+
+
+def concat_tables(tables: List[pa.Table]) -> pa.Table:
+    """Concatena tabelle Arrow senza copiarne i chunk. Le colonne mancanti
+    in una tabella diventano null, tipi diversi della stessa colonna
+    sollevano pa.ArrowTypeError
+
+    Args:
+        tables (List[pa.Table]): tabelle da concatenare
+
+    Returns:
+        pa.Table: tabella con i chunk di tutte le tabelle
+    """
+    if PYARROW_MAJOR >= 14:
+        return pa.concat_tables(tables, promote_options="default")
+    return pa.concat_tables(tables, promote=True)
@@ -9,6 +9,9 @@ from typing import List
 
 logger = logging.getLogger(__name__)
 
+# plugin caricati nel processo corrente, da replicare nei processi worker
+_loaded_plugins: List[str] = []
+
 
 class PluginInterface:
     """Interfaccia per ogni modulo"""
@@ -31,8 +34,19 @@ def load_plugins(plugins: List[str]) -> None:
     Parameters:
         plugins
     """
-    for pname in plugins:
-        pname = f"src.{pname}"
+    for name in plugins:
+        pname = f"src.{name}"
         logger.info("importing %s", pname)
         plugin = import_module(pname)
         plugin.initialize()
+        if name not in _loaded_plugins:
+            _loaded_plugins.append(name)
+
+
+def loaded_plugins() -> List[str]:
+    """Restituisce i plugin caricati nel processo corrente
+
+    Returns:
+        List[str]: nomi dei plugin, senza il prefisso src.
+    """
+    return list(_loaded_plugins)
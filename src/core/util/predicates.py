@@ -0,0 +1,186 @@
+"""
+Predicati semplici (colonna, operatore, valore) riconosciuti nelle
+espressioni di query dei transformer, che i reader possono applicare
+in lettura: filters di parquet per saltare partizioni e row group,
+clausole WHERE per le sorgenti sql.
+Un predicato viene spinto verso il reader solo se scarta un
+sottoinsieme delle righe scartate dal filtro originale, che resta
+comunque applicato dal transformer
+"""
+import ast
+from dataclasses import dataclass, replace
+from typing import Any, List, Optional
+
+# operatori di confronto supportati. != e not in sono esclusi: in pandas
+# mantengono i valori mancanti, che sql e parquet invece scartano
+OPERATORS = {
+    ast.Eq: "==",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.In: "in",
+}
+# operatore equivalente con gli operandi scambiati (valore op colonna)
+FLIPPED = {"==": "==", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+SQL_OPERATORS = {"==": "="}
+
+
+@dataclass(frozen=True)
+class Aggregate:
+    """Aggregato della colonna del predicato calcolato sulla sorgente,
+    ad esempio insert_date == insert_date.max(). Coincide con quello
+    calcolato da pandas soltanto se nessun filtro precedente ha scartato
+    righe, per questo Pipeline.predicates lo spinge solo dal primo step
+
+    Attributes:
+        func (str): max oppure min
+    """
+
+    func: str
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """Confronto tra una colonna e un valore costante
+
+    Attributes:
+        column (str): colonna del confronto
+        op (str): operatore (==, <, <=, >, >=, in)
+        value (Any): valore costante, lista di valori per in,
+            oppure Aggregate da risolvere sulla sorgente
+    """
+
+    column: str
+    op: str
+    value: Any
+
+    @property
+    def aggregate(self) -> bool:
+        return isinstance(self.value, Aggregate)
+
+    def resolve(self, value: Any) -> "Predicate":
+        """Predicato con il valore dell'aggregato calcolato dal reader"""
+        return replace(self, value=value)
+
+    def to_parquet(self) -> tuple:
+        """Filtro nel formato di pyarrow.parquet (colonna, op, valore)"""
+        assert not self.aggregate, "Aggregates must be resolved"
+        return (self.column, self.op, self.value)
+
+    def to_sql(self, source: Optional[str] = None) -> str:
+        """Condizione sql del predicato
+
+        Args:
+            source (Optional[str], optional): tabella (o subquery con alias)
+                su cui calcolare l'aggregato. Defaults to None.
+
+        Returns:
+            str: condizione da inserire nella clausola WHERE
+        """
+        op = SQL_OPERATORS.get(self.op, self.op)
+        if self.aggregate:
+            assert source is not None, "Aggregates require a source"
+            value = f"(select {self.value.func}({self.column}) from {source})"
+        elif self.op == "in":
+            value = f"({', '.join(sql_literal(v) for v in self.value)})"
+        else:
+            value = sql_literal(self.value)
+        return f"{self.column} {op} {value}"
+
+    def __str__(self) -> str:
+        value = (
+            f"{self.column}.{self.value.func}()"
+            if self.aggregate
+            else repr(self.value)
+        )
+        return f"{self.column} {self.op} {value}"
+
+
+def sql_literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def literal(node: ast.AST) -> Any:
+    """Valore di una costante (o lista di costanti) dell'espressione.
+    Solleva ValueError se il nodo non e' una costante supportata"""
+    value = ast.literal_eval(node)
+    values = value if isinstance(value, (list, tuple)) else [value]
+    if not all(isinstance(v, (bool, int, float, str)) for v in values):
+        raise ValueError(f"Unsupported literal {value!r}")
+    return list(value) if isinstance(value, (list, tuple)) else value
+
+
+def aggregate(node: ast.AST) -> Optional[Aggregate]:
+    """Aggregato di una colonna nella forma col.max() o col.min()"""
+    if (
+        isinstance(node, ast.Call)
+        and not node.args
+        and not node.keywords
+        and isinstance(node.func, ast.Attribute)
+        and isinstance(node.func.value, ast.Name)
+        and node.func.attr in ("max", "min")
+    ):
+        return Aggregate(node.func.attr)
+    return None
+
+
+def compare(left: ast.AST, op: ast.cmpop, right: ast.AST) -> List[Predicate]:
+    if type(op) not in OPERATORS:
+        return []
+    op = OPERATORS[type(op)]
+    if not isinstance(left, ast.Name):
+        if op == "in" or not isinstance(right, ast.Name):
+            return []
+        left, right, op = right, left, FLIPPED[op]
+    agg = aggregate(right)
+    if agg is not None:
+        # soltanto l'aggregato della stessa colonna (col == col.max())
+        if op == "in" or right.func.value.id != left.id:
+            return []
+        return [Predicate(left.id, op, agg)]
+    try:
+        value = literal(right)
+    except (ValueError, TypeError):
+        return []
+    if (op == "in") != isinstance(value, list) or value == []:
+        return []
+    return [Predicate(left.id, op, value)]
+
+
+def conjuncts(node: ast.AST) -> List[Predicate]:
+    """Predicati della congiunzione: le condizioni non riconosciute
+    (o in or) non vengono spinte, ma restano nel filtro originale"""
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [p for value in node.values for p in conjuncts(value)]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitAnd):
+        return conjuncts(node.left) + conjuncts(node.right)
+    if isinstance(node, ast.Compare):
+        # i confronti concatenati (a < b < c) sono una congiunzione
+        operands = [node.left] + node.comparators
+        return [
+            p
+            for left, op, right in zip(operands, node.ops, operands[1:])
+            for p in compare(left, op, right)
+        ]
+    return []
+
+
+def parse_predicates(expression: str) -> List[Predicate]:
+    """Predicati semplici di una espressione di DataFrame.query
+
+    Args:
+        expression (str): espressione del filtro
+
+    Returns:
+        List[Predicate]: predicati in congiunzione implicati dal filtro
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError:
+        return []
+    return conjuncts(tree.body)
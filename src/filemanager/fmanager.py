@@ -1,10 +1,17 @@
+import logging
 import os
 import re
 from copy import copy as copy_copy
+from enum import Enum
 from shutil import copy, move
-from typing import Any, Dict, Iterator, List, Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Set, Union
 import pathlib
 
+import fsspec
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
 from pandas import (
     DataFrame,
     ExcelWriter,
@@ -20,6 +27,67 @@ from src.core.datamanager.base import (
     DataWriterDecorator,
     DataReaderDecorator,
 )
+from src.core.util.behaviors import MergeStep
+from src.core.util.predicates import Predicate
+from src.filemanager.join import partitioned_join
+
+logger = logging.getLogger(__name__)
+
+# formati per cui la lettura puo' essere limitata a un sottoinsieme di colonne
+PROJECTABLE_FORMATS = ("csv", "xlsx", "parquet")
+
+
+def file_format(path: str) -> str:
+    return path.split(".")[-1]
+
+
+def parquet_dataset(path: str) -> ds.Dataset:
+    """Dataset di un file parquet, o di una directory partizionata con
+    le colonne di partizione di FileWriter (partition_cols)"""
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    return ds.dataset(
+        fs_path, filesystem=fs, format="parquet", partitioning="hive"
+    )
+
+
+def parquet_columns(path: str) -> List[str]:
+    """Colonne di un file parquet, o di una directory partizionata
+    (comprese le colonne di partizione), lette dai soli metadati"""
+    return parquet_dataset(path).schema.names
+
+
+def parquet_filters(
+    dataset: ds.Dataset, predicates: List[Predicate]
+) -> List[tuple]:
+    """Filtri di read_parquet per i predicati sulle colonne del dataset.
+    Gli aggregati (es. la massima insert_date) vengono calcolati leggendo
+    la sola colonna del predicato, per le colonne di partizione dai
+    soli nomi delle directory
+
+    Args:
+        dataset (ds.Dataset): dataset da leggere
+        predicates (List[Predicate]): predicati della pushdown
+
+    Returns:
+        List[tuple]: filtri in congiunzione
+    """
+    filters = []
+    for predicate in predicates:
+        if predicate.column not in dataset.schema.names:
+            continue
+        if predicate.aggregate:
+            column = dataset.to_table(columns=[predicate.column])[
+                predicate.column
+            ]
+            try:
+                value = getattr(pc, predicate.value.func)(column).as_py()
+            except pa.ArrowNotImplementedError:
+                continue
+            if value is None:
+                continue
+            predicate = predicate.resolve(value)
+        filters.append(predicate.to_parquet())
+    return filters
 
 
 class FileReader(DataReader):
@@ -32,6 +100,10 @@ class FileReader(DataReader):
         read_args (Optional[dict], optional): Dizionario,
             o lista di dizionari contenenti le istruzioni da usare in fase di read. Defaults to None.
         bh_manager (BheaviorManager): BehaviorManager
+        projection (Set[str], optional): colonne da leggere, impostate dalla
+            projection pushdown del task. None per leggere tutte le colonne
+        filters (List[Predicate]): predicati della predicate pushdown del task,
+            applicati in lettura ai file parquet
     """
 
     def __init__(
@@ -55,6 +127,73 @@ class FileReader(DataReader):
         super(FileReader, self).__init__(behaviors=behaviors)
         self.input_path = input_path
         self.read_args = {} if read_args is None else read_args
+        self.projection: Optional[Set[str]] = None
+        self.filters: List[Predicate] = []
+
+    def push_columns(self, columns: Set[str]) -> bool:
+        paths = (
+            [self.input_path]
+            if isinstance(self.input_path, str)
+            else self.input_path
+        )
+        if any(file_format(p) not in PROJECTABLE_FORMATS for p in paths):
+            return False
+        if self.bh_manager is not None:
+            # le colonne di join servono ai behavior anche se il
+            # transformer non le usa
+            columns = self.bh_manager.plan.input_columns(columns)
+        self.projection = set(columns)
+        return True
+
+    def projected_args(self, path: str, read_args: dict) -> dict:
+        """Argomenti di lettura che limitano la lettura alle colonne
+        della projection. Gli argomenti espliciti hanno la precedenza"""
+        if self.projection is None:
+            return read_args
+        projection = self.projection
+        fmt = file_format(path)
+        if fmt == "parquet" and "columns" not in read_args:
+            # le colonne assenti nel file farebbero fallire la lettura
+            columns = [c for c in parquet_columns(path) if c in projection]
+            if columns:
+                return dict(read_args, columns=columns)
+        elif fmt in ("csv", "xlsx") and "usecols" not in read_args:
+            if read_args.get("header", 0) is None and "names" not in read_args:
+                # senza intestazione le colonne sono posizionali
+                return read_args
+            return dict(read_args, usecols=lambda c: c in projection)
+        return read_args
+
+    def push_filters(self, predicates: List[Predicate]) -> List[Predicate]:
+        # con piu' file i behavior possono unire righe di sorgenti diverse
+        if (
+            not isinstance(self.input_path, str)
+            or file_format(self.input_path) != "parquet"
+            or "filters" in self.read_args
+        ):
+            return []
+        self.filters = list(predicates)
+        return self.filters
+
+    def read_filtered(
+        self, reading_f: Any, path: str, read_args: dict
+    ) -> DataFrame:
+        """Legge un file con i filtri della predicate pushdown. Se i filtri
+        non sono applicabili (ad esempio per il tipo dei valori) il file
+        viene letto senza filtri, che restano applicati dal transformer"""
+        filters = (
+            parquet_filters(parquet_dataset(path), self.filters)
+            if self.filters
+            else []
+        )
+        if not filters:
+            return reading_f(path, **read_args)
+        logger.info(f"Predicate pushdown on {path}: {filters}")
+        try:
+            return reading_f(path, filters=filters, **read_args)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, TypeError) as e:
+            logger.warning(f"Predicate pushdown failed on {path}: {e}")
+            return reading_f(path, **read_args)
 
     def read(self) -> Iterator[DataFrame]:
         reading_f = {
@@ -64,8 +203,10 @@ class FileReader(DataReader):
             "parquet": read_parquet,
         }
         if isinstance(self.input_path, str):
-            df = reading_f[self.input_path.split(".")[-1]](
-                self.input_path, **(self.read_args)
+            df = self.read_filtered(
+                reading_f[file_format(self.input_path)],
+                self.input_path,
+                self.projected_args(self.input_path, self.read_args),
             )
         else:
             read_args_values = list(self.read_args.values())
@@ -83,14 +224,16 @@ class FileReader(DataReader):
 
             dfs = []
             for pos, path in enumerate(self.input_path):
-                path_read_args = read_args.get(str(pos), {})
+                path_read_args = self.projected_args(
+                    path, read_args.get(str(pos), {})
+                )
                 dfs.append(
-                    reading_f[path.split(".")[-1]](path, **path_read_args)
+                    reading_f[file_format(path)](path, **path_read_args)
                 )
 
             # mutliple dataset - they must be merged into a single one
             if self.bh_manager:
-                self.bh_manager.reduce(dfs)
+                dfs = self.bh_manager.reduce(dfs)
             assert len(dfs) == 1, "You must provide a single dataframe"
             df = dfs.pop(0)
         yield df
@@ -295,6 +438,25 @@ class BatchFileWriterDecorator(DataWriterDecorator):
 
 
 class BatchFileReaderDecorator(DataReaderDecorator):
+    """Decorator che legge i file di un input suddiviso in batch
+    (file con il numero del batch nel nome).
+    Con una lista di input, in modalita PAIRED vengono letti insieme i batch
+    con la stessa posizione, in modalita JOIN i due input vengono uniti
+    con una join out-of-core, anche se i batch non sono co-partizionati
+
+    Attributes:
+        file_regex (str): regex del numero del batch nel nome del file
+        mode (BatchFileReaderDecorator.Mode): modalita di lettura delle liste
+        partitions (int): numero di partizioni della join
+        spill_dir (str, optional): directory dei file temporanei della join
+    """
+
+    class Mode(Enum):
+        """Modalita di lettura di una lista di input"""
+
+        PAIRED = "paired"  # batch i di ogni input, uniti dai behavior
+        JOIN = "join"  # join partizionata su disco tra due input
+
     def __init__(
         self,
         *,
@@ -303,6 +465,9 @@ class BatchFileReaderDecorator(DataReaderDecorator):
         behaviors: Optional[
             Union[Dict[str, Any], List[Dict[str, Any]]]
         ] = None,
+        mode: str = "paired",
+        partitions: int = 16,
+        spill_dir: Optional[str] = None,
     ) -> None:
         super(BatchFileReaderDecorator, self).__init__(
             wrapped_reader=wrapped_reader,
@@ -314,6 +479,28 @@ class BatchFileReaderDecorator(DataReaderDecorator):
         assert hasattr(
             self.wrapped_reader, "input_path"
         ), "Wrapped element does not have input_path attribute"
+        self.mode = BatchFileReaderDecorator.Mode(mode)
+        self.partitions = partitions
+        self.spill_dir = spill_dir
+        if self.mode is BatchFileReaderDecorator.Mode.JOIN:
+            self.merge = self.join_merge()
+
+    def join_merge(self) -> MergeStep:
+        """Merge della modalita JOIN, definita dai behavior del reader
+        decorato (o, in alternativa, da quelli del decorator)"""
+        assert (
+            isinstance(self.wrapped_reader.input_path, list)
+            and len(self.wrapped_reader.input_path) == 2
+        ), "Join mode requires two input paths"
+        bh_manager = self.wrapped_reader.bh_manager or self.bh_manager
+        assert bh_manager is not None, "Join mode requires a merge behavior"
+        steps = bh_manager.plan.steps
+        assert len(steps) == 1 and isinstance(
+            steps[0], MergeStep
+        ), "Join mode requires a single merge"
+        left, right = steps[0].inputs(2)
+        assert left != right, "Join mode requires two distinct inputs"
+        return steps[0]
 
     def read(self) -> Iterator[DataFrame]:
         def get_ordered_list(path: pathlib.Path) -> list[pathlib.Path]:
@@ -346,6 +533,17 @@ class BatchFileReaderDecorator(DataReaderDecorator):
             input_paths_list = []
             for i, path in enumerate(self.wrapped_reader.input_path):
                 input_paths_list.append(get_ordered_list(pathlib.Path(path)))
+
+            if self.mode is BatchFileReaderDecorator.Mode.JOIN:
+                left, right = self.merge.inputs(2)
+                yield from partitioned_join(
+                    self.read_files(input_paths_list[left], left),
+                    self.read_files(input_paths_list[right], right),
+                    self.merge,
+                    self.partitions,
+                    self.spill_dir,
+                )
+                return
             
             assert len(set([len(x) for x  in input_paths_list]))==1, "Different number of batches"
             
@@ -355,4 +553,19 @@ class BatchFileReaderDecorator(DataReaderDecorator):
 
                 yield from self.wrapped_reader.read()
         
-        self.wrapped_reader.input_path = input_path_copy
\ No newline at end of file
+        self.wrapped_reader.input_path = input_path_copy
+
+    def read_files(
+        self, paths: List[pathlib.Path], pos: int
+    ) -> Iterator[DataFrame]:
+        """Legge uno alla volta i batch di un input con il reader decorato,
+        usando gli argomenti di lettura dell'input in posizione pos"""
+        read_args = self.wrapped_reader.read_args
+        values = list(read_args.values())
+        if len(values) > 0 and isinstance(values[0], dict):
+            read_args = read_args.get(str(pos), {})
+        reader = FileReader(input_path="", read_args=read_args)
+        reader.projection = self.wrapped_reader.projection
+        for path in paths:
+            reader.input_path = path.as_posix()
+            yield from reader.read()
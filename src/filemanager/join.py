@@ -0,0 +1,159 @@
+"""
+Join out-of-core tra due sequenze di batch: i batch di entrambe le sorgenti
+vengono partizionati con un hash delle colonne di join in file Parquet
+temporanei, dopodiche' ogni partizione viene unita separatamente.
+In memoria resta soltanto una partizione per volta
+"""
+import logging
+import os
+import tempfile
+from typing import Iterable, Iterator, List, Optional
+
+import pandas as pd
+from pandas import DataFrame
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from src.core.util.behaviors import MergeStep, as_pandas
+
+logger = logging.getLogger(__name__)
+
+
+def join_keys(merge: MergeStep) -> List[List[str]]:
+    """Colonne di join della sorgente left e della sorgente right
+
+    Args:
+        merge (MergeStep): merge da eseguire
+
+    Returns:
+        List[List[str]]: colonne di join delle due sorgenti
+    """
+    kwargs = merge.kwargs
+    left = kwargs.get("on", kwargs.get("left_on"))
+    right = kwargs.get("on", kwargs.get("right_on"))
+    assert (
+        left is not None and right is not None
+    ), "Partitioned join requires on, or left_on and right_on"
+    return [[k] if isinstance(k, str) else list(k) for k in (left, right)]
+
+
+def hash_keys(df: DataFrame, keys: List[str]) -> pd.Series:
+    """Hash delle colonne di join. Le chiavi numeriche vengono convertite
+    in float64 prima dell'hash, cosi' valori uguali con tipi diversi
+    (es. int64 da una parte e float64 con NaN dall'altra, o tra due batch
+    della stessa sorgente) finiscono nella stessa partizione
+
+    Args:
+        df (DataFrame): batch della sorgente
+        keys (List[str]): colonne di join
+
+    Returns:
+        pd.Series: hash di ogni riga
+    """
+    columns = {
+        k: df[k].astype("float64")
+        if is_numeric_dtype(df[k]) and not is_bool_dtype(df[k])
+        else df[k]
+        for k in keys
+    }
+    return pd.util.hash_pandas_object(DataFrame(columns), index=False)
+
+
+def partition_batches(
+    batches: Iterable[DataFrame],
+    keys: List[str],
+    partitions: int,
+    directory: str,
+) -> Optional[DataFrame]:
+    """Scrive ogni batch in directory/<partizione>/<batch>.parquet
+
+    Args:
+        batches (Iterable[DataFrame]): batch della sorgente
+        keys (List[str]): colonne di join
+        partitions (int): numero di partizioni
+        directory (str): directory della sorgente
+
+    Returns:
+        Optional[DataFrame]: dataframe vuoto con le colonne della sorgente,
+            None se la sorgente non contiene batch
+    """
+    empty = None
+    for n, df in enumerate(batches):
+        if empty is None:
+            empty = df.iloc[:0]
+        # l'hash dipende soltanto dai valori delle chiavi: le righe delle
+        # due sorgenti con le stesse chiavi finiscono nella stessa partizione
+        hashes = hash_keys(df, keys)
+        for p, part in df.groupby((hashes % partitions).values, sort=False):
+            path = os.path.join(directory, str(p))
+            os.makedirs(path, exist_ok=True)
+            part.to_parquet(os.path.join(path, f"{n}.parquet"), index=False)
+    return empty
+
+
+def read_partition(directory: str, p: int) -> Optional[DataFrame]:
+    path = os.path.join(directory, str(p))
+    if not os.path.isdir(path):
+        return None
+    files = sorted(os.listdir(path), key=lambda f: int(f.split(".")[0]))
+    return pd.concat(
+        [pd.read_parquet(os.path.join(path, f)) for f in files],
+        ignore_index=True,
+    )
+
+
+def partitioned_join(
+    left: Iterable[DataFrame],
+    right: Iterable[DataFrame],
+    merge: MergeStep,
+    partitions: int = 16,
+    spill_dir: Optional[str] = None,
+) -> Iterator[DataFrame]:
+    """Grace hash join tra due sequenze di batch, non co-partizionate
+
+    Args:
+        left (Iterable[DataFrame]): batch della sorgente left
+        right (Iterable[DataFrame]): batch della sorgente right
+        merge (MergeStep): merge da eseguire su ogni partizione
+        partitions (int, optional): numero di partizioni. Defaults to 16.
+        spill_dir (Optional[str], optional): directory dei file temporanei.
+            Defaults to None (directory temporanea di sistema).
+
+    Yields:
+        DataFrame: risultato della join di ogni partizione non vuota
+    """
+    left_keys, right_keys = join_keys(merge)
+    with tempfile.TemporaryDirectory(dir=spill_dir, prefix="join-") as tmp:
+        left_dir = os.path.join(tmp, "left")
+        right_dir = os.path.join(tmp, "right")
+        left_empty = partition_batches(left, left_keys, partitions, left_dir)
+        right_empty = partition_batches(
+            right, right_keys, partitions, right_dir
+        )
+        if left_empty is None and right_empty is None:
+            return
+        if left_empty is None or right_empty is None:
+            # lo schema della sorgente senza batch non e' noto: la sostituisco
+            # con le sole colonne di join, cosi' left e outer join
+            # restituiscono comunque le righe dell'altra sorgente
+            logger.warning("Partitioned join: one of the inputs is empty")
+            if left_empty is None:
+                left_empty = right_empty[right_keys].set_axis(
+                    left_keys, axis=1
+                )
+            else:
+                right_empty = left_empty[left_keys].set_axis(
+                    right_keys, axis=1
+                )
+        for p in range(partitions):
+            left_part = read_partition(left_dir, p)
+            right_part = read_partition(right_dir, p)
+            if left_part is None and right_part is None:
+                continue
+            df = merge.run(
+                [
+                    left_empty if left_part is None else left_part,
+                    right_empty if right_part is None else right_part,
+                ]
+            )
+            if len(df) > 0:
+                yield as_pandas(df)
@@ -1,11 +1,11 @@
+import itertools
 import re
 import arrow
 import pandas as pd
 from src.core.datamanager.base import DataReader, DataWriter
-from typing import Optional, Union, Dict, Any, List
+from typing import Optional, Union, Dict, Any, List, Set
 import logging
 import numpy as np
-from functools import partial
 import requests
 import time
 
@@ -63,6 +63,22 @@ class GitRepoReader(DataReader):
         self.min_stars = min_stars
         self.step_size = step_size
         self.max_stars = max_stars
+        # campi dei repository da leggere, None per leggerli tutti
+        self.projection: Optional[Set[str]] = None
+
+    def push_columns(self, columns: Set[str]) -> bool:
+        self.projection = set(columns)
+        return True
+
+    def select_fields(self, items: List[dict]) -> List[dict]:
+        """Mantiene dei repository restituiti dalle search api soltanto
+        i campi della projection, prima di costruire il dataframe"""
+        if self.projection is None:
+            return items
+        return [
+            {k: v for k, v in item.items() if k in self.projection}
+            for item in items
+        ]
 
     def set_stars(self, url: str, min_stars: int, max_stars: int) -> str:
         if "stars:>" in url or "stars:<" in url:
@@ -116,7 +132,7 @@ class GitRepoReader(DataReader):
                 logger.info(f"Retrieving: {url}")
                 res_dict = requests.get(url).json()
                 try:
-                    items = res_dict["items"]
+                    items = self.select_fields(res_dict["items"])
                     df = pd.DataFrame.from_dict(items)
                     if not df.empty:
                         yield df
@@ -142,6 +158,43 @@ def add_date(
     return data
 
 
+def smoothing_averages(
+    values: pd.Series, coeff: float, max_length: Optional[int] = None
+) -> np.ndarray:
+    """Media pesata di ogni lista della serie, con pesi coeff**i sui primi
+    max_length elementi. Le liste vengono appiattite in un unico array,
+    per cui il calcolo e' vettoriale su tutte le righe
+
+    Args:
+        values (pd.Series): serie di liste di valori
+        coeff (float): coefficiente di smoothing
+        max_length (Optional[int], optional): elementi considerati per
+            ogni lista. Defaults to None (tutti).
+
+    Returns:
+        np.ndarray: media di ogni lista, nan per le liste vuote
+    """
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    flat = np.fromiter(
+        itertools.chain.from_iterable(values),
+        dtype=np.float64,
+        count=int(lengths.sum()),
+    )
+    rows = np.repeat(np.arange(len(values)), lengths)
+    # posizione di ogni elemento all'interno della sua lista
+    positions = np.arange(len(flat)) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    if max_length is not None:
+        keep = positions < max_length
+        flat, rows, positions = flat[keep], rows[keep], positions[keep]
+    weights = np.power(coeff, positions)
+    totals = np.bincount(rows, weights=flat * weights, minlength=len(values))
+    norms = np.bincount(rows, weights=weights, minlength=len(values))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return totals / norms
+
+
 def get_trending_topics(
     data: pd.DataFrame, col: str, new_col: str, exp: float, max_length: None
 ) -> pd.DataFrame:
@@ -156,21 +209,7 @@ def get_trending_topics(
     Returns:
         pd.DataFrame:
     """
-
-    def smoothing_avg(
-        values: list[float], coeff: float, max_length: int = None
-    ) -> float:
-        size = (
-            len(values) if max_length is None else min(max_length, len(values))
-        )
-        coefficients = np.power(coeff, np.arange(size))
-        return (
-            np.array(values).dot(coefficients).item()
-        ) / coefficients.sum().item()
-
-    smoothing_avg_partial = partial(
-        smoothing_avg, coeff=exp, max_length=max_length
-    )
-    data = data.eval(f"{new_col} = {col}.apply(@smoothing_avg_partial)")
+    data = data.copy(deep=False)
+    data[new_col] = smoothing_averages(data[col], exp, max_length)
     data = data.sort_values(f"{new_col}", ascending=False)
     return data
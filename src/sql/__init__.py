@@ -1,5 +1,6 @@
 from src.sql.datamanager import SQLWriter, SQLReader, SQLBatchReader
 from src.sql.cmanager import SQLContextManager
+from src.sql.catalog import CatalogWriter
 from src.core.util.factory import Factory
 
 
@@ -9,3 +10,4 @@ def initialize():
     factory.register("sql.batchreader", SQLBatchReader)
     factory.register("sql.writer", SQLWriter)
     factory.register("sql.cmanager", SQLContextManager)
+    factory.register("sql.catalogwriter", CatalogWriter)
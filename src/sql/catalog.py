@@ -0,0 +1,144 @@
+"""
+Catalogo dei risultati intermedi: ogni variabile scritta viene registrata
+come vista di una connessione duckdb in memoria, condivisa dal processo,
+e puo' essere interrogata per nome dalle query di sql.reader
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Union
+
+import duckdb
+import pyarrow as pa
+from pandas import DataFrame
+from src.core.datamanager.base import DataWriter
+from src.core.util.singleton import SingletonType
+
+logger = logging.getLogger(__name__)
+
+
+class DuckDBCatalog(metaclass=SingletonType):
+    """Connessione duckdb in memoria del processo. Le variabili sono
+    tabelle Arrow registrate come viste, senza copie: i batch scritti
+    in momenti diversi restano chunk distinti della stessa tabella.
+    Le viste registrate sono visibili solo dalla connessione che le ha
+    create, per cui tutte le query passano da un'unica connessione
+
+    Attributes:
+        connection (duckdb.DuckDBPyConnection): connessione in memoria
+        tables (Dict[str, pa.Table]): tabelle registrate nel catalogo
+    """
+
+    def __init__(self) -> None:
+        self.connection = duckdb.connect(":memory:")
+        self.tables: Dict[str, pa.Table] = {}
+        self._lock = threading.RLock()
+
+    def register(
+        self, name: str, data: Union[DataFrame, pa.Table], append: bool = False
+    ) -> None:
+        """Registra (o sostituisce) una variabile nel catalogo
+
+        Args:
+            name (str): nome della vista
+            data (Union[DataFrame, pa.Table]): dati della variabile
+            append (bool, optional): True per aggiungere i dati a quelli gia
+                registrati con lo stesso nome. Defaults to False.
+        """
+        table = (
+            data
+            if isinstance(data, pa.Table)
+            else pa.Table.from_pandas(data, preserve_index=False)
+        )
+        with self._lock:
+            if append and name in self.tables:
+                previous = self.tables[name]
+                # i batch di pandas possono differire nei tipi inferiti
+                if not table.schema.equals(previous.schema):
+                    table = table.cast(previous.schema)
+                table = pa.concat_tables([previous, table])
+            self.tables[name] = table
+            self.connection.register(name, table)
+        logger.debug(f"Catalog view {name}: {table.num_rows} rows")
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            if self.tables.pop(name, None) is not None:
+                self.connection.unregister(name)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self.tables)
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self.tables
+
+    def query(self, query: str) -> DataFrame:
+        """Esegue una query sulla connessione del catalogo
+
+        Args:
+            query (str): query che puo' riferirsi alle variabili per nome
+
+        Returns:
+            DataFrame: risultato della query
+        """
+        with self._lock:
+            return self.connection.execute(query).df()
+
+
+class CatalogWriter(DataWriter):
+    """Writer che registra i dataframe nel DuckDBCatalog.
+    Il primo batch di ogni esecuzione del task sostituisce la variabile,
+    i successivi vengono accodati. Le viste vengono rimosse dal catalogo
+    al termine del dag
+
+    Attributes:
+        variables (List[str]): nomi delle viste in cui registrare i dataframe
+        catalog (DuckDBCatalog): catalogo del processo
+        written (Set[str]): viste gia scritte nell'esecuzione corrente
+    """
+
+    def __init__(
+        self,
+        *,
+        variables: Union[str, List[str]],
+        behaviors: Optional[
+            Union[Dict[str, Any], List[Dict[str, Any]]]
+        ] = None,
+    ):
+        """Costruttore
+
+        Args:
+            variables (Union[str, List[str]]): viste in cui registrare i dataframe
+            behaviors (Optional[Union[Dict[str, Any], List[Dict[str, Any]]]], optional):
+                Dizionario, o lista di dizionari contenenti le istruzioni per
+                istanziare i vari Behavior. Defaults to None.
+        """
+        super(CatalogWriter, self).__init__(behaviors=behaviors)
+        self.variables = (
+            [variables] if isinstance(variables, str) else variables
+        )
+        assert len(self.variables) == 1 or (
+            len(self.variables) > 1 and self.bh_manager is not None
+        ), "You must reduce the dataframe"
+        self.catalog = DuckDBCatalog()
+        self.written: Set[str] = set()
+
+    def begin(self) -> None:
+        self.written.clear()
+
+    def release(self) -> None:
+        for v in self.written:
+            self.catalog.unregister(v)
+        self.written.clear()
+
+    def write(self, data: Union[DataFrame, List[DataFrame]]) -> None:
+        if isinstance(data, list):
+            if self.bh_manager is not None:
+                data = self.bh_manager.reduce(data, to_pandas=False)
+        else:
+            data = [data]
+
+        for v, df in zip(self.variables, data):
+            self.catalog.register(v, df, append=v in self.written)
+            self.written.add(v)
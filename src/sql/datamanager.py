@@ -6,6 +6,7 @@ from src.core.datamanager.sql import (
     BaseSQLBatchReader,
     BaseSQLWriter,
 )
+from src.sql.catalog import DuckDBCatalog
 import logging
 
 logger = logging.getLogger(__name__)
@@ -29,12 +30,16 @@ class SQLReader(BaseSQLReader):
         behaviors: Optional[
             Union[Dict[str, Any], List[Dict[str, Any]]]
         ] = None,
+        catalog: bool = False,
         **kwargs,
     ) -> None:
         """Costruttore
 
         Args:
             query_or_path (str): path o query da eseguire per il download del dataframe.
+            catalog (bool, optional): True per eseguire la query sul DuckDBCatalog del processo,
+                in cui le variabili scritte da sql.catalogwriter sono viste interrogabili per nome.
+                Defaults to False.
             credentials_path (Optional[str], optional): path al service account credentials. Defaults to None.
             behaviors (Optional[Union[Dict[str, Any], List[Dict[str, Any]]]], optional): dizionario,
                 o lista di dizionari contenenti le istruzioni per instanziare i vari BehaviorManager. Defaults to None.
@@ -44,9 +49,12 @@ class SQLReader(BaseSQLReader):
             query_or_path=query_or_path, behaviors=behaviors
         )
 
-        self.engine = sa.create_engine(**kwargs)
+        self.catalog = DuckDBCatalog() if catalog else None
+        self.engine = None if catalog else sa.create_engine(**kwargs)
 
     def execute_read(self, query: str) -> pd.DataFrame:
+        if self.catalog is not None:
+            return self.catalog.query(query)
         with self.engine.connect() as conn:
             data = pd.read_sql(sa.sql.text(query), con=conn)
             return data
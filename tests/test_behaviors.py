@@ -0,0 +1,140 @@
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.util.behaviors import BehaviorManager
+
+
+class BehaviorTest(unittest.TestCase):
+    """Test dei piani di riduzione compilati dai behavior"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+
+    def frames(self, n):
+        return [pd.DataFrame({"k": [i], "v": [i]}) for i in range(n)]
+
+    def test_plan_is_reusable(self):
+        manager = BehaviorManager(
+            behaviors={
+                "type": "core.merge",
+                "instructions": {
+                    "left": 0,
+                    "right": 1,
+                    "on": "k",
+                    "how": "outer",
+                },
+            }
+        )
+        first = manager.reduce(self.frames(2))
+        second = manager.reduce(self.frames(2))
+        self.assertEqual(len(first), 1)
+        pd.testing.assert_frame_equal(first[0], second[0])
+
+    def test_consecutive_concats_are_fused(self):
+        manager = BehaviorManager(
+            behaviors=[
+                {
+                    "type": "core.concat",
+                    "instructions": [
+                        {"start": 0, "end": 2},
+                        {"start": 2, "end": 4},
+                    ],
+                },
+                {
+                    "type": "core.concat",
+                    "instructions": {},
+                },
+            ]
+        )
+        plan = manager.plan.resolve(4)
+        # le tre concat diventano un'unica pd.concat sui dataframe originali
+        self.assertEqual(len(plan.operations), 1)
+        self.assertEqual(plan.operations[0].inputs, (0, 1, 2, 3))
+        (df,) = manager.reduce(self.frames(4))
+        self.assertEqual(df["k"].tolist(), [0, 1, 2, 3])
+
+    def test_arrow_engine(self):
+        left = pd.DataFrame({"k": [1, 2, 3], "v": [1.0, 2.0, 3.0]})
+        right = pd.DataFrame({"k": [2, 3, 4], "w": ["a", "b", "c"]})
+        manager = BehaviorManager(
+            behaviors={
+                "type": "core.merge",
+                "engine": "arrow",
+                "instructions": {
+                    "left": 0,
+                    "right": 1,
+                    "on": "k",
+                    "how": "left",
+                },
+            }
+        )
+        (df,) = manager.reduce([left, right])
+        expected = pd.merge(left, right, on="k", how="left")
+        pd.testing.assert_frame_equal(
+            df.sort_values("k").reset_index(drop=True), expected
+        )
+        manager = BehaviorManager(
+            behaviors={
+                "type": "core.concat",
+                "engine": "arrow",
+                "instructions": {},
+            }
+        )
+        (table,) = manager.reduce([left, left, left], to_pandas=False)
+        # i batch restano chunk distinti della tabella concatenata
+        self.assertEqual(table.num_rows, 9)
+        self.assertEqual(table.column("k").num_chunks, 3)
+        # colonne mancanti diventano null, tipi diversi passano a pandas
+        (df,) = manager.reduce([left, right, left.astype({"k": float})])
+        expected = pd.concat(
+            [left, right, left.astype({"k": float})], ignore_index=True
+        )
+        pd.testing.assert_frame_equal(df, expected)
+
+    def test_arrow_engine_nested_columns(self):
+        left = pd.DataFrame({"k": [1, 2], "topics": [["a", "b"], []]})
+        right = pd.DataFrame({"k": [2, 1], "owner": [{"id": 1}, {"x": 2}]})
+        merge = BehaviorManager(
+            behaviors={
+                "type": "core.merge",
+                "engine": "arrow",
+                "instructions": {"left": 0, "right": 1, "on": "k"},
+            }
+        )
+        (df,) = merge.reduce([left, right])
+        pd.testing.assert_frame_equal(df, pd.merge(left, right, on="k"))
+        concat = BehaviorManager(
+            behaviors={
+                "type": "core.concat",
+                "engine": "arrow",
+                "instructions": {},
+            }
+        )
+        (df,) = concat.reduce([left, left])
+        # le liste restano liste invece di diventare numpy.ndarray
+        self.assertEqual(df["topics"].tolist(), [["a", "b"], []] * 2)
+        self.assertEqual(list(df.index), [0, 1, 2, 3])
+
+    def test_invalid_indices(self):
+        with self.assertRaises(AssertionError):
+            BehaviorManager(
+                behaviors={
+                    "type": "core.merge",
+                    "instructions": {"left": "a", "right": 1},
+                }
+            )
+        manager = BehaviorManager(
+            behaviors={
+                "type": "core.merge",
+                "instructions": {"left": 0, "right": 5},
+            }
+        )
+        with self.assertRaises(AssertionError):
+            manager.reduce(self.frames(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
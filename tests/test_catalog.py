@@ -0,0 +1,98 @@
+import unittest
+
+import src.core.util.loader as loader
+from src.core.task.base import Task
+from src.core.task.dag import TaskDag
+from src.core.util.factory import Factory
+from src.sql.catalog import DuckDBCatalog
+from tests.test_task import ListWriter, RangeReader
+
+
+class CatalogTest(unittest.TestCase):
+    """Test del catalogo duckdb dei risultati intermedi"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core", "sql"])
+        factory = Factory()
+        factory.register("tests.rangereader", RangeReader)
+        factory.register("tests.listwriter", ListWriter)
+
+    def test_sql_reader_queries_catalog(self):
+        dummy = {"type": "core.transformers.dummy"}
+        Task(
+            data_reader={"type": "tests.rangereader", "num_batches": 3},
+            data_writer={"type": "sql.catalogwriter", "variables": "values"},
+            transformer=dummy,
+        ).run()
+        catalog = DuckDBCatalog()
+        self.assertIn("values", catalog)
+        # i batch vengono accodati come chunk della stessa vista
+        self.assertEqual(catalog.tables["values"].num_rows, 30)
+        self.assertEqual(
+            catalog.tables["values"].column("value").num_chunks, 3
+        )
+
+        task = Task(
+            data_reader={
+                "type": "sql.reader",
+                "catalog": True,
+                "query_or_path": """
+                    select key, sum(value) as total
+                    from values
+                    group by key
+                    order by key""",
+            },
+            data_writer={"type": "tests.listwriter"},
+            transformer=dummy,
+        )
+        task.run()
+        result = task.data_writer.data[0]
+        self.assertListEqual(list(result["key"]), ["k0", "k1", "k2"])
+        self.assertEqual(result["total"].sum(), sum(range(30)))
+        catalog.unregister("values")
+        self.assertNotIn("values", catalog)
+
+    def test_rerun_and_dag_release(self):
+        writer = {"type": "sql.catalogwriter", "variables": "rerun"}
+        dummy = {"type": "core.transformers.dummy"}
+        task = Task(
+            data_reader={"type": "tests.rangereader", "num_batches": 3},
+            data_writer=writer,
+            transformer=dummy,
+        )
+        catalog = DuckDBCatalog()
+        for _ in range(2):
+            task.run()
+            # ogni esecuzione sostituisce la vista
+            self.assertEqual(catalog.tables["rerun"].num_rows, 30)
+        catalog.unregister("rerun")
+
+        dag = TaskDag(
+            tasks={
+                "a": {
+                    "data_reader": {
+                        "type": "tests.rangereader",
+                        "num_batches": 2,
+                    },
+                    "data_writer": writer,
+                    "transformer": dummy,
+                },
+                "b": {
+                    "data_reader": {
+                        "type": "sql.reader",
+                        "catalog": True,
+                        "query_or_path": "select count(*) as n from rerun",
+                    },
+                    "data_writer": {"type": "tests.listwriter"},
+                    "transformer": dummy,
+                },
+            },
+            edges=[["a", "b"]],
+        )
+        for _ in range(2):
+            dag.run()
+            result = dag.task_graph.nodes["b"]["task"].data_writer.data
+            self.assertEqual(result[-1]["n"].iloc[0], 20)
+            # le viste dei nodi vengono rimosse al termine del dag
+            self.assertNotIn("rerun", catalog)
@@ -0,0 +1,288 @@
+import glob
+import os
+import tempfile
+import time
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.datamanager.sharedmemory import ENVIRONMENT, SharedMemory
+from src.core.task.dag import TaskDag
+from src.core.util.factory import Factory
+from tests.test_task import ListWriter, RangeReader
+
+
+def sleep(data: pd.DataFrame, seconds: float) -> pd.DataFrame:
+    time.sleep(seconds)
+    return data
+
+
+def fail(data: pd.DataFrame) -> pd.DataFrame:
+    raise RuntimeError("node failure")
+
+
+def node(variable: str, transformer: dict, reads: str = None) -> dict:
+    reader = (
+        {"type": "tests.rangereader", "num_batches": 1}
+        if reads is None
+        else {"type": "core.sharedmemoryreader", "variables": reads}
+    )
+    return {
+        "data_reader": reader,
+        "data_writer": {
+            "type": "core.sharedmemorywriter",
+            "variables": variable,
+        },
+        "transformer": {
+            "type": "core.transformers.pipeline",
+            "transformers": [transformer],
+        },
+    }
+
+
+class TaskDagTest(unittest.TestCase):
+    """Test dello scheduler del dag"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core", "filemanager"])
+        factory = Factory()
+        factory.register("tests.rangereader", RangeReader)
+        factory.register("tests.listwriter", ListWriter)
+        factory.register("tests.sleep", sleep)
+        factory.register("tests.fail", fail)
+
+    def test_independent_nodes_overlap(self):
+        wait = {"type": "tests.sleep", "seconds": 0.5}
+        dag = TaskDag(
+            tasks={
+                "a": node("a", {"type": "core.transformers.dummy"}),
+                "b": node("b", wait, reads="a"),
+                "c": node("c", wait),
+            },
+            edges=[["a", "b"]],
+            max_workers=2,
+        )
+        start = time.perf_counter()
+        dag.run()
+        self.assertLess(time.perf_counter() - start, 0.9)
+        runs = {r.node: r for r in dag.timeline}
+        self.assertTrue(all(r.status == "done" for r in runs.values()))
+        self.assertLess(runs["c"].start, runs["b"].end)
+        self.assertGreaterEqual(runs["b"].start, runs["a"].end)
+        self.assertEqual(len(SharedMemory()["b"]), 10)
+        # i nodi eseguiti insieme nello stesso processo non hanno un picco
+        self.assertTrue(all(r.peak_memory is None for r in runs.values()))
+
+    def test_failure_cancels_downstream(self):
+        dummy = {"type": "core.transformers.dummy"}
+        dag = TaskDag(
+            tasks={
+                "a": node("fa", {"type": "tests.fail"}),
+                "b": node("fb", dummy, reads="fa"),
+                "c": node("fc", dummy),
+            },
+            edges=[["a", "b"]],
+            max_workers=2,
+        )
+        with self.assertRaises(RuntimeError):
+            dag.run()
+        status = {r.node: r.status for r in dag.timeline}
+        self.assertDictEqual(
+            status, {"a": "failed", "b": "cancelled", "c": "done"}
+        )
+
+    def test_failure_stop(self):
+        dummy = {"type": "core.transformers.dummy"}
+        dag = TaskDag(
+            tasks={
+                "a": node("sa", dummy),
+                "b": node("sb", {"type": "tests.fail"}),
+                "c": node("sc", dummy, reads="sa"),
+                "d": node("sd", dummy, reads="sc"),
+            },
+            edges=[["a", "c"], ["b", "c"], ["c", "d"]],
+            on_failure="stop",
+        )
+        with self.assertRaises(RuntimeError):
+            dag.run()
+        status = {r.node: r.status for r in dag.timeline}
+        self.assertDictEqual(
+            status,
+            {"a": "done", "b": "failed", "c": "cancelled", "d": "cancelled"},
+        )
+        # la lettura del nodo annullato libera la variabile
+        shared_memory = SharedMemory()
+        self.assertNotIn("sa", shared_memory)
+        self.assertDictEqual(shared_memory.consumers, {})
+
+    def test_cache(self):
+        dummy = {"type": "core.transformers.dummy"}
+        shared_memory = SharedMemory()
+        with tempfile.TemporaryDirectory() as cache_dir:
+
+            def run(**kwargs) -> TaskDag:
+                dag = TaskDag(
+                    tasks={
+                        # RangeReader non legge file: il nodo va marcato
+                        "a": {**node("ca", dummy), "dag.cache": True},
+                        "b": node("cb", dummy, reads="ca"),
+                        "c": node("cc", dummy),
+                    },
+                    edges=[["a", "b"]],
+                    cache_dir=cache_dir,
+                    **kwargs,
+                )
+                dag.run()
+                return dag
+
+            dag = run()
+            # i reader senza file in input non vengono mai messi in cache
+            self.assertDictEqual(
+                dag.cache_report,
+                {"a": "miss", "b": "miss", "c": "uncacheable"},
+            )
+            shared_memory.remove("cb")
+            dag = run()
+            self.assertDictEqual(
+                dag.cache_report, {"a": "hit", "b": "hit", "c": "uncacheable"}
+            )
+            self.assertEqual(len(shared_memory["cb"]), 10)
+            dag = run(force=["a"])
+            self.assertEqual(dag.cache_report["a"], "forced")
+            self.assertEqual(dag.cache_report["b"], "hit")
+
+    def test_cache_file_outputs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "out.parquet")
+
+            def run() -> TaskDag:
+                dag = TaskDag(
+                    tasks={
+                        "a": {
+                            "data_reader": {
+                                "type": "tests.rangereader",
+                                "num_batches": 1,
+                            },
+                            "data_writer": {
+                                "type": "filemanager.filewriter",
+                                "output_path": output,
+                                "write_args": {"partition_cols": ["key"]},
+                            },
+                            "transformer": {"type": "core.transformers.dummy"},
+                            "dag.cache": True,
+                        }
+                    },
+                    edges=[],
+                    cache_dir=os.path.join(tmp, "cache"),
+                )
+                dag.run()
+                return dag
+
+            run()
+            (written,) = glob.glob(os.path.join(output, "key=k0", "*"))
+            # partizione scritta da un'esecuzione successiva
+            later = os.path.join(output, "key=k9")
+            os.makedirs(later)
+            pd.DataFrame({"batch": [0], "value": [0]}).to_parquet(
+                os.path.join(later, "later.parquet")
+            )
+            os.remove(written)
+            dag = run()
+            self.assertEqual(dag.cache_report["a"], "hit")
+            self.assertTrue(os.path.exists(written))
+            self.assertTrue(os.path.exists(later))
+            self.assertEqual(len(pd.read_parquet(output)), 11)
+
+    def test_history_priorities(self):
+        dummy = {"type": "core.transformers.dummy"}
+        wait = {"type": "tests.sleep", "seconds": 0.2}
+        with tempfile.TemporaryDirectory() as history_dir:
+
+            def run() -> TaskDag:
+                dag = TaskDag(
+                    tasks={
+                        "b": node("hb", dummy),
+                        "c": node("hc", dummy),
+                        "a": node("ha", wait),
+                    },
+                    edges=[],
+                    history_path=os.path.join(history_dir, "history.sqlite"),
+                )
+                dag.run()
+                return dag
+
+            dag = run()
+            self.assertEqual(dag.timeline[0].node, "b")
+            # il nodo piu lento e' sul cammino critico e parte per primo
+            dag = run()
+            self.assertEqual(dag.timeline[0].node, "a")
+            self.assertGreater(dag.priorities["a"], dag.priorities["b"])
+            self.assertEqual(len(dag.history.runs()), 2)
+            runs = dag.history.query(
+                "select * from node_runs where node = ?", ("a",)
+            )
+            self.assertEqual(len(runs), 2)
+            self.assertTrue((runs["peak_memory"] >= 0).all())
+            regressions = dag.history.regressions(ratio=100)
+            self.assertTrue(regressions.empty)
+
+    def test_arrow_shared_memory_across_processes(self):
+        dummy = {"type": "core.transformers.dummy"}
+        shared_memory = SharedMemory()
+        collected = {}
+
+        def collect() -> None:
+            collected["keys"] = shared_memory.keys()
+            collected["pb"] = shared_memory["pb"]
+
+        Factory().register("tests.collect", collect)
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, "store")
+            dag = TaskDag(
+                tasks={
+                    "a": node("pa", dummy),
+                    "b": node("pb", dummy, reads="pa"),
+                },
+                edges=[["a", "b"]],
+                executor="process",
+                shared_memory={"backend": "arrow", "directory": directory},
+                cleanup={"type": "tests.collect"},
+            )
+            environ = {k: os.environ.get(k) for k in ENVIRONMENT}
+            # la configurazione vale soltanto durante l'esecuzione
+            self.assertIsNone(shared_memory.store)
+            dag.run()
+            # scritta da un processo figlio, visibile nel processo principale
+            self.assertEqual(len(collected["pb"]), 10)
+            self.assertListEqual(collected["keys"], ["pb"])
+            # al termine lo store viene svuotato e il backend ripristinato
+            self.assertFalse(os.path.exists(directory))
+            self.assertIsNone(shared_memory.store)
+            self.assertDictEqual(
+                {k: os.environ.get(k) for k in ENVIRONMENT}, environ
+            )
+
+    def test_fan_out_reference_counting(self):
+        dummy = {"type": "core.transformers.dummy"}
+        keep = node("rc", dummy, reads="ra")
+        keep["data_reader"]["remove_after_read"] = False
+        dag = TaskDag(
+            tasks={
+                "a": node("ra", dummy),
+                "b": node("rb", dummy, reads="ra"),
+                "c": keep,
+            },
+            edges=[["a", "b"], ["a", "c"]],
+        )
+        self.assertDictEqual(dag.consumers(), {"ra": 2})
+        dag.run()
+        shared_memory = SharedMemory()
+        # liberata dopo l'ultimo dei due consumatori
+        self.assertNotIn("ra", shared_memory)
+        self.assertEqual(len(shared_memory["rb"]), 10)
+        self.assertEqual(len(shared_memory["rc"]), 10)
+        runs = {r.node: r for r in dag.timeline}
+        self.assertGreater(runs["a"].pinned_memory, 0)
+        self.assertDictEqual(shared_memory.consumers, {})
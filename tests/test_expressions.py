@@ -0,0 +1,129 @@
+import pickle
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.task.base import Task
+from src.core.transformer.expressions import ExpressionPlan
+from src.core.util.factory import Factory
+from src.github.gitapi import get_trending_topics
+from tests.test_task import ListWriter, RangeReader
+
+
+class ExpressionPlanTest(unittest.TestCase):
+    """Test del piano compilato delle espressioni di SwissKnife"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+        Factory().register("tests.rangereader", RangeReader)
+        Factory().register("tests.listwriter", ListWriter)
+
+    def data(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "a": np.arange(20, dtype=float),
+                "b": np.arange(20) % 7,
+                "flag": np.arange(20) % 2 == 0,
+                "name": [f"n{i % 4}" for i in range(20)],
+            }
+        )
+
+    def check(self, attr: str, expr: str, vectorized: bool = True):
+        data = self.data()
+        plan = ExpressionPlan(attr, expr)
+        self.assertEqual(plan.vectorized, vectorized)
+        expected = getattr(data, attr)(expr)
+        result = plan(data)
+        if isinstance(expected, pd.Series):
+            pd.testing.assert_series_equal(result, expected, check_names=False)
+        else:
+            pd.testing.assert_frame_equal(result, expected)
+        # come pandas, il dataframe in input non viene modificato
+        pd.testing.assert_frame_equal(data, self.data())
+
+    def test_eval(self):
+        self.check("eval", "c = a * 2 + b ** 2")
+        self.check("eval", "sqrt(a) + log1p(b) - b // 3")
+        self.check("eval", "c = a / b\nd = c > 1 and not flag")
+
+    def test_query(self):
+        self.check("query", "a > 3 and (b in [1, 2] or flag)")
+        self.check("query", "1 < b <= 5 and b not in [3]")
+
+    def test_integer_division_by_zero(self):
+        # come pandas, con divisore nullo il risultato e' float (inf o NaN)
+        data = pd.DataFrame({"a": [1, -2, 0, 3], "b": [0, 0, 0, 2]})
+        for attr, expr in (
+            ("eval", "c = a // b"),
+            ("eval", "c = a % b"),
+            ("eval", "c = a // 0"),
+            ("eval", "c = a // 2 + a % 2"),
+            ("query", "a // b > 0"),
+        ):
+            plan = ExpressionPlan(attr, expr)
+            self.assertTrue(plan.vectorized)
+            pd.testing.assert_frame_equal(
+                plan(data), getattr(data, attr)(expr)
+            )
+
+    def test_fallback(self):
+        # stringhe e attributi vengono valutati con pandas
+        self.check("query", "name == 'n1' and a > 2", vectorized=False)
+        self.check("eval", "c = a + 1\nd = name.str.upper()", vectorized=False)
+        # colonne non numeriche note soltanto in valutazione
+        self.check("eval", "c = name + name")
+
+    def test_pickle(self):
+        transformer = Factory().create(
+            {
+                "type": "core.transformers.swissknife",
+                "dataframe_attr": "eval",
+                "expr": "c = a * 2",
+            }
+        )
+        restored = pickle.loads(pickle.dumps(transformer))
+        self.assertTrue(restored.plan.vectorized)
+        pd.testing.assert_frame_equal(
+            restored.transform(self.data()), self.data().eval("c = a * 2")
+        )
+
+    def test_profile(self):
+        task = Task(
+            data_reader={"type": "tests.rangereader", "num_batches": 3},
+            data_writer={"type": "tests.listwriter"},
+            transformer={
+                "type": "core.transformers.pipeline",
+                "transformers": [
+                    {
+                        "type": "core.transformers.swissknife",
+                        "dataframe_attr": "eval",
+                        "expr": "double = value * 2",
+                    }
+                ],
+            },
+        )
+        task.run()
+        step = task.profile["0:SwissKnife"]
+        self.assertGreater(step["compile_time"], 0)
+        self.assertGreater(step["eval_time"], 0)
+
+    def test_trending_topics(self):
+        data = pd.DataFrame({"stars": [[3, 1, 2], [5], [1, 1], [4, 2]]})
+        result = get_trending_topics(data, "stars", "trend", 0.5, 2)
+        weights = np.array([1, 0.5])
+        expected = [
+            np.dot(v[:2], weights[: len(v[:2])]) / weights[: len(v)].sum()
+            for v in data["stars"]
+        ]
+        self.assertEqual(list(result.index), [1, 3, 0, 2])
+        np.testing.assert_allclose(
+            result["trend"], np.array(expected)[result.index]
+        )
+        self.assertNotIn("trend", data.columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
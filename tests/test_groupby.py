@@ -0,0 +1,68 @@
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.task.base import Task
+from src.core.transformer.basic import GroupByTransformer
+from src.core.util.factory import Factory
+from tests.test_task import ListWriter, RangeReader
+
+
+class GroupByTest(unittest.TestCase):
+    """Test della groupby vettoriale e in streaming"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+        factory = Factory()
+        factory.register("tests.rangereader", RangeReader)
+        factory.register("tests.listwriter", ListWriter)
+
+    def data(self) -> pd.DataFrame:
+        return pd.concat(RangeReader(num_batches=7).read(), ignore_index=True)
+
+    def test_list_aggregation(self):
+        data = self.data()
+        result = GroupByTransformer(
+            group_columns="key", agg_function="list", main_columns="value"
+        ).transform(data)
+        expected = data.groupby("key")["value"].apply(list)
+        pd.testing.assert_series_equal(result, expected)
+
+    def test_streaming_across_batches(self):
+        data = self.data()
+        for agg_function in ("sum", "mean", "max", "list"):
+            groupby = {
+                "type": "core.transformers.groupby",
+                "group_columns": ["key"],
+                "agg_function": agg_function,
+                "main_columns": "value"
+                if agg_function == "list"
+                else ["value"],
+            }
+            expected = Factory().create(groupby).transform(data)
+            for processes in (1, 2):
+                task = Task(
+                    data_reader={
+                        "type": "tests.rangereader",
+                        "num_batches": 7,
+                    },
+                    data_writer={"type": "tests.listwriter"},
+                    transformer={
+                        "type": "core.transformers.pipeline",
+                        "transformers": [dict(groupby, streaming=True)],
+                    },
+                    num_of_processes=processes,
+                )
+                task.run()
+                # un unico risultato, scritto al termine della lettura
+                (result,) = task.data_writer.data
+                if agg_function == "list":
+                    pd.testing.assert_series_equal(result, expected)
+                else:
+                    pd.testing.assert_frame_equal(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.util.behaviors import MergeStep
+from src.filemanager.fmanager import BatchFileReaderDecorator, FileReader
+from src.filemanager.join import partitioned_join
+
+
+class PartitionedJoinTest(unittest.TestCase):
+    """Test della join out-of-core di BatchFileReaderDecorator"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+
+    def write_batches(self, directory, name, df, num_batches):
+        size = len(df) // num_batches
+        for b in range(num_batches):
+            df.iloc[b * size : (b + 1) * size].to_parquet(
+                os.path.join(directory, f"{name}_{b}.parquet")
+            )
+        return os.path.join(directory, f"{name}.parquet")
+
+    def test_join_not_copartitioned(self):
+        repos = pd.DataFrame(
+            {"repo": [f"r{i}" for i in range(40)], "stars": range(40)}
+        )
+        # le due sorgenti hanno un numero diverso di batch e chiavi in comune
+        # distribuite in batch diversi
+        events = pd.DataFrame(
+            {"repo": [f"r{(i * 7) % 50}" for i in range(60)], "day": range(60)}
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            reader = BatchFileReaderDecorator(
+                wrapped_reader=FileReader(
+                    input_path=[
+                        self.write_batches(tmp, "events", events, 3),
+                        self.write_batches(tmp, "repos", repos, 4),
+                    ],
+                    behaviors={
+                        "type": "core.merge",
+                        "instructions": {
+                            "left": 0,
+                            "right": 1,
+                            "on": "repo",
+                            "how": "outer",
+                        },
+                    },
+                ),
+                mode="join",
+                partitions=4,
+                spill_dir=tmp,
+            )
+            batches = list(reader.read())
+            # i file temporanei vengono rimossi al termine della lettura
+            self.assertFalse(
+                any(f.startswith("join-") for f in os.listdir(tmp))
+            )
+        self.assertGreater(len(batches), 1)
+        columns = ["repo", "day", "stars"]
+        df = pd.concat(batches).sort_values(columns).reset_index(drop=True)
+        expected = (
+            pd.merge(events, repos, on="repo", how="outer")
+            .sort_values(columns)
+            .reset_index(drop=True)
+        )
+        pd.testing.assert_frame_equal(df, expected)
+
+    def join(self, left, right, how):
+        merge = MergeStep(0, 1, dict(on="id", how=how))
+        with tempfile.TemporaryDirectory() as tmp:
+            batches = list(
+                partitioned_join(
+                    left, right, merge, partitions=8, spill_dir=tmp
+                )
+            )
+        if not batches:
+            return pd.DataFrame()
+        df = pd.concat(batches)
+        return df.sort_values(list(df.columns), ignore_index=True)
+
+    def test_join_mixed_key_dtypes(self):
+        left = pd.DataFrame({"id": np.arange(30), "x": range(30)})
+        # chiavi float con NaN: gli stessi valori di left ma di tipo diverso
+        ids = np.arange(0, 40, 2, dtype=float)
+        ids[::5] = np.nan
+        right = pd.DataFrame({"id": ids, "y": range(20)})
+        for how in ("inner", "outer"):
+            expected = pd.merge(left, right, on="id", how=how).sort_values(
+                ["id", "x", "y"], ignore_index=True
+            )
+            df = self.join([left.iloc[:15], left.iloc[15:]], [right], how)
+            pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    def test_join_empty_input(self):
+        left = pd.DataFrame({"id": range(10), "x": range(10)})
+        df = self.join([left], [], "left")
+        pd.testing.assert_frame_equal(df, left)
+        df = self.join([], [left], "outer")
+        pd.testing.assert_frame_equal(df, left)
+        self.assertTrue(self.join([left], [], "inner").empty)
+        self.assertTrue(self.join([], [], "outer").empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
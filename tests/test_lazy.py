@@ -0,0 +1,143 @@
+import copy
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.transformer.basic import ProjectionTransformer, SwissKnife
+from src.core.transformer.lazy import Filter, LazySegment
+from src.core.util.factory import Factory
+from tests.test_task import swissknife
+
+
+class LazyPipelineTest(unittest.TestCase):
+    """Test dell'esecuzione lazy delle pipeline CASCADE"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+
+    def setUp(self):
+        self.data = pd.DataFrame(
+            {
+                "value": range(100),
+                "key": [f"k{i % 3}" for i in range(100)],
+                "other": [0.5] * 100,
+            }
+        )
+
+    def compare(self, transformers):
+        pipelines = [
+            Factory().create(
+                {
+                    "type": "core.transformers.pipeline",
+                    "transformers": copy.deepcopy(transformers),
+                    "lazy": lazy,
+                }
+            )
+            for lazy in (False, True)
+        ]
+        eager, lazy = (p.transform(self.data.copy()) for p in pipelines)
+        pd.testing.assert_frame_equal(
+            eager.reset_index(drop=True), lazy.reset_index(drop=True)
+        )
+        return pipelines[1]
+
+    def test_single_query_plan(self):
+        pipeline = self.compare(
+            [
+                swissknife(
+                    "eval", expr="double = value * 2\nunused = value + 1"
+                ),
+                swissknife(
+                    "query", expr="double > 10 and key in ['k0', 'k1']"
+                ),
+                swissknife("query", expr="value < 90"),
+                {
+                    "type": "core.transformers.groupby",
+                    "group_columns": ["key"],
+                    "agg_function": "sum",
+                    "main_columns": ["double", "value"],
+                },
+            ]
+        )
+        (segment,) = pipeline.stages
+        self.assertIsInstance(segment, LazySegment)
+        # i filtri consecutivi sono fusi e le colonne inutilizzate scartate
+        self.assertEqual(
+            sum(isinstance(op, Filter) for op in segment.operations), 1
+        )
+        self.assertEqual(segment.required, {"key", "value"})
+
+    def test_barrier(self):
+        pipeline = self.compare(
+            [
+                swissknife("eval", expr="double = value * 2"),
+                swissknife("query", expr="double > 10"),
+                swissknife("assign", triple="lambda df: df.value * 3"),
+                {
+                    "type": "core.transformers.projection",
+                    "columns": ["key", "triple"],
+                },
+            ]
+        )
+        # la lambda separa i segmenti, la proiezione resta da sola ed
+        # e' eseguita con pandas
+        self.assertListEqual(
+            [type(s) for s in pipeline.stages],
+            [LazySegment, SwissKnife, ProjectionTransformer],
+        )
+
+    def test_missing_values(self):
+        self.data = pd.DataFrame(
+            {"x": [1.0, None, 3.0], "key": ["a", None, "c"]}
+        )
+        # pandas mantiene le righe con valori mancanti per != e not in
+        for expr in (
+            "x != 1",
+            "x not in [1.0, 3.0]",
+            "not (x > 1)",
+            "key != 'a' and x == x",
+            "key not in ['a']",
+        ):
+            with self.subTest(expr=expr):
+                pipeline = self.compare(
+                    [
+                        swissknife("query", expr=expr),
+                        swissknife("eval", expr="y = x * 2"),
+                    ]
+                )
+                self.assertIsInstance(pipeline.stages[0], LazySegment)
+        self.compare(
+            [
+                swissknife("eval", expr="small = x < 2"),
+                swissknife("eval", expr="big = x != 1"),
+            ]
+        )
+
+    def test_division(self):
+        pipeline = self.compare(
+            [
+                swissknife("eval", expr="ratio = value / 7"),
+                swissknife("query", expr="value / 2 > 10"),
+            ]
+        )
+        (segment,) = pipeline.stages
+        # divisione in virgola mobile anche con versioni di duckdb che
+        # troncano la divisione tra interi
+        self.assertIn("AS DOUBLE", segment.sql)
+
+    def test_column_names_fallback(self):
+        transformers = [
+            swissknife("eval", expr="double = value * 2"),
+            swissknife("query", expr="double > 10"),
+        ]
+        # nomi duplicati o non stringhe: valutazione con pandas
+        for columns in (["value", "key", "value"], ["value", "key", 0]):
+            with self.subTest(columns=columns):
+                self.data.columns = columns
+                self.compare(transformers)
+
+
+if __name__ == "__main__":
+    unittest.main()
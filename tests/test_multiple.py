@@ -0,0 +1,177 @@
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.datamanager.base import DataReader
+from src.core.util.factory import Factory
+from tests.test_task import RangeReader
+
+
+class TopicsReader(DataReader):
+    """Reader con una colonna di liste, come i topics dei repository"""
+
+    def read(self):
+        for b in range(2):
+            yield pd.DataFrame(
+                {
+                    "value": [2 * b, 2 * b + 1],
+                    "topics": [["python"], ["ml", f"t{b}"]],
+                }
+            )
+
+
+class MultipleSourceReaderTest(unittest.TestCase):
+    """Test delle modalita di lettura di core.multiplereader"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+        Factory().register("tests.rangereader", RangeReader)
+        Factory().register("tests.topicsreader", TopicsReader)
+
+    def create(self, **kwargs):
+        readers = [
+            {"type": "tests.rangereader", "num_batches": 3},
+            {"type": "tests.rangereader", "num_batches": 2, "batch_size": 4},
+        ]
+        return Factory().create(
+            {"type": "core.multiplereader", "readers": readers, **kwargs}
+        )
+
+    def test_incremental_concat(self):
+        concat = {
+            "type": "core.concat",
+            "instructions": {"ignore_index": True},
+        }
+        (expected,) = list(self.create(behaviors=concat).read())
+        for engine in ("pandas", "arrow"):
+            reader = self.create(
+                behaviors={**concat, "engine": engine}, mode="incremental"
+            )
+            (df,) = list(reader.read())
+            pd.testing.assert_frame_equal(df, expected)
+
+    def test_stream_with_source(self):
+        reader = self.create(mode="stream", source_column="source")
+        batches = list(reader.read())
+        self.assertEqual(len(batches), 5)
+        self.assertEqual(
+            [b["source"].iloc[0] for b in batches], [0, 0, 0, 1, 1]
+        )
+
+    def test_stream_merge(self):
+        merge = {
+            "type": "core.merge",
+            "instructions": {
+                "left": 0,
+                "right": 1,
+                "on": "value",
+                "how": "left",
+            },
+        }
+        left, right = RangeReader(num_batches=3), RangeReader(
+            num_batches=2, batch_size=4
+        )
+        expected = pd.merge(
+            pd.concat(left.read(), ignore_index=True),
+            pd.concat(right.read(), ignore_index=True),
+            on="value",
+            how="left",
+        )
+        for engine in ("pandas", "arrow"):
+            reader = self.create(
+                behaviors={**merge, "engine": engine}, mode="stream"
+            )
+            batches = list(reader.read())
+            # un batch in output per ogni batch della sorgente left
+            self.assertEqual(len(batches), 3)
+            df = pd.concat(batches, ignore_index=True).sort_values("value")
+            pd.testing.assert_frame_equal(
+                df.reset_index(drop=True), expected, check_dtype=False
+            )
+
+    def test_stream_merge_order(self):
+        # chiavi duplicate in entrambe le sorgenti
+        merge = {
+            "type": "core.merge",
+            "instructions": {
+                "left": 0,
+                "right": 1,
+                "on": "key",
+                "how": "left",
+            },
+        }
+        left, right = RangeReader(num_batches=3), RangeReader(
+            num_batches=2, batch_size=4
+        )
+        expected = pd.merge(
+            pd.concat(left.read(), ignore_index=True),
+            pd.concat(right.read(), ignore_index=True),
+            on="key",
+            how="left",
+        )
+        for engine in ("pandas", "arrow"):
+            reader = self.create(
+                behaviors={**merge, "engine": engine}, mode="stream"
+            )
+            df = pd.concat(reader.read(), ignore_index=True)
+            # come pd.merge, l'ordine delle righe di left viene conservato
+            pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    def test_stream_merge_empty_right(self):
+        for engine in ("pandas", "arrow"):
+            for how, rows in (("left", 30), ("inner", 0)):
+                reader = Factory().create(
+                    {
+                        "type": "core.multiplereader",
+                        "readers": [
+                            {"type": "tests.rangereader", "num_batches": 3},
+                            {"type": "tests.rangereader", "num_batches": 0},
+                        ],
+                        "behaviors": {
+                            "type": "core.merge",
+                            "engine": engine,
+                            "instructions": {
+                                "left": 0,
+                                "right": 1,
+                                "on": "value",
+                                "how": how,
+                            },
+                        },
+                        "mode": "stream",
+                    }
+                )
+                df = pd.concat(reader.read(), ignore_index=True)
+                self.assertEqual(len(df), rows)
+                self.assertEqual(list(df.columns), ["batch", "value", "key"])
+
+    def test_stream_merge_nested_columns(self):
+        reader = Factory().create(
+            {
+                "type": "core.multiplereader",
+                "readers": [
+                    {"type": "tests.rangereader", "num_batches": 1},
+                    {"type": "tests.topicsreader"},
+                ],
+                "behaviors": {
+                    "type": "core.merge",
+                    "engine": "arrow",
+                    "instructions": {
+                        "left": 0,
+                        "right": 1,
+                        "on": "value",
+                        "how": "left",
+                    },
+                },
+                "mode": "stream",
+            }
+        )
+        (df,) = list(reader.read())
+        topics = df.set_index("value")["topics"]
+        self.assertEqual(topics[3], ["ml", "t1"])
+        self.assertTrue(pd.isna(topics[9]))
+
+
+if __name__ == "__main__":
+    unittest.main()
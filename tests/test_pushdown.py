@@ -0,0 +1,228 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.task.base import Task
+from src.core.transformer.base import required_columns
+from src.core.util.factory import Factory
+from src.core.util.predicates import Aggregate, Predicate, parse_predicates
+from src.sql.catalog import DuckDBCatalog
+from src.sql.datamanager import SQLReader
+from tests.test_task import ListWriter, swissknife
+
+
+def pipeline(*transformers: dict) -> dict:
+    return {
+        "type": "core.transformers.pipeline",
+        "mode": 2,
+        "transformers": list(transformers),
+    }
+
+
+PIPELINE = pipeline(
+    swissknife("query", expr="value > 3"),
+    swissknife("eval", expr="double = value * 2"),
+    {"type": "core.transformers.projection", "columns": ["key", "double"]},
+)
+
+
+class ProjectionPushdownTest(unittest.TestCase):
+    """Test della projection pushdown dal transformer ai reader"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core", "filemanager"])
+        Factory().register("tests.listwriter", ListWriter)
+
+    def data(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "value": range(10),
+                "key": [f"k{i % 3}" for i in range(10)],
+                "payload": ["x" * 100] * 10,
+            }
+        )
+
+    def test_required_columns(self):
+        factory = Factory()
+        self.assertEqual(
+            required_columns(factory.create(PIPELINE)), {"key", "value"}
+        )
+        # apply puo' usare qualsiasi colonna
+        opaque = pipeline(
+            swissknife("apply", func="lambda r: r", axis=1),
+            {"type": "core.transformers.projection", "columns": ["key"]},
+        )
+        self.assertIsNone(required_columns(factory.create(opaque)))
+
+    def test_file_reader(self):
+        data = self.data()
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ("parquet", "csv"):
+                path = os.path.join(tmp, f"data.{fmt}")
+                if fmt == "parquet":
+                    data.to_parquet(path, index=False)
+                else:
+                    data.to_csv(path, index=False)
+                results = []
+                for pushdown in (True, False):
+                    task = Task(
+                        data_reader={
+                            "type": "filemanager.filereader",
+                            "input_path": path,
+                        },
+                        data_writer={"type": "tests.listwriter"},
+                        transformer=PIPELINE,
+                        projection_pushdown=pushdown,
+                    )
+                    task.run()
+                    results.append(task.data_writer.data[0])
+                    if pushdown:
+                        self.assertEqual(task.pushed_columns, {"key", "value"})
+                pd.testing.assert_frame_equal(results[0], results[1])
+
+                reader = Factory().create(
+                    {"type": "filemanager.filereader", "input_path": path}
+                )
+                self.assertTrue(reader.push_columns({"key", "value", "x"}))
+                df = next(reader.read())
+                self.assertEqual(list(df.columns), ["value", "key"])
+
+    def test_sql_reader(self):
+        DuckDBCatalog().register("pushdown_source", self.data())
+        reader = SQLReader(
+            query_or_path="select * from pushdown_source;", catalog=True
+        )
+        self.assertTrue(reader.push_columns({"key"}))
+        df = next(reader.read())
+        self.assertEqual(list(df.columns), ["key"])
+        self.assertEqual(len(df), 10)
+        DuckDBCatalog().unregister("pushdown_source")
+
+
+class PredicatePushdownTest(unittest.TestCase):
+    """Test della predicate pushdown dai filtri ai reader"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core", "filemanager"])
+        Factory().register("tests.listwriter", ListWriter)
+
+    def data(self) -> pd.DataFrame:
+        data = pd.DataFrame(
+            {
+                "value": range(30),
+                "insert_date_": [f"2023-01-0{i % 3 + 1}" for i in range(30)],
+            }
+        )
+        data["insert_date"] = data["insert_date_"]
+        return data
+
+    def test_parse_predicates(self):
+        self.assertEqual(
+            parse_predicates(
+                "3 < value <= 9 and key in ['a', 'b'] and other != 1"
+            ),
+            [
+                Predicate("value", ">", 3),
+                Predicate("value", "<=", 9),
+                Predicate("key", "in", ["a", "b"]),
+            ],
+        )
+        self.assertEqual(
+            parse_predicates("d == d.max() and (a > 1 or b > 1)"),
+            [Predicate("d", "==", Aggregate("max"))],
+        )
+        self.assertEqual(parse_predicates("a == b.max()"), [])
+
+    def test_partitioned_parquet(self):
+        data = self.data()
+        query = swissknife(
+            "query",
+            expr="insert_date == insert_date.max() and value > 3 "
+            "and insert_date_ in ['2023-01-02', '2023-01-03']",
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "repos.parquet")
+            data.to_parquet(path, partition_cols=["insert_date_"], index=False)
+            results = []
+            for pushdown in (True, False):
+                task = Task(
+                    data_reader={
+                        "type": "filemanager.filereader",
+                        "input_path": path,
+                    },
+                    data_writer={"type": "tests.listwriter"},
+                    transformer=pipeline(query),
+                    predicate_pushdown=pushdown,
+                )
+                task.run()
+                self.assertEqual(len(task.pushed_predicates), 3 * pushdown)
+                results.append(task.data_writer.data[0].reset_index(drop=True))
+                # il filtro originale viene comunque applicato
+                rows_in = task.profile["0:SwissKnife"]["rows_in"]
+                self.assertEqual(rows_in, 9 if pushdown else 30)
+            pd.testing.assert_frame_equal(results[0], results[1])
+
+    def test_aggregate_after_filter(self):
+        data = pd.DataFrame(
+            {
+                "stars": [500, 200, 300, 50, 10],
+                "insert_date": ["2023-01-01"] * 3 + ["2023-01-02"] * 2,
+            }
+        )
+        # pandas calcola la massima insert_date sulle righe con stars > 100
+        transformer = pipeline(
+            swissknife("query", expr="stars > 100"),
+            swissknife("query", expr="insert_date == insert_date.max()"),
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "repos.parquet")
+            data.to_parquet(path, index=False)
+            for pushdown in (True, False):
+                task = Task(
+                    data_reader={
+                        "type": "filemanager.filereader",
+                        "input_path": path,
+                    },
+                    data_writer={"type": "tests.listwriter"},
+                    transformer=transformer,
+                    predicate_pushdown=pushdown,
+                )
+                task.run()
+                self.assertEqual(len(task.data_writer.data[0]), 3)
+                if pushdown:
+                    self.assertEqual(
+                        task.pushed_predicates, [Predicate("stars", ">", 100)]
+                    )
+        # nel primo step l'aggregato viene spinto con la sola stessa query
+        first = Factory().create(
+            pipeline(
+                swissknife("query", expr="d == d.max() and a > 1"),
+                swissknife("query", expr="b > 1"),
+            )
+        )
+        self.assertEqual(
+            first.predicates(),
+            [Predicate("d", "==", Aggregate("max")), Predicate("a", ">", 1)],
+        )
+
+    def test_sql_reader(self):
+        DuckDBCatalog().register("pushdown_filter", self.data())
+        reader = SQLReader(
+            query_or_path="select * from pushdown_filter", catalog=True
+        )
+        predicates = parse_predicates(
+            "insert_date == insert_date.max() and value < 20"
+        )
+        self.assertEqual(reader.push_filters(predicates), predicates)
+        df = next(reader.read())
+        self.assertEqual(list(df["value"]), [2, 5, 8, 11, 14, 17])
+        DuckDBCatalog().unregister("pushdown_filter")
+
+
+if __name__ == "__main__":
+    unittest.main()
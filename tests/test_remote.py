@@ -0,0 +1,182 @@
+import multiprocessing
+import os
+import socket
+import tempfile
+import unittest
+import uuid
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.task.base import Task
+from src.core.task.dag import TaskDag
+from src.core.task.remote import (
+    AUTHKEY_ENV,
+    Coordinator,
+    NoWorkers,
+    run_worker,
+)
+from src.core.util.factory import Factory
+from tests.test_task import ListWriter, RangeReader, task_dict
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def die_once(marker: str) -> int:
+    """Termina il worker alla prima esecuzione"""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+
+def explode():
+    raise ValueError("corrupted result")
+
+
+class Unloadable:
+    """Risultato serializzabile dal worker ma non dal coordinatore"""
+
+    def __reduce__(self):
+        return explode, ()
+
+
+def unloadable() -> Unloadable:
+    return Unloadable()
+
+
+def touch(data: pd.DataFrame, path: str) -> pd.DataFrame:
+    open(path, "w").close()
+    return data
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RemoteTest(unittest.TestCase):
+    """Test del coordinatore con worker locali al posto degli host remoti"""
+
+    @classmethod
+    def setUpClass(cls):
+        # ereditata dai worker avviati dai test
+        os.environ.setdefault(AUTHKEY_ENV, uuid.uuid4().hex)
+        loader.load_plugins(["core"])
+        factory = Factory()
+        factory.register("tests.rangereader", RangeReader)
+        factory.register("tests.listwriter", ListWriter)
+        factory.register("tests.touch", touch)
+
+    def start_workers(self, address, n: int = 2):
+        workers = [
+            multiprocessing.Process(
+                target=run_worker, args=(address,), daemon=True
+            )
+            for _ in range(n)
+        ]
+        for w in workers:
+            w.start()
+        return workers
+
+    def join(self, workers):
+        # un worker avviato in ritardo puo' non essersi mai registrato
+        for w in workers:
+            w.join(timeout=1)
+            if w.is_alive():
+                w.terminate()
+                w.join()
+
+    def test_worker_loss_requeues_job(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with Coordinator() as coordinator:
+                workers = self.start_workers(coordinator.address)
+                self.assertTrue(coordinator.wait_for_workers(2, timeout=10))
+                lost = coordinator.submit(die_once, os.path.join(tmp, "m"))
+                squares = [coordinator.submit(square, i) for i in range(5)]
+                pid = lost.result(timeout=10)
+                self.assertEqual(
+                    [f.result() for f in squares], [0, 1, 4, 9, 16]
+                )
+            self.join(workers)
+            self.assertIn(pid, [w.pid for w in workers])
+            self.assertEqual(coordinator.stats["requeued"], 1)
+            self.assertEqual(coordinator.stats["lost_workers"], 1)
+
+    def test_authkey_required(self):
+        key = os.environ.pop(AUTHKEY_ENV)
+        try:
+            with self.assertRaises(ValueError):
+                Coordinator()
+        finally:
+            os.environ[AUTHKEY_ENV] = key
+
+    def test_no_workers(self):
+        with Coordinator(worker_timeout=0.3) as coordinator:
+            future = coordinator.submit(square, 2)
+            with self.assertRaises(NoWorkers):
+                future.result(timeout=10)
+
+    def test_unloadable_result(self):
+        with Coordinator() as coordinator:
+            workers = self.start_workers(coordinator.address, n=1)
+            with self.assertRaises(RuntimeError):
+                coordinator.submit(unloadable).result(timeout=10)
+            # il worker resta attivo e continua a ricevere lavori
+            self.assertEqual(coordinator.submit(square, 3).result(10), 9)
+        self.join(workers)
+        self.assertEqual(coordinator.stats["lost_workers"], 0)
+
+    def test_remote_task(self):
+        address = ("127.0.0.1", free_port())
+        workers = self.start_workers(address)
+        task = Task(
+            **task_dict(
+                mode="remote", max_pending=3, remote={"address": address}
+            )
+        )
+        task.run()
+        self.join(workers)
+        expected = Task(**task_dict())
+        expected.run()
+        pd.testing.assert_frame_equal(
+            pd.concat(task.data_writer.data, ignore_index=True),
+            pd.concat(expected.data_writer.data, ignore_index=True),
+        )
+        self.assertEqual(task.remote_stats["batches"], 7)
+        self.assertEqual(task.remote_stats["completed"], 7)
+
+    def test_remote_dag(self):
+        address = ("127.0.0.1", free_port())
+        workers = self.start_workers(address)
+        with tempfile.TemporaryDirectory() as tmp:
+            tasks = {
+                name: {
+                    "data_reader": {
+                        "type": "tests.rangereader",
+                        "num_batches": 1,
+                    },
+                    "data_writer": {"type": "tests.listwriter"},
+                    "transformer": {
+                        "type": "tests.touch",
+                        "path": os.path.join(tmp, name),
+                    },
+                }
+                for name in ("a", "b")
+            }
+            dag = TaskDag(
+                tasks=tasks,
+                edges=[["a", "b"]],
+                executor="remote",
+                remote={"address": address},
+            )
+            dag.run()
+            self.join(workers)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "a")))
+            self.assertTrue(os.path.exists(os.path.join(tmp, "b")))
+            for r in dag.timeline:
+                self.assertEqual(r.status, "done")
+                self.assertNotIn(str(os.getpid()), r.worker)
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.core.datamanager.sharedmemory import ArrowStore, SharedMemory
+
+
+def write(directory: str, key: str) -> None:
+    ArrowStore(directory)[key] = pd.DataFrame({"key": [key] * 3})
+
+
+class ArrowStoreTest(unittest.TestCase):
+    """Test dell'archivio Arrow condiviso tra processi"""
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ArrowStore(directory)
+            df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+            store["frame"] = df
+            store["frames"] = [df, df]
+            # colonna non rappresentabile in Arrow: salvata con pickle
+            store["objects"] = pd.DataFrame({"o": [object(), 1]})
+            pd.testing.assert_frame_equal(store["frame"], df)
+            self.assertEqual(len(store["frames"]), 2)
+            self.assertEqual(len(store["objects"]), 2)
+            # liste e dizionari tornano identici
+            nested = pd.DataFrame(
+                {"topics": [["python", "ml"], []], "owner": [{"a": 1}, {}]}
+            )
+            store["nested"] = nested
+            pd.testing.assert_frame_equal(store["nested"], nested)
+            self.assertIsInstance(store["nested"]["topics"][0], list)
+            store.remove("nested")
+            store["frame"] = df.head(1)
+            self.assertEqual(len(store["frame"]), 1)
+            store.remove("frame")
+            self.assertNotIn("frame", store)
+            self.assertSetEqual(set(store.keys()), {"frames", "objects"})
+
+    def test_concurrent_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            keys = [f"v{i}" for i in range(6)]
+            with multiprocessing.Pool(3) as p:
+                p.starmap(write, [(directory, k) for k in keys])
+            store = ArrowStore(directory)
+            self.assertSetEqual(set(store.keys()), set(keys))
+            for k in keys:
+                self.assertListEqual(list(store[k]["key"]), [k] * 3)
+
+    def test_spill_to_disk(self):
+        df = pd.DataFrame({"a": range(1000)})
+        # le colonne di liste devono tornare identiche dopo il reload
+        df["topics"] = [["python", f"t{i % 7}"] for i in range(1000)]
+        with tempfile.TemporaryDirectory() as spill_dir:
+            store = ArrowStore(
+                os.path.join(spill_dir, "shm"), spill_dir=spill_dir
+            )
+            shared_memory = SharedMemory()
+            shared_memory.spill_dir = spill_dir
+            # variabili lasciate dagli altri test
+            for key in shared_memory.keys():
+                shared_memory.remove(key)
+            try:
+                for memory in (shared_memory, store):
+                    memory["probe"] = df
+                    # spazio per due variabili e mezza
+                    memory.budget = int(2.5 * memory.nbytes("probe"))
+                    memory.remove("probe")
+                    memory.spill_stats.update(spills=0, reloads=0)
+                    for key in ("s1", "s2", "s3"):
+                        memory[key] = df
+                    # s1 e' la meno recente e viene salvata su disco
+                    memory["s2"]
+                    memory["s4"] = df
+                    self.assertEqual(memory.nbytes("s1"), 0)
+                    self.assertEqual(memory.nbytes("s3"), 0)
+                    self.assertGreater(memory.nbytes("s2"), 0)
+                    self.assertEqual(memory.spill_stats["spills"], 2)
+                    pd.testing.assert_frame_equal(memory["s1"], df)
+                    self.assertEqual(memory.spill_stats["reloads"], 1)
+                    if memory is shared_memory:
+                        # il backend local riporta s1 in memoria
+                        # e salva su disco s2, la meno recente
+                        self.assertGreater(memory.nbytes("s1"), 0)
+                        self.assertEqual(memory.nbytes("s2"), 0)
+                        memory["s1"]
+                        self.assertEqual(memory.spill_stats["reloads"], 1)
+                    topics = memory["s3"]["topics"][0]
+                    self.assertEqual(topics, ["python", "t0"])
+                    self.assertIsInstance(topics, list)
+                    for key in ("s1", "s2", "s3", "s4"):
+                        memory.remove(key)
+            finally:
+                shared_memory.budget = None
+            self.assertListEqual(os.listdir(spill_dir), ["shm"])
@@ -0,0 +1,259 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import src.core.util.loader as loader
+from src.core.datamanager.base import DataReader, DataWriter
+from src.core.task.base import Task
+from src.core.task.transport import ArrowTransport
+from src.core.util.factory import Factory
+
+
+class RangeReader(DataReader):
+    """Reader che produce num_batches dataframe di batch_size righe"""
+
+    def __init__(self, *, num_batches: int, batch_size: int = 10):
+        super(RangeReader, self).__init__()
+        self.num_batches = num_batches
+        self.batch_size = batch_size
+
+    def read(self):
+        for b in range(self.num_batches):
+            start = b * self.batch_size
+            yield pd.DataFrame(
+                {
+                    "batch": b,
+                    "value": range(start, start + self.batch_size),
+                    "key": [f"k{i % 3}" for i in range(self.batch_size)],
+                }
+            )
+
+
+class ListWriter(DataWriter):
+    """Writer che memorizza i dataframe ricevuti in una lista"""
+
+    def __init__(self):
+        super(ListWriter, self).__init__()
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+
+def swissknife(attr: str, **kwargs) -> dict:
+    return {
+        "type": "core.transformers.swissknife",
+        "dataframe_attr": attr,
+        **kwargs,
+    }
+
+
+def task_dict(**kwargs) -> dict:
+    conf = dict(
+        data_reader={"type": "tests.rangereader", "num_batches": 7},
+        data_writer={"type": "tests.listwriter"},
+        transformer={
+            "type": "core.transformers.pipeline",
+            "mode": 2,
+            "transformers": [
+                {
+                    "type": "core.transformers.swissknife",
+                    "dataframe_attr": "eval",
+                    "expr": "double = value * 2",
+                }
+            ],
+        },
+    )
+    conf.update(kwargs)
+    return conf
+
+
+class TaskTest(unittest.TestCase):
+    """Test delle modalita di esecuzione di Task"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+        factory = Factory()
+        factory.register("tests.rangereader", RangeReader)
+        factory.register("tests.listwriter", ListWriter)
+
+    def expected(self) -> pd.DataFrame:
+        task = Task(**task_dict())
+        task.run()
+        return pd.concat(task.data_writer.data, ignore_index=True)
+
+    def check(self, task: Task, ordered: bool = True) -> None:
+        task.run()
+        result = pd.concat(task.data_writer.data, ignore_index=True)
+        expected = self.expected()
+        if not ordered:
+            result = result.sort_values("value", ignore_index=True)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_multiprocessing_ordered(self):
+        self.check(Task(**task_dict(num_of_processes=3, max_pending=2)))
+
+    def test_multiprocessing_unordered(self):
+        task = Task(**task_dict(num_of_processes=3, ordered=False))
+        self.check(task, ordered=False)
+
+    def test_profile_across_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.json")
+            task = Task(**task_dict(num_of_processes=2, profile_path=path))
+            self.check(task)
+            with open(path) as f:
+                (step,) = json.load(f)
+        # le metriche dei worker vengono sommate nel processo principale
+        self.assertEqual(step["name"], "0:SwissKnife")
+        self.assertEqual(step["calls"], 7)
+        self.assertEqual(step["rows_in"], 70)
+        self.assertEqual(step["columns_out"], step["columns_in"] + 1)
+        self.assertGreater(step["memory_delta"], 0)
+
+    def test_pipeline(self):
+        task = Task(**task_dict(mode="pipeline", queue_size=1))
+        self.check(task)
+        self.assertEqual(task.stage_stats["write"].items, 7)
+
+    def test_multiprocessing_unpicklable_transformer(self):
+        transformer = {
+            "type": "core.transformers.pipeline",
+            "transformers": [
+                {
+                    "type": "core.transformers.swissknife",
+                    "dataframe_attr": "assign",
+                    "double": "lambda df: df.value * 2",
+                }
+            ],
+        }
+        task = Task(**task_dict(num_of_processes=2, transformer=transformer))
+        self.check(task)
+        self.assertIsNone(task.serialization_stats["pickle_bytes"])
+        self.assertEqual(task.serialization_stats["batches"], 7)
+
+    def test_multiprocessing_arrow_transport(self):
+        task = Task(**task_dict(num_of_processes=2, transport="arrow"))
+        self.check(task)
+
+    def test_arrow_transport_nested_columns(self):
+        transport = ArrowTransport()
+        data = pd.DataFrame(
+            {
+                "stars": [10, 20],
+                "topics": [["python", "ml"], []],
+                "owner": [{"a": 1}, {"b": 2}],
+            }
+        )
+        flat = data[["stars"]]
+        try:
+            nested, scalar = transport.unpack(transport.pack([data, flat]))
+        finally:
+            transport.close()
+        # le liste e i dizionari non passano da Arrow
+        self.assertEqual(transport.stats["pickle"], 1)
+        self.assertEqual(transport.stats["arrow"], 1)
+        self.assertEqual(nested["topics"].tolist(), [["python", "ml"], []])
+        self.assertEqual(nested["owner"].tolist(), [{"a": 1}, {"b": 2}])
+        pd.testing.assert_frame_equal(scalar, flat)
+
+    def test_partitioned_rows(self):
+        reader = {"type": "tests.rangereader", "num_batches": 2}
+        task = Task(
+            **task_dict(
+                data_reader=reader,
+                mode="partitioned",
+                num_of_processes=2,
+                partitions=3,
+            )
+        )
+        head, tail = task.split_transformer()
+        self.assertIsNotNone(head)
+        self.assertIsNone(tail)
+        task.run()
+        result = pd.concat(task.data_writer.data)
+        self.assertEqual(len(task.data_writer.data), 2)
+        self.assertListEqual(list(result["double"]), list(result["value"] * 2))
+
+    def test_partitioned_groupby(self):
+        transformer = {
+            "type": "core.transformers.pipeline",
+            "transformers": [
+                {
+                    "type": "core.transformers.swissknife",
+                    "dataframe_attr": "eval",
+                    "expr": "double = value * 2",
+                },
+                {
+                    "type": "core.transformers.groupby",
+                    "group_columns": ["key"],
+                    "agg_function": "sum",
+                    "main_columns": ["double"],
+                },
+            ],
+        }
+        expected = Task(**task_dict(transformer=transformer))
+        expected.run()
+        for key, combined_steps in ((None, 1), ("key", 0)):
+            task = Task(
+                **task_dict(
+                    transformer=transformer,
+                    mode="partitioned",
+                    num_of_processes=2,
+                    partition_key=key,
+                )
+            )
+            head, tail = task.split_transformer()
+            self.assertEqual(
+                0 if tail is None else len(tail.transformers), combined_steps
+            )
+            task.run()
+            for result, exp in zip(
+                task.data_writer.data, expected.data_writer.data
+            ):
+                pd.testing.assert_frame_equal(
+                    result.sort_values("key", ignore_index=True), exp
+                )
+
+
+class ParallelPipelineTest(unittest.TestCase):
+    """Test della modalita PARALLEL della pipeline"""
+
+    @classmethod
+    def setUpClass(cls):
+        loader.load_plugins(["core"])
+
+    def test_branches_in_declaration_order(self):
+        data = pd.DataFrame({"value": range(1000)})
+        for executor in ("thread", "process"):
+            pipeline = Factory().create(
+                {
+                    "type": "core.transformers.pipeline",
+                    "mode": 1,
+                    "workers": 3,
+                    "executor": executor,
+                    "transformers": [
+                        {
+                            "type": "core.transformers.swissknife",
+                            "dataframe_attr": "eval",
+                            "expr": f"out = value * {i}",
+                        }
+                        for i in range(3)
+                    ],
+                    "behaviors": {
+                        "type": "core.concat",
+                        "instructions": {"ignore_index": True},
+                    },
+                }
+            )
+            (df,) = pipeline.transform(data)
+            expected = [v * i for i in range(3) for v in range(1000)]
+            self.assertListEqual(list(df["out"]), expected)
+            self.assertEqual(len(pipeline.branch_stats), 3)
+            self.assertTrue(
+                all(s["duration"] > 0 for s in pipeline.branch_stats)
+            )